@@ -0,0 +1,269 @@
+import collections
+import difflib
+import hashlib
+import RouteInfoDocument
+
+# Member states in a diff
+MEMBER_ADDED = 'added'
+MEMBER_REMOVED = 'removed'
+MEMBER_CHANGED = 'changed'
+
+# Row changes, oldRow and newRow are positions in both members, e.g. where a removed row would be in the new one
+ROW_INSERTED = 'insert'
+ROW_REMOVED = 'remove'
+ROW_CHANGED = 'change'
+
+# Merge updates applied to the document the other archives are merged into
+UPDATE_DATA = 'data'
+UPDATE_RECORDS = 'records'
+UPDATE_ADD = 'add'
+UPDATE_REMOVE = 'remove'
+
+# rows is empty for unknown members and for members that only differ in formatting
+MemberDiff = collections.namedtuple('MemberDiff', ['name', 'status', 'rows'])
+
+# old and new are whole records, or node names for boss paths, columns are the indices of the changed cells
+RowDiff = collections.namedtuple('RowDiff', ['type', 'oldRow', 'newRow', 'old', 'new', 'columns'])
+
+# value is new data, records or (data, hasFilename) depending on the action
+Update = collections.namedtuple('Update', ['name', 'action', 'value'])
+
+# row is the row in the merged member and column None when whole rows or members conflict
+Conflict = collections.namedtuple('Conflict', ['name', 'row', 'column', 'ours', 'theirs'])
+
+Merge = collections.namedtuple('Merge', ['updates', 'conflicts'])
+
+
+def memberDigest(document, name):
+    return hashlib.sha1(document.data(name)).digest()
+
+
+def memberDigests(document):
+    # Members with equal digests are equal, so only the others are parsed and compared
+    return {name: memberDigest(document, name) for name in document.names()}
+
+
+def changedColumns(old, new):
+    if isinstance(old, tuple):
+        return tuple(column for column, (oldValue, newValue) in enumerate(zip(old, new)) if oldValue != newValue)
+
+    return (0,)
+
+
+def opcodes(old, new):
+    # Most diffs touch a few rows, the matcher only sees what lies between the common start and end
+    start = 0
+    end = min(len(old), len(new))
+    while start < end and old[start] == new[start]:
+        start += 1
+
+    oldEnd = len(old)
+    newEnd = len(new)
+    while oldEnd > start and newEnd > start and old[oldEnd - 1] == new[newEnd - 1]:
+        oldEnd -= 1
+        newEnd -= 1
+
+    if start == oldEnd and start == newEnd:
+        return []
+
+    matcher = difflib.SequenceMatcher(None, old[start:oldEnd], new[start:newEnd], autojunk=False)
+    return [(tag, i1 + start, i2 + start, j1 + start, j2 + start)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def diffRecords(old, new):
+    rows = []
+
+    for tag, i1, i2, j1, j2 in opcodes(old, new):
+        # Replaced blocks are compared row by row, rows left over on either side were inserted or removed
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+
+        for offset in range(paired):
+            oldRecord = old[i1 + offset]
+            newRecord = new[j1 + offset]
+            rows.append(RowDiff(ROW_CHANGED, i1 + offset, j1 + offset, oldRecord, newRecord, changedColumns(oldRecord, newRecord)))
+
+        for row in range(i1 + paired, i2):
+            rows.append(RowDiff(ROW_REMOVED, row, j1 + paired, old[row], None, ()))
+
+        for row in range(j1 + paired, j2):
+            rows.append(RowDiff(ROW_INSERTED, i1 + paired, row, None, new[row], ()))
+
+    return rows
+
+
+def diffDocuments(old, new, oldDigests=None, newDigests=None):
+    oldDigests = memberDigests(old) if oldDigests is None else oldDigests
+    newDigests = memberDigests(new) if newDigests is None else newDigests
+    diffs = []
+
+    for name in sorted(set(oldDigests) | set(newDigests)):
+        if name not in newDigests:
+            diffs.append(MemberDiff(name, MEMBER_REMOVED, []))
+
+        elif name not in oldDigests:
+            diffs.append(MemberDiff(name, MEMBER_ADDED, []))
+
+        elif oldDigests[name] != newDigests[name]:
+            rows = []
+            if old.kind(name) is not None:
+                rows = diffRecords(old.peekRecords(name), new.peekRecords(name))
+
+            diffs.append(MemberDiff(name, MEMBER_CHANGED, rows))
+
+    return diffs
+
+
+def mergeValues(base, ours, theirs):
+    # Returns the merged value and whether both sides changed it differently, ours is kept then
+    if ours == theirs or theirs == base:
+        return ours, False
+    elif ours == base:
+        return theirs, False
+
+    return ours, True
+
+
+def mergeRows(name, row, base, ours, theirs, conflicts):
+    merged = []
+
+    for offset, (baseRecord, ourRecord, theirRecord) in enumerate(zip(base, ours, theirs)):
+        if not isinstance(baseRecord, tuple):
+            value, conflicting = mergeValues(baseRecord, ourRecord, theirRecord)
+            if conflicting:
+                conflicts.append(Conflict(name, row + offset, 0, ourRecord, theirRecord))
+
+            merged.append(value)
+            continue
+
+        # Cells edited on only one side are taken from it, so edits of different columns of a row both survive
+        values = []
+        for column, cells in enumerate(zip(baseRecord, ourRecord, theirRecord)):
+            value, conflicting = mergeValues(*cells)
+            if conflicting:
+                conflicts.append(Conflict(name, row + offset, column, cells[1], cells[2]))
+
+            values.append(value)
+
+        merged.append(baseRecord._make(values))
+
+    return merged
+
+
+def hunkOverlaps(start, end, i1, i2):
+    # Hunks are base ranges, insertions are empty ranges that only clash with a change around them
+    if start == end and i1 == i2:
+        return start == i1
+    elif start == end:
+        return i1 < start < i2
+    elif i1 == i2:
+        return start < i1 < end
+
+    return i1 < end and start < i2
+
+
+def applyHunks(base, start, end, hunks, records):
+    result = []
+    position = start
+
+    for i1, i2, j1, j2 in hunks:
+        result.extend(base[position:i1])
+        result.extend(records[j1:j2])
+        position = i2
+
+    result.extend(base[position:end])
+    return result
+
+
+def mergeRecords(name, base, ours, theirs):
+    # Three-way merge of the rows of one member, returns the merged records and the conflicts, which keep our rows
+    hunks = sorted([(i1, i2, j1, j2, 0) for tag, i1, i2, j1, j2 in opcodes(base, ours)] +
+                   [(i1, i2, j1, j2, 1) for tag, i1, i2, j1, j2 in opcodes(base, theirs)],
+                   key=lambda hunk: (hunk[0], hunk[1]))
+
+    merged = []
+    conflicts = []
+    position = 0
+    index = 0
+
+    while index < len(hunks):
+        # Collect every hunk of either side touching the base range of the first one
+        start, end = hunks[index][0], hunks[index][1]
+        cluster = [hunks[index]]
+        index += 1
+
+        while index < len(hunks) and hunkOverlaps(start, end, hunks[index][0], hunks[index][1]):
+            cluster.append(hunks[index])
+            end = max(end, hunks[index][1])
+            index += 1
+
+        merged.extend(base[position:start])
+        position = end
+
+        ourHunks = [hunk[:4] for hunk in cluster if hunk[4] == 0]
+        theirHunks = [hunk[:4] for hunk in cluster if hunk[4] == 1]
+        ourRows = applyHunks(base, start, end, ourHunks, ours)
+        theirRows = applyHunks(base, start, end, theirHunks, theirs)
+
+        if not theirHunks or ourRows == theirRows:
+            merged.extend(ourRows)
+        elif not ourHunks:
+            merged.extend(theirRows)
+        elif len(ourRows) == len(theirRows) == end - start:
+            merged.extend(mergeRows(name, len(merged), base[start:end], ourRows, theirRows, conflicts))
+        else:
+            # Rows were inserted or removed differently on both sides, there is no row to row match
+            conflicts.append(Conflict(name, len(merged), None, ourRows, theirRows))
+            merged.extend(ourRows)
+
+    merged.extend(base[position:])
+    return merged, conflicts
+
+
+def mergeDocuments(base, ours, theirs):
+    # Changes between base and theirs that ours doesn't have yet, as updates for ours
+    baseDigests = memberDigests(base)
+    ourDigests = memberDigests(ours)
+    theirDigests = memberDigests(theirs)
+
+    updates = []
+    conflicts = []
+
+    for name in sorted(set(baseDigests) | set(ourDigests) | set(theirDigests)):
+        baseDigest = baseDigests.get(name)
+        ourDigest = ourDigests.get(name)
+        theirDigest = theirDigests.get(name)
+
+        if ourDigest == theirDigest or theirDigest == baseDigest:
+            continue
+
+        if ourDigest == baseDigest:
+            if theirDigest is None:
+                updates.append(Update(name, UPDATE_REMOVE, None))
+            elif ourDigest is None:
+                updates.append(Update(name, UPDATE_ADD, (bytes(theirs.data(name)), theirs.members[name].hasFilename)))
+            else:
+                updates.append(Update(name, UPDATE_DATA, bytes(theirs.data(name))))
+
+        elif baseDigest is None or ourDigest is None or theirDigest is None or RouteInfoDocument.memberKind(name) is None:
+            # Added on both sides, or removed on one and changed on the other
+            conflicts.append(Conflict(name, None, None, ourDigest is not None, theirDigest is not None))
+
+        else:
+            records, memberConflicts = mergeRecords(name, base.peekRecords(name), ours.peekRecords(name), theirs.peekRecords(name))
+            updates.append(Update(name, UPDATE_RECORDS, records))
+            conflicts.extend(memberConflicts)
+
+    return Merge(updates, conflicts)
+
+
+def applyMerge(document, merge):
+    for update in merge.updates:
+        if update.action == UPDATE_DATA:
+            document.setData(update.name, update.value)
+        elif update.action == UPDATE_RECORDS:
+            document.setRecords(update.name, update.value)
+        elif update.action == UPDATE_ADD:
+            document.addMember(update.name, *update.value)
+        else:
+            document.removeMember(update.name)
@@ -0,0 +1,232 @@
+import hashlib
+import mmap
+import os
+import Profiling
+import struct
+import tempfile
+import SarcLib
+
+filenameHash = SarcLib.SARC_Archive.filenameHash
+getDataAlignment = SarcLib.SARC_Archive.getDataAlignment
+
+
+def roundUp(x, y):
+    return ((x - 1) | (y - 1)) + 1
+
+
+class MappedArchive:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+        # The mapping keeps its own handle, so the file object can be closed straight away
+        with Profiling.phase('file read'):
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self.map)
+
+        try:
+            with Profiling.phase('sarc parse'):
+                self.endianness, self.hashKey, self.contents = readArchive(self.view)
+        except BaseException:
+            self.view.release()
+            self.map.close()
+            raise
+
+    def close(self):
+        self.contents = []
+        self.view.release()
+
+        # Views that are still referenced elsewhere keep the mapping alive until they are collected
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+
+def readArchive(data):
+    # Members are returned as memoryview slices of data, nothing is copied or decoded
+    if data[:0x04] != b'SARC':
+        raise ValueError('This is not a valid SARC file! Bad magic')
+
+    endians = {b'\xFE\xFF': '>', b'\xFF\xFE': '<'}
+    endianness = endians.get(bytes(data[0x06:0x08]))
+    if endianness is None:
+        raise ValueError('This is not a valid SARC file! Bad byte order mark')
+
+    headLen, _, fileLen, dataStartOffset = struct.unpack_from(endianness + 'HHII', data, 0x04)
+    if headLen != 0x14 or fileLen != len(data):
+        raise ValueError('This is not a valid SARC file! Bad header')
+
+    if data[0x14:0x18] != b'SFAT':
+        raise ValueError('This is not a valid SARC file! Missing SFAT')
+
+    headLen, nodeCount, hashKey = struct.unpack_from(endianness + 'HHI', data, 0x18)
+    if headLen != 0x0C:
+        raise ValueError('This is not a valid SARC file! Bad SFAT header')
+
+    nameTableOffset = 0x20 + 0x10 * nodeCount
+    if data[nameTableOffset:nameTableOffset + 0x04] != b'SFNT':
+        raise ValueError('This is not a valid SARC file! Missing SFNT')
+
+    # Only the small file name table is copied
+    nameTableOffset += 0x08
+    nameTable = bytes(data[nameTableOffset:dataStartOffset])
+
+    contents = []
+    for node in range(nodeCount):
+        nameHash, nameId, dataStart, dataEnd = struct.unpack_from(endianness + 'IIII', data, 0x20 + 0x10 * node)
+
+        fileData = data[dataStartOffset + dataStart:dataStartOffset + dataEnd]
+        hasFilename = nameId >> 24
+
+        if hasFilename:
+            nameOffset = (nameId & 0xFFFFFF) * 4
+            nameEnd = nameTable.find(b'\0', nameOffset)
+            if nameEnd == -1:
+                nameEnd = len(nameTable)
+            name = nameTable[nameOffset:nameEnd].decode('utf-8')
+        else:
+            name = ''.join(['hash_' + hex(nameHash), SarcLib.guessFileExt(fileData)])
+
+        contents.append(SarcLib.File(name, fileData, bool(hasFilename)))
+
+    return endianness, hashKey, contents
+
+
+class HashWriter:
+    def __init__(self):
+        self.hash = hashlib.sha1()
+
+    def write(self, data):
+        self.hash.update(data)
+
+    def digest(self):
+        return self.hash.digest()
+
+
+def writeArchive(f, files, endianness='<', hashKey=0x65, progress=None):
+    # Lay the archive out the same way SarcLib.SARC_Archive.save does
+    def sortKey(file):
+        if file.hasFilename:
+            return struct.unpack(endianness + 'I', filenameHash(file.name, endianness, hashKey))[0]
+
+        return int(file.name[5:].split('.')[0].split()[0], 16)
+
+    files = sorted(files, key=sortKey)
+
+    # File name table
+    nameOffsets = []
+    fileNamesTable = bytearray()
+    for file in files:
+        if not file.hasFilename:
+            nameOffsets.append(0)
+            continue
+
+        nameOffsets.append(len(fileNamesTable))
+        fileNamesTable += file.name.encode('utf-8')
+        fileNamesTable += b'\x00' * (0x04 - (len(fileNamesTable) % 0x04))
+
+    dataStartOffset = roundUp(0x20 + 0x10 * len(files) + 0x08 + len(fileNamesTable), 0x04)
+
+    # Data offsets, only the layout is computed here
+    dataOffsets = []
+    dataLength = 0
+    maxAlignment = 1
+    for file in files:
+        alignment = getDataAlignment(file.data)
+        maxAlignment = max(maxAlignment, alignment)
+
+        dataLength = roundUp(dataLength, alignment)
+        dataOffsets.append(dataLength)
+        dataLength += len(file.data)
+
+    dataStartOffset = roundUp(dataStartOffset, maxAlignment)
+
+    # SARC Header
+    header = bytearray(b'SARC')
+    header += struct.pack(endianness + 'H', 0x14)
+    header += b'\xFE\xFF' if endianness == '>' else b'\xFF\xFE'
+    header += struct.pack(endianness + 'I', dataStartOffset + dataLength)
+    header += struct.pack(endianness + 'I', dataStartOffset)
+    header += b'\1\0\0\0' if endianness == '>' else b'\0\1\0\0'
+
+    # SFAT Header and Nodes
+    header += b'SFAT'
+    header += struct.pack(endianness + 'HHI', 0x0C, len(files), hashKey)
+
+    for file, nameOffset, dataOffset in zip(files, nameOffsets, dataOffsets):
+        if not file.hasFilename:
+            header += struct.pack(endianness + 'I', sortKey(file))
+            header += b'\0\0\0\0'
+        else:
+            header += filenameHash(file.name, endianness, hashKey)
+            header += struct.pack(endianness + 'I', (nameOffset // 4) | 0x1000000)
+
+        header += struct.pack(endianness + 'II', dataOffset, dataOffset + len(file.data))
+
+    # SFNT Header and File Names
+    header += b'SFNT'
+    header += struct.pack(endianness + 'H', 0x08)
+    header += b'\x00\x00'
+    header += fileNamesTable
+    header += b'\0' * (dataStartOffset - len(header))
+
+    f.write(header)
+
+    # Stream the member data one file at a time
+    position = 0
+    for done, (file, dataOffset) in enumerate(zip(files, dataOffsets)):
+        if progress is not None:
+            progress(done, len(files))
+
+        if dataOffset > position:
+            f.write(b'\0' * (dataOffset - position))
+
+        f.write(file.data)
+        position = dataOffset + len(file.data)
+
+
+def archiveHash(files, endianness='<', hashKey=0x65, progress=None):
+    writer = HashWriter()
+    writeArchive(writer, files, endianness, hashKey, progress)
+    return writer.digest()
+
+
+def saveArchive(path, files, endianness='<', hashKey=0x65, progress=None):
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+
+    # Write next to the target so the final rename never crosses file systems
+    fd, tempPath = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writeArchive(f, files, endianness, hashKey, progress)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # mkstemp creates the file as private, keep the permissions of the file being replaced
+        if os.path.exists(path):
+            os.chmod(tempPath, os.stat(path).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tempPath, 0o666 & ~umask)
+
+        os.replace(tempPath, path)
+
+    except BaseException:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable where the platform allows syncing directories
+    if hasattr(os, 'O_DIRECTORY'):
+        dirFd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dirFd)
+        finally:
+            os.close(dirFd)
@@ -0,0 +1,47 @@
+import traceback
+from PyQt5 import QtCore
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+
+class BackgroundTask(QtCore.QRunnable):
+    def __init__(self, function, *args):
+        QtCore.QRunnable.__init__(self)
+
+        # Signals are created on the GUI thread, so results are delivered back to it
+        self.signals = TaskSignals()
+        self.function = function
+        self.args = args
+        self.cancelRequested = False
+
+    def cancel(self):
+        self.cancelRequested = True
+
+    def reportProgress(self, done, total):
+        # Called by the work function between steps, this is also where cancellation happens
+        if self.cancelRequested:
+            raise TaskCancelled()
+
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.function(*self.args, progress=self.reportProgress)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception:
+            self.signals.failed.emit(traceback.format_exc())
+        else:
+            self.signals.finished.emit(result)
+
+    def start(self):
+        QtCore.QThreadPool.globalInstance().start(self)
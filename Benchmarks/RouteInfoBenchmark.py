@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import SyntheticArchive
+from PyQt5 import QtCore, QtWidgets
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+PROFILES = {
+    'small': dict(worlds=8, nodes=40, paths=60, bossPathLength=20),
+    'large': dict(worlds=30, nodes=1500, paths=2000, bossPathLength=300),
+}
+
+PHASES = ('open', 'switch', 'edit', 'save', 'search')
+
+
+def measure(function, traceMemory):
+    # tracemalloc slows Python code down a lot, so memory is measured in separate runs
+    if traceMemory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+
+    peak = 0
+    if traceMemory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return seconds, peak
+
+
+def waitForTask(app):
+    # Opening and saving run on the thread pool, the result is delivered through the event loop
+    QtCore.QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+
+def switchAll(app, window):
+    editors = (window.editor.pointEditor, window.editor.routeEditor, window.editor.bossPathEditor)
+
+    for tab, editor in enumerate(editors):
+        window.editor.setCurrentIndex(tab)
+        for i in range(editor.fileSelector.count()):
+            editor.fileSelector.setCurrentIndex(i)
+            app.processEvents()
+
+        editor.fileSelector.setCurrentIndex(0)
+        app.processEvents()
+
+
+def searchAll(app, window):
+    # The first search of an archive builds the index, the others only look tokens up
+    panel = window.searchPanel
+
+    for text, wholeValues in (('W1-1', True), ('1', True), ('W2', False)):
+        panel.queryEdit.setText(text)
+        panel.wholeValues.setChecked(wholeValues)
+        panel.search()
+
+    app.processEvents()
+
+
+def editAll(app, window, counter):
+    pointModel = window.editor.pointEditor.pointEntries.model()
+    pointModel.setData(pointModel.index(0, 1), 'Edit%d' % counter)
+
+    routeModel = window.editor.routeEditor.routeEntries.model()
+    routeModel.setData(routeModel.index(0, 1), counter % 2)
+
+    worldIn = window.editor.bossPathEditor.worldInList.nodeModel
+    if worldIn.rowCount():
+        worldIn.setData(worldIn.index(0, 0), str(counter))
+
+    app.processEvents()
+
+
+def runProfile(app, name, size, repeat):
+    import RouteEdit
+
+    tempDir = tempfile.mkdtemp(prefix='routeedit-bench-')
+    try:
+        archivePath = SyntheticArchive.makeArchive(os.path.join(tempDir, 'RouteInfo.sarc'), **size)
+
+        # The first open fills a parse cache of its own, the later ones are reopens that use it
+        os.environ['ROUTEEDIT_CACHE_DIR'] = os.path.join(tempDir, 'cache')
+
+        # Edits are journaled like in a session, journals of real archives are left alone
+        os.environ['ROUTEEDIT_JOURNAL_DIR'] = os.path.join(tempDir, 'journal')
+        samples = {phase: [] for phase in PHASES}
+
+        window = RouteEdit.MainWindow()
+        window.show()
+
+        # The last run only records peak memory
+        for counter in range(repeat + 1):
+            traceMemory = counter == repeat
+            samples['open'].append(measure(lambda: (window.openArchive(archivePath), waitForTask(app)), traceMemory))
+            samples['switch'].append(measure(lambda: switchAll(app, window), traceMemory))
+            samples['edit'].append(measure(lambda: editAll(app, window, counter), traceMemory))
+            samples['save'].append(measure(lambda: (window.saveSarc(), waitForTask(app)), traceMemory))
+            samples['search'].append(measure(lambda: searchAll(app, window), traceMemory))
+
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    results = {}
+    for phase in PHASES:
+        results[phase] = {
+            'seconds': statistics.median(seconds for seconds, peak in samples[phase][:-1]),
+            'peakKiB': samples[phase][-1][1] // 1024,
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time opening, switching, editing, saving and searching synthetic RouteInfo archives')
+    parser.add_argument('--profile', choices=sorted(PROFILES) + ['all'], default='all')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+    profiles = sorted(PROFILES) if args.profile == 'all' else [args.profile]
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'rt') as f:
+            baseline = json.load(f)
+
+    regressions = 0
+    allResults = {}
+
+    print('%-8s %-8s %12s %12s %12s' % ('profile', 'phase', 'time (ms)', 'baseline', 'peak (KiB)'))
+    for name in profiles:
+        results = runProfile(app, name, PROFILES[name], args.repeat)
+        allResults[name] = results
+
+        for phase in PHASES:
+            seconds = results[phase]['seconds']
+            reference = baseline.get(name, {}).get(phase)
+            note = ''
+
+            if reference is not None and seconds > reference['seconds'] * (1 + args.tolerance):
+                note = '  REGRESSION'
+                regressions += 1
+
+            print('%-8s %-8s %12.2f %12s %12d%s' % (
+                name, phase, seconds * 1000,
+                '%.2f' % (reference['seconds'] * 1000) if reference else '-',
+                results[phase]['peakKiB'], note))
+
+    if args.save_baseline:
+        baseline.update(allResults)
+        with open(BASELINE_PATH, 'wt') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+
+    return 1 if regressions and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
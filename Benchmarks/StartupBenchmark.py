@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold start, from launching the interpreter to the first painted window, must stay below this
+DEFAULT_BUDGET = 1.0
+
+
+def child():
+    # Runs in a fresh interpreter so nothing is imported or cached yet
+    start = time.perf_counter()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication(sys.argv)
+    import RouteEdit
+    imported = time.perf_counter()
+
+    window = RouteEdit.MainWindow()
+    constructed = time.perf_counter()
+
+    window.show()
+    app.processEvents()
+    shown = time.perf_counter()
+
+    json.dump({
+        'import': imported - start,
+        'window': constructed - imported,
+        'show': shown - constructed,
+    }, sys.stdout)
+
+    window.close()
+    return 0
+
+
+def runChild():
+    # An empty journal folder, so no recovery question holds up the start
+    with tempfile.TemporaryDirectory() as journalDir:
+        env = dict(os.environ, ROUTEEDIT_JOURNAL_DIR=journalDir)
+
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, check=True).stdout
+        seconds = time.perf_counter() - start
+
+    phases = json.loads(output.decode('utf-8'))
+    phases['total'] = seconds
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time cold starts of the editor, from launch to the first shown window')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='allowed cold start time in seconds')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child()
+
+    # The first run warms the disk cache, like any start after the editor was installed
+    runChild()
+    samples = [runChild() for i in range(args.repeat)]
+
+    print('%-8s %12s' % ('phase', 'time (ms)'))
+    for phase in ('import', 'window', 'show', 'total'):
+        print('%-8s %12.2f' % (phase, statistics.median(sample[phase] for sample in samples) * 1000))
+
+    total = statistics.median(sample['total'] for sample in samples)
+    if total > args.budget:
+        print('cold start takes %.0f ms, the budget is %.0f ms' % (total * 1000, args.budget * 1000))
+        return 1
+
+    print('cold start is within the %.0f ms budget' % (args.budget * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
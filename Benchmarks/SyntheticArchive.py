@@ -0,0 +1,77 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ArchiveIO
+import SarcLib
+import Translations
+
+
+def unlockList(rng, nodes, count):
+    return '"%s"' % ','.join(str(rng.randrange(nodes)) for i in range(count))
+
+
+def makeFiles(worlds=8, nodes=40, paths=60, bossPathLength=20, seed=0):
+    rng = random.Random(seed)
+    actions = Translations.actions().jpNames
+    sounds = Translations.soundEffects().jpNames
+
+    files = []
+    for world in range(1, worlds + 1):
+        suffix = '%02d.csv' % world
+
+        rows = []
+        for node in range(nodes):
+            rows.append(','.join([
+                str(node),
+                'W%d-%d' % (world, node),
+                str(rng.randrange(4)),
+                unlockList(rng, nodes, rng.randrange(1, 4)),
+                unlockList(rng, paths, rng.randrange(1, 3)),
+                str(rng.randrange(2)),
+                unlockList(rng, nodes, rng.randrange(0, 2)),
+                unlockList(rng, paths, rng.randrange(0, 2)),
+                unlockList(rng, paths, rng.randrange(0, 2)),
+            ]))
+        files.append(SarcLib.File('point' + suffix, '\r\n'.join(rows).encode('shiftjis')))
+
+        rows = []
+        for path in range(paths):
+            start = rng.randrange(nodes)
+            rows.append(','.join(['W%d-%dW%d-%d' % (world, start, world, (start + 1) % nodes), rng.choice(actions), rng.choice(sounds)]))
+        files.append(SarcLib.File('route' + suffix, '\r\n'.join(rows).encode('shiftjis')))
+
+        for kind in ('worldIn', 'toCastle'):
+            nodesOnPath = [str(rng.randrange(nodes)) for i in range(bossPathLength)]
+            files.append(SarcLib.File(kind + suffix, ','.join(nodesOnPath).encode('shiftjis')))
+
+    return files
+
+
+def makeArchive(path, worlds=8, nodes=40, paths=60, bossPathLength=20, seed=0):
+    ArchiveIO.saveArchive(path, makeFiles(worlds, nodes, paths, bossPathLength, seed))
+    return path
+
+
+def addSizeArguments(parser):
+    parser.add_argument('--worlds', type=int, default=8)
+    parser.add_argument('--nodes', type=int, default=40, help='nodes per world')
+    parser.add_argument('--paths', type=int, default=60, help='paths per world')
+    parser.add_argument('--boss-path-length', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic RouteInfo.sarc')
+    parser.add_argument('output')
+    addSizeArguments(parser)
+    args = parser.parse_args()
+
+    makeArchive(args.output, args.worlds, args.nodes, args.paths, args.boss_path_length, args.seed)
+
+
+if __name__ == '__main__':
+    main()
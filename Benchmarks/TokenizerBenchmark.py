@@ -0,0 +1,49 @@
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CsvTokenizer
+
+# The per-row split the editors used before CsvTokenizer
+LEGACY_PATTERN = ''',(?=(?:[^'"]|'[^']*'|"[^"]*")*$)'''
+
+
+def legacySplit(row):
+    return re.split(LEGACY_PATTERN, row)
+
+
+def makeRow(fields):
+    row = []
+    for i in range(fields):
+        if i % 3 == 0:
+            row.append('"%d,%d,%d"' % (i, i + 1, i + 2))
+        else:
+            row.append('W%d-%d' % (i // 10, i % 10))
+    return ','.join(row)
+
+
+def main():
+    print('%8s %12s %12s %8s' % ('fields', 'regex (ms)', 'tokenizer', 'speedup'))
+
+    for fields in (9, 100, 1000, 4000):
+        row = makeRow(fields)
+        assert legacySplit(row) == CsvTokenizer.splitRow(row)
+
+        number = max(1, 2000 // fields)
+        legacy = min(timeit.repeat(lambda: legacySplit(row), number=number, repeat=3)) / number
+        tokenizer = min(timeit.repeat(lambda: CsvTokenizer.splitRow(row), number=number, repeat=3)) / number
+
+        print('%8d %12.3f %12.3f %7.1fx' % (fields, legacy * 1000, tokenizer * 1000, legacy / tokenizer))
+
+        if tokenizer > legacy:
+            print('tokenizer is slower than the regex split')
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,9 @@
-from PyQt5 import QtCore, QtWidgets, QtGui
+import EditorModels
+import Icons
+import Profiling
+import RouteInfoDocument
+import sys
+from PyQt5 import QtCore, QtWidgets
 
 Qt = QtCore.Qt
 
@@ -7,7 +12,8 @@ class BossPathEditorWidget(QtWidgets.QWidget):
     def __init__(self, parent=None):
         QtWidgets.QWidget.__init__(self, parent=parent)
 
-        self.archiveContents = []
+        self.document = None
+        self.validator = None
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
@@ -15,228 +21,406 @@ class BossPathEditorWidget(QtWidgets.QWidget):
 
         # Create Widgets
         self.fileSelector = QtWidgets.QComboBox()
-        self.scrollArea = QtWidgets.QScrollArea()
-        self.BossPathEntries = BossPathEntryContainer()
+        self.worldInList = BossPathList('World Into')
+        self.toCastleList = BossPathList('From Tower')
 
-        # Setup Scroll Area
-        self.scrollArea.setWidgetResizable(True)
-        self.scrollArea.setWidget(self.BossPathEntries)
+        self.pathLists = {
+            RouteInfoDocument.WORLD_IN: self.worldInList,
+            RouteInfoDocument.TO_CASTLE: self.toCastleList,
+        }
 
         # Default Widgets to disabled
         self.fileSelector.setDisabled(True)
-        self.scrollArea.setDisabled(True)
+        self.worldInList.setDisabled(True)
+        self.toCastleList.setDisabled(True)
 
         # Setup Signals
         self.fileSelector.currentIndexChanged.connect(self.fileIndexChanged)
 
+        # Edits go straight to the document
+        for kind, pathList in self.pathLists.items():
+            nodeModel = pathList.nodeModel
+            nodeModel.dataChanged.connect(lambda topLeft, bottomRight, roles=(), kind=kind: self.entriesChanged(kind, topLeft, bottomRight, roles))
+            nodeModel.rowsInserted.connect(lambda parent, first, last, kind=kind: self.entriesInserted(kind, first, last))
+            nodeModel.rowsRemoved.connect(lambda parent, first, last, kind=kind: self.entriesRemoved(kind, first, last))
+            nodeModel.nodesMoved.connect(lambda kind=kind: self.entriesMoved(kind))
+
+        # Highlights appear once world switches pause
+        self.validationTimer = QtCore.QTimer(self)
+        self.validationTimer.setSingleShot(True)
+        self.validationTimer.setInterval(100)
+        self.validationTimer.timeout.connect(self.prepareValidation)
+
         # add widgets to layout
         topLayout = QtWidgets.QHBoxLayout()
         topLayout.addWidget(self.fileSelector, 1, Qt.AlignVCenter)
 
+        listLayout = QtWidgets.QHBoxLayout()
+        listLayout.addWidget(self.worldInList)
+        listLayout.addWidget(self.toCastleList)
+
         self.layout.addLayout(topLayout)
-        self.layout.addWidget(self.scrollArea)
+        self.layout.addLayout(listLayout)
 
-    def loadData(self, archiveContents):
-        self.archiveContents = archiveContents
+    def loadData(self, document, validator):
+        self.document = document
+        self.validator = validator
+        self.document.listeners.append(self.documentChanged)
+        self.validator.listeners.append(self.validationChanged)
 
         QtCore.QObject.blockSignals(self.fileSelector, True)
 
         # Add elements to file selector drop-down
-        for file in self.archiveContents:
-            if not str(file.name).find('worldIn'):
-                self.fileSelector.addItem(str(file.name)[7:-4])
+        for name in self.document.names(RouteInfoDocument.WORLD_IN):
+            self.fileSelector.addItem(name[7:-4])
 
         QtCore.QObject.blockSignals(self.fileSelector, False)
 
         # Enable the Ui
-        self.scrollArea.setDisabled(False)
+        self.worldInList.setDisabled(False)
+        self.toCastleList.setDisabled(False)
         self.fileSelector.setDisabled(False)
 
         # load initial file
         self.fileIndexChanged()
 
     def closeData(self):
-        self.archiveContents = []
+        if self.document is not None:
+            self.document.listeners.remove(self.documentChanged)
+            self.validator.listeners.remove(self.validationChanged)
+
+        self.document = None
+        self.validator = None
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
 
-        self.BossPathEntries.reset()
+        for pathList in self.pathLists.values():
+            pathList.clearList()
+            pathList.setDisabled(True)
 
         self.fileSelector.setDisabled(True)
-        self.scrollArea.setDisabled(True)
 
+        QtCore.QObject.blockSignals(self.fileSelector, True)
         self.fileSelector.clear()
+        QtCore.QObject.blockSignals(self.fileSelector, False)
 
     def fileIndexChanged(self):
+        with Profiling.action('switch world'):
+            self.switchFile()
+
+    def switchFile(self):
 
         # store the currently selected file's name
         self.selectedFile = self.fileSelector.currentText() + '.csv'
 
         # check if a file is already open
         if self.fileLoaded:
-            # if a file is already open, store the changes made and close the file
-            self.storeChanges()
-            self.BossPathEntries.reset()
+            # if a file is already open, close it, edits are already in the document
+            for pathList in self.pathLists.values():
+                pathList.clearList()
             self.loadSelectedFile()
         else:
             self.loadSelectedFile()
 
     def loadSelectedFile(self):
 
-        files = []
-
-        # load the data for the file the user selected
-        for file in self.archiveContents:
-            if file.name == 'worldIn' + self.selectedFile:
-                files.append(file)
-
-            elif file.name == 'toCastle' + self.selectedFile:
-                files.append(file)
+        # load the records for the file the user selected, worlds without a path from the tower only show one list
+        with Profiling.phase('populate', member=self.selectedFile):
+            for kind, pathList in self.pathLists.items():
+                name = kind + self.selectedFile
 
-        self.BossPathEntries.populate(files)
+                if name in self.document:
+                    pathList.nodeModel.setValidation(self.validator, name)
+                    pathList.populate(self.document.records(name))
+                    pathList.setVisible(True)
+                else:
+                    pathList.setVisible(False)
 
         self.fileLoaded = True
         self.currentLoadedFile = self.selectedFile
+        self.validationTimer.start()
 
-    def storeChanges(self):
-        data = self.BossPathEntries.bossPathToArray()
+    def entriesChanged(self, kind, topLeft, bottomRight, roles=()):
+        # Highlight updates only change the validation roles
+        if roles and Qt.EditRole not in roles:
+            return
 
-        i = 0
+        nodes = self.pathLists[kind].nodeModel.nodes
 
-        for entry in data:
-            if str(entry) == 'worldIn':
-                for file in self.archiveContents:
-                    if str(file.name) == 'worldIn' + self.currentLoadedFile:
-                        d = str(data[i + 1])
-                        d = d.encode('shiftjis')
-                        file.data = d
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            self.document.setCell(kind + self.currentLoadedFile, row, 0, nodes[row])
 
-            elif str(entry) == 'toCastle':
-                for file in self.archiveContents:
-                    if str(file.name) == 'toCastle' + self.currentLoadedFile:
-                        d = str(data[i + 1])
-                        d = d.encode('shiftjis')
-                        file.data = d
+    def entriesInserted(self, kind, first, last):
+        self.document.insertRecords(kind + self.currentLoadedFile, first, self.pathLists[kind].nodeModel.nodes[first:last + 1])
 
-            i += 1
+    def entriesRemoved(self, kind, first, last):
+        self.document.removeRecords(kind + self.currentLoadedFile, first, last - first + 1)
 
-    def getArchiveContents(self):
-        self.storeChanges()
-        return self.archiveContents
+    def entriesMoved(self, kind):
+        # A reordered path is written as a whole, so it undoes in one step
+        self.document.setRecords(kind + self.currentLoadedFile, list(self.pathLists[kind].nodeModel.nodes))
 
+    def documentChanged(self, change):
+        if not self.fileLoaded or change.name not in self.document:
+            return
 
-class BossPathEntryContainer(QtWidgets.QWidget):
-    def __init__(self, parent=None):
-        QtWidgets.QWidget.__init__(self, parent=parent)
-        self.layout = QtWidgets.QHBoxLayout(self)
-
-        self.worldInEntries = []
-        self.toCastleEntries = []
-
-    def populate(self, files):
-
-        for file in files:
-            if not str(file.name).find('worldIn'):
-                data = file.data
-                data = data.decode('shiftjis')
-                worldIn = BossPathEntry(data, "World Into")
-                self.layout.addWidget(worldIn, 0, Qt.AlignTop)
-                self.worldInEntries.append(worldIn)
-
-            if not str(file.name).find('toCastle'):
-                data = file.data
-                data = data.decode('shiftjis')
-                toCastle = BossPathEntry(data, "From Tower")
-                self.layout.addWidget(toCastle, 0, Qt.AlignTop)
-                self.toCastleEntries.append(toCastle)
-
-        if not self.toCastleEntries:
-            self.layout.insertStretch(1, 0)
-
-    def bossPathToArray(self):
-        temp = []
-
-        if self.worldInEntries:
-            for worldIn in self.worldInEntries:
-                temp.append('worldIn')
-                temp.append(worldIn.valuesToString())
-
-        if self.toCastleEntries:
-            for toCastle in self.toCastleEntries:
-                temp.append('toCastle')
-                temp.append(toCastle.valuesToString())
-
-        return temp
-
-    def reset(self):
-        self.clearLayout(self.layout)
-        self.worldInEntries = []
-        self.toCastleEntries = []
-
-    def clearLayout(self, layout):
-        while layout.count():
-            child = layout.takeAt(0)
-            if child.widget() is not None:
-                child.widget().deleteLater()
-            elif child.layout() is not None:
-                self.clearLayout(child.layout())
-
-
-class BossPathEntry(QtWidgets.QFrame, QtWidgets.QWidget):
-    def __init__(self, data, name, parent=None):
+        kind = RouteInfoDocument.memberKind(change.name)
+        if kind in self.pathLists and change.name == kind + self.currentLoadedFile:
+            self.pathLists[kind].nodeModel.syncChange(change, self.document.records(change.name))
+
+    def validationChanged(self, name, rows):
+        if not self.fileLoaded:
+            return
+
+        kind = RouteInfoDocument.memberKind(name)
+        if kind in self.pathLists and name == kind + self.currentLoadedFile:
+            self.pathLists[kind].nodeModel.problemsChanged(rows)
+
+            # Edits of a world whose graph was dropped bring it back
+            if rows is None:
+                self.validationTimer.start()
+
+    def prepareValidation(self):
+        name = RouteInfoDocument.WORLD_IN + self.currentLoadedFile
+
+        if self.fileLoaded and not self.validator.isReady(name):
+            self.validator.prepare(name)
+
+            for pathList in self.pathLists.values():
+                pathList.nodeModel.problemsChanged()
+
+    def showCell(self, name, row, column):
+        kind = RouteInfoDocument.memberKind(name)
+        index = self.fileSelector.findText(name[len(kind):-4])
+        if index == -1:
+            return
+
+        self.fileSelector.setCurrentIndex(index)
+
+        pathView = self.pathLists[kind].pathView
+        modelIndex = pathView.model().index(row, 0)
+        pathView.setCurrentIndex(modelIndex)
+        pathView.scrollTo(modelIndex)
+        pathView.setFocus()
+
+
+class BossPathList(QtWidgets.QFrame):
+    def __init__(self, name, parent=None):
         QtWidgets.QFrame.__init__(self, parent=parent)
-        QtWidgets.QWidget.__init__(self, parent=parent)
 
         self.setFrameShape(QtWidgets.QFrame.StyledPanel)
 
         self.layout = QtWidgets.QVBoxLayout(self)
         headerLayout = QtWidgets.QHBoxLayout()
 
-        self.entries = []
+        self.pathView = BossPathView()
+        self.nodeModel = self.pathView.nodeModel
 
         nameLabel = QtWidgets.QLabel(name)
         headerLayout.addWidget(nameLabel)
 
         addEntryBtn = QtWidgets.QPushButton('Insert Node')
-        addEntryBtn.setIcon(QtGui.QIcon('RouteEditData/icons/plus.png'))
-        addEntryBtn.pressed.connect(self.addNewEntry)
+        addEntryBtn.setIcon(Icons.icon('plus'))
+        addEntryBtn.pressed.connect(self.pathView.addNode)
 
         removeEntryBtn = QtWidgets.QPushButton('Remove Node')
-        removeEntryBtn.setIcon(QtGui.QIcon('RouteEditData/icons/minus.png'))
-        removeEntryBtn.pressed.connect(self.removeEntry)
+        removeEntryBtn.setIcon(Icons.icon('minus'))
+        removeEntryBtn.pressed.connect(self.pathView.removeNodes)
 
-        # buttonLayout = QtWidgets.QVBoxLayout()
         headerLayout.addWidget(addEntryBtn)
         headerLayout.addWidget(removeEntryBtn)
 
         self.layout.addLayout(headerLayout)
+        self.layout.addWidget(self.pathView)
+
+    def populate(self, nodes):
+        self.nodeModel.populate(nodes)
+
+    def clearList(self):
+        self.nodeModel.clear()
+
+
+class BossPathView(EditorModels.EntryViewMixin, QtWidgets.QListView):
+    def __init__(self):
+        QtWidgets.QListView.__init__(self)
+
+        self.nodeModel = BossPathModel(self)
+        self.setModel(self.nodeModel)
+
+        # Only the visible rows are drawn, all rows have the height of one line
+        self.setUniformItemSizes(True)
+        self.setAlternatingRowColors(True)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked | QtWidgets.QAbstractItemView.EditKeyPressed |
+                             QtWidgets.QAbstractItemView.AnyKeyPressed)
+
+        # Nodes are reordered by dragging them
+        self.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
+        self.setDefaultDropAction(Qt.MoveAction)
+        self.setDropIndicatorShown(True)
+
+    def addNode(self):
+        rows = self.selectedRows()
+
+        # A new node goes below the selection and is edited right away
+        row = rows[-1] + 1 if rows else self.nodeModel.rowCount()
+        self.nodeModel.insertRows(row, 1)
+
+        index = self.nodeModel.index(row, 0)
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
+        self.edit(index)
+
+    def removeNodes(self):
+        ranges = self.selectedRowRanges()
+
+        # A path keeps at least one node
+        if sum(count for first, count in ranges) >= self.nodeModel.rowCount():
+            return
+
+        # Remove from the bottom up so the remaining ranges stay valid
+        for first, count in reversed(ranges):
+            self.nodeModel.removeRows(first, count)
+
+    def dropEvent(self, event):
+        if event.source() is not self:
+            event.ignore()
+            return
+
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            row = self.nodeModel.rowCount()
+        elif self.dropIndicatorPosition() == QtWidgets.QAbstractItemView.BelowItem:
+            row = index.row() + 1
+        else:
+            row = index.row()
+
+        rows = self.selectedRows()
+        first = self.nodeModel.moveNodes(rows, row)
+
+        self.selectionModel().select(QtCore.QItemSelection(self.nodeModel.index(first, 0), self.nodeModel.index(first + len(rows) - 1, 0)),
+                                     QtCore.QItemSelectionModel.ClearAndSelect)
+        self.selectionModel().setCurrentIndex(self.nodeModel.index(first, 0), QtCore.QItemSelectionModel.NoUpdate)
+
+        # The nodes are already moved, a copy action keeps the view from removing the dragged rows
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
+
+
+class BossPathModel(EditorModels.EntryModelMixin, QtCore.QAbstractListModel):
+    nodesMoved = QtCore.pyqtSignal()
+
+    # Boss path problems concern the whole node
+    matchColumns = False
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+
+        self.nodes = []
+
+        # Nodes with problems are highlighted, results come from the validator's per-row cache
+        self.validator = None
+        self.memberName = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.nodes)
+
+    def flags(self, index):
+        # Drops land between nodes, never on one
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction | Qt.CopyAction
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self.nodes[index.row()]
+
+        elif role == Qt.BackgroundRole or role == Qt.ToolTipRole:
+            return self.validationData(index, role)
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+
+        self.nodes[index.row()] = sys.intern(str(value))
+
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def lastColumn(self):
+        return 0
+
+    def record(self, row):
+        return self.nodes[row]
+
+    def setRecord(self, row, node):
+        self.nodes[row] = sys.intern(node)
+
+    def records(self):
+        return list(self.nodes)
+
+    def populate(self, nodes):
+        self.beginResetModel()
+        self.nodes = [sys.intern(node) for node in nodes]
+        self.endResetModel()
+
+    def insertRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginInsertRows(parent, row, row + count - 1)
+        self.nodes[row:row] = [''] * count
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.nodes[row:row + count]
+        self.endRemoveRows()
+        return True
 
-        data = str(data).split(',')
+    def moveNodes(self, rows, destination):
+        # Moves the nodes of rows, in order, in front of the node at destination and returns their new first row
+        rows = sorted(set(rows))
+        moving = set(rows)
 
-        for i in data:
-            lineEdit = QtWidgets.QLineEdit(i)
-            self.entries.append(lineEdit)
-            self.layout.addWidget(lineEdit)
+        first = destination - sum(1 for row in rows if row < destination)
+        remaining = [row for row in range(len(self.nodes)) if row not in moving]
+        order = remaining[:first] + rows + remaining[first:]
 
-    def valuesToString(self):
-        temp = []
+        if not rows or order == list(range(len(self.nodes))):
+            return first
 
-        for lineEdit in self.entries:
-            temp.append(lineEdit.text())
+        self.layoutAboutToBeChanged.emit()
 
-        output = ','.join(temp)
-        output.encode('shiftjis')
+        # Open editors and the current node follow the nodes they belong to
+        newRows = {row: newRow for newRow, row in enumerate(order)}
+        oldIndexes = self.persistentIndexList()
+        self.changePersistentIndexList(oldIndexes, [self.index(newRows[index.row()], 0) for index in oldIndexes])
 
-        return output
+        self.nodes = [self.nodes[row] for row in order]
+        self.layoutChanged.emit()
 
-    def addNewEntry(self):
-        lineEdit = QtWidgets.QLineEdit()
-        self.entries.append(lineEdit)
-        self.layout.addWidget(lineEdit)
+        self.nodesMoved.emit()
+        return first
 
-    def removeEntry(self):
-        if len(self.entries) >= 2:
-            if self.entries[-1] is not None:
-                self.entries[-1].deleteLater()
-            self.entries = self.entries[:-1]
+    def clear(self):
+        self.beginResetModel()
+        self.nodes = []
+        self.memberName = None
+        self.endResetModel()
@@ -0,0 +1,267 @@
+import ArchiveDiff
+import collections
+import RouteInfoDocument
+import SearchIndex
+import SearchWidget
+import time
+from PyQt5 import QtCore, QtWidgets
+
+Qt = QtCore.Qt
+
+# One line of the comparison, row and column are None for whole members and column for whole rows
+CompareEntry = collections.namedtuple('CompareEntry', ['name', 'row', 'column', 'change', 'openValue', 'otherValue'])
+
+# The open archive is the new side of the diff, the compared one the old side
+MEMBER_CHANGES = {
+    ArchiveDiff.MEMBER_ADDED: 'only in open archive',
+    ArchiveDiff.MEMBER_REMOVED: 'only in compared archive',
+    ArchiveDiff.MEMBER_CHANGED: 'formatting',
+}
+
+
+def cellText(name, record, column):
+    value = record[column] if isinstance(record, tuple) else record
+
+    # Actions and sounds are shown the same way as in the path table
+    if RouteInfoDocument.memberKind(name) == RouteInfoDocument.ROUTE and column in SearchIndex.TRANSLATED_COLUMNS:
+        return SearchIndex.TRANSLATED_COLUMNS[column]().jpToEng.get(value, value)
+
+    return value
+
+
+def rowText(record):
+    return ','.join(record) if isinstance(record, tuple) else record
+
+
+def diffEntries(diffs):
+    entries = []
+
+    for diff in diffs:
+        if not diff.rows:
+            entries.append(CompareEntry(diff.name, None, None, MEMBER_CHANGES[diff.status], '', ''))
+
+        for row in diff.rows:
+            if row.type == ArchiveDiff.ROW_CHANGED:
+                for column in row.columns:
+                    entries.append(CompareEntry(diff.name, row.newRow, column, 'changed',
+                                                cellText(diff.name, row.new, column), cellText(diff.name, row.old, column)))
+
+            elif row.type == ArchiveDiff.ROW_INSERTED:
+                entries.append(CompareEntry(diff.name, row.newRow, None, 'only in open archive', rowText(row.new), ''))
+
+            else:
+                entries.append(CompareEntry(diff.name, row.newRow, None, 'only in compared archive', '', rowText(row.old)))
+
+    return entries
+
+
+def conflictEntries(conflicts):
+    entries = []
+
+    for conflict in conflicts:
+        if conflict.row is None:
+            entries.append(CompareEntry(conflict.name, None, None, 'conflict',
+                                        'present' if conflict.ours else 'removed', 'present' if conflict.theirs else 'removed'))
+        elif conflict.column is None:
+            entries.append(CompareEntry(conflict.name, conflict.row, None, 'conflict',
+                                        ' | '.join(map(rowText, conflict.ours)), ' | '.join(map(rowText, conflict.theirs))))
+        else:
+            entries.append(CompareEntry(conflict.name, conflict.row, conflict.column, 'conflict',
+                                        cellText(conflict.name, conflict.ours, conflict.column),
+                                        cellText(conflict.name, conflict.theirs, conflict.column)))
+
+    return entries
+
+
+class ComparePanel(QtWidgets.QWidget):
+    entryActivated = QtCore.pyqtSignal(str, int, int)
+    mergeRequested = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        QtWidgets.QWidget.__init__(self, parent=parent)
+
+        self.document = None
+        self.otherDocument = None
+        self.otherPath = ''
+        self.history = None
+
+        # Digests of the open archive are kept until its member is edited, the compared archive doesn't change
+        self.openDigests = {}
+        self.otherDigests = {}
+
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        # Create Widgets
+        self.pathLabel = QtWidgets.QLabel()
+        self.refreshButton = QtWidgets.QPushButton('Refresh')
+        self.mergeButton = QtWidgets.QPushButton('Merge...')
+        self.entryView = QtWidgets.QTableView()
+        self.entryModel = CompareEntryModel(self)
+        self.statusLabel = QtWidgets.QLabel()
+
+        self.mergeButton.setToolTip('Merge the changes of the compared archive into the open one, '
+                                    'given the archive both were edited from')
+
+        # Setup Entry Table
+        self.entryView.setModel(self.entryModel)
+        self.entryView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.entryView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.entryView.horizontalHeader().setStretchLastSection(True)
+        self.entryView.verticalHeader().setVisible(False)
+
+        # Default Widgets to disabled
+        self.setDisabled(True)
+
+        # Setup Signals
+        self.refreshButton.pressed.connect(self.refresh)
+        self.mergeButton.pressed.connect(self.mergeRequested.emit)
+        self.entryView.activated.connect(self.rowActivated)
+
+        # The comparison follows edits once they pause
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(100)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+        # add widgets to layout
+        topLayout = QtWidgets.QHBoxLayout()
+        topLayout.addWidget(self.pathLabel, 1, Qt.AlignVCenter)
+        topLayout.addWidget(self.refreshButton, 0, Qt.AlignVCenter)
+        topLayout.addWidget(self.mergeButton, 0, Qt.AlignVCenter)
+
+        self.layout.addLayout(topLayout)
+        self.layout.addWidget(self.entryView)
+        self.layout.addWidget(self.statusLabel)
+
+    def loadData(self, document, otherDocument, otherPath, history):
+        self.closeData()
+
+        self.document = document
+        self.otherDocument = otherDocument
+        self.otherPath = otherPath
+        self.history = history
+        self.document.listeners.append(self.documentChanged)
+
+        self.pathLabel.setText('Compared with ' + otherPath)
+        self.setDisabled(False)
+        self.refresh()
+
+    def closeData(self):
+        if self.document is not None:
+            self.document.listeners.remove(self.documentChanged)
+
+        if self.otherDocument is not None:
+            self.otherDocument.storeParseCache()
+            self.otherDocument.close()
+
+        self.document = None
+        self.otherDocument = None
+        self.otherPath = ''
+        self.history = None
+        self.openDigests = {}
+        self.otherDigests = {}
+        self.refreshTimer.stop()
+        self.entryModel.setEntries([])
+        self.pathLabel.clear()
+        self.statusLabel.clear()
+        self.setDisabled(True)
+
+    def digests(self, document, digests):
+        # Members added since the last refresh are hashed, removed ones dropped
+        return {name: digests[name] if name in digests else ArchiveDiff.memberDigest(document, name)
+                for name in document.names()}
+
+    def refresh(self):
+        self.refreshTimer.stop()
+
+        if self.document is None:
+            return
+
+        start = time.perf_counter()
+        self.otherDigests = self.digests(self.otherDocument, self.otherDigests)
+        self.openDigests = self.digests(self.document, self.openDigests)
+        diffs = ArchiveDiff.diffDocuments(self.otherDocument, self.document, self.otherDigests, self.openDigests)
+        seconds = time.perf_counter() - start
+
+        self.entryModel.setEntries(diffEntries(diffs))
+        self.statusLabel.setText('%d differences in %d files (%.1f ms)' % (len(self.entryModel.entries), len(diffs), seconds * 1000))
+
+    def documentChanged(self, change):
+        self.openDigests.pop(change.name, None)
+        self.refreshTimer.start()
+
+    def merge(self, baseDocument):
+        merge = ArchiveDiff.mergeDocuments(baseDocument, self.document, self.otherDocument)
+
+        # A merge across worlds undoes in one step
+        with self.history.macro('Merge ' + self.otherPath):
+            ArchiveDiff.applyMerge(self.document, merge)
+
+        # The conflicts stay listed until the next edit or refresh
+        self.refreshTimer.stop()
+        self.entryModel.setEntries(conflictEntries(merge.conflicts))
+        self.statusLabel.setText('Merged %d files, %d conflicts kept the values of the open archive' % (
+            len(merge.updates), len(merge.conflicts)))
+
+        return merge
+
+    def rowActivated(self, index):
+        entry = self.entryModel.entries[index.row()]
+
+        if entry.name not in self.document or self.document.kind(entry.name) is None:
+            return
+
+        # Rows only in the compared archive point at where they would be
+        row = min(entry.row or 0, len(self.document.peekRecords(entry.name)) - 1)
+        self.entryActivated.emit(entry.name, max(row, 0), entry.column or 0)
+
+
+class CompareEntryModel(QtCore.QAbstractTableModel):
+    headers = ['File', 'Row', 'Column', 'Change', 'Open Archive', 'Compared Archive']
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+
+        self.entries = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.entries)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        entry = self.entries[index.row()]
+        col = index.column()
+
+        if col == 0:
+            return entry.name
+        elif col == 1:
+            return entry.row
+        elif col == 2:
+            if entry.column is None:
+                return None
+            return SearchWidget.COLUMN_HEADERS[RouteInfoDocument.memberKind(entry.name)][entry.column]
+        elif col == 3:
+            return entry.change
+        elif col == 4:
+            return entry.openValue
+
+        return entry.otherValue
+
+    def setEntries(self, entries):
+        self.beginResetModel()
+        self.entries = entries
+        self.endResetModel()
@@ -0,0 +1,51 @@
+import re
+
+# Matches every character that can change the tokenizer state
+SPECIAL_CHARS = re.compile('[,\'"]')
+
+
+def splitRow(row):
+    # Fast path for rows without any quoted substrings
+    if '"' not in row and "'" not in row:
+        return row.split(',')
+
+    fields = []
+    start = 0
+    pos = 0
+
+    # Walk the separators and quotes once, jumping straight over quoted substrings
+    while True:
+        match = SPECIAL_CHARS.search(row, pos)
+        if match is None:
+            break
+
+        char = match.group()
+        pos = match.end()
+
+        if char == ',':
+            fields.append(row[start:pos - 1])
+            start = pos
+        else:
+            end = row.find(char, pos)
+            if end == -1:
+                # An unterminated quote runs to the end of the row
+                break
+            pos = end + 1
+
+    fields.append(row[start:])
+    return fields
+
+
+def iterRows(data, encoding='shiftjis'):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode(encoding)
+
+    # Rows are separated by line breaks, blank lines are skipped
+    for line in data.splitlines():
+        line = line.strip()
+        if line:
+            yield splitRow(line)
+
+
+def parseRows(data, encoding='shiftjis'):
+    return list(iterRows(data, encoding))
@@ -0,0 +1,315 @@
+import hashlib
+import marshal
+import os
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+import RouteInfoDocument
+
+# Setting this environment variable moves the journals, an empty value turns them off
+JOURNAL_DIR_VARIABLE = 'ROUTEEDIT_JOURNAL_DIR'
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.local', 'share', 'RouteEdit', 'journal')
+
+# Once the entries written since the last compaction take more than this, the journal is rewritten from the modified members
+DEFAULT_COMPACT_BYTES = 4 * 1024 * 1024
+
+JOURNAL_SUFFIX = '.journal'
+MAGIC = b'RIJL'
+FORMAT_VERSION = 1
+
+# magic, format version, marshal version, hash of the saved archive, length of the archive path that follows
+HEADER = struct.Struct('<4sHH20sI')
+
+# length and crc32 of each entry, a crash can leave the last one incomplete and replay stops before it
+ENTRY_HEADER = struct.Struct('<II')
+
+# Entry type besides the document change types, the state of every member
+SNAPSHOT = 'snapshot'
+
+# Jobs of the writer thread
+APPEND = 0
+REWRITE = 1
+CLOSE = 2
+
+
+def journalDir():
+    return os.environ.get(JOURNAL_DIR_VARIABLE, DEFAULT_JOURNAL_DIR)
+
+
+def journalPath(archivePath, directory=None):
+    # One journal per archive path, so reopening the archive finds it
+    directory = journalDir() if directory is None else directory
+    return os.path.join(directory, hashlib.sha1(os.path.abspath(archivePath).encode('utf-8')).hexdigest() + JOURNAL_SUFFIX)
+
+
+def packEntry(entry):
+    blob = marshal.dumps(entry)
+    return ENTRY_HEADER.pack(len(blob), zlib.crc32(blob)) + blob
+
+
+def encodeChange(document, change):
+    # Entries only hold plain built in types, as marshal writes nothing else
+    if change.type == RouteInfoDocument.CELL_CHANGED:
+        return change.type, change.name, change.row, change.column, change.new
+
+    elif change.type == RouteInfoDocument.ROWS_INSERTED:
+        return change.type, change.name, change.row, None, RouteInfoDocument.rowsFromRecords(document.kind(change.name), change.new)
+
+    elif change.type == RouteInfoDocument.ROWS_REMOVED:
+        return change.type, change.name, change.row, None, len(change.old)
+
+    elif change.type == RouteInfoDocument.MEMBER_RESET:
+        return change.type, change.name, None, None, RouteInfoDocument.rowsFromRecords(document.kind(change.name), change.new)
+
+    elif change.type == RouteInfoDocument.DATA_RESET:
+        return change.type, change.name, None, None, bytes(change.new)
+
+    elif change.type == RouteInfoDocument.MEMBER_ADDED:
+        data, hasFilename = change.new
+        return change.type, change.name, None, None, (bytes(data), hasFilename)
+
+    return change.type, change.name, None, None, None
+
+
+def snapshotEntry(document):
+    # Members that differ from the saved archive, with the names of all members so removed ones are known
+    members = {}
+    for name in document.modifiedNames():
+        members[name] = (bytes(document.data(name)), document.members[name].hasFilename)
+
+    return SNAPSHOT, None, None, None, (document.isModified(), document.names(), members)
+
+
+def readJournal(path):
+    # Returns the archive path, its hash and the complete entries, None for missing or foreign files
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    try:
+        magic, version, marshalVersion, archiveHash, pathLength = HEADER.unpack_from(data)
+        if (magic, version, marshalVersion) != (MAGIC, FORMAT_VERSION, marshal.version):
+            return None
+
+        offset = HEADER.size + pathLength
+        archivePath = data[HEADER.size:offset].decode('utf-8')
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+    entries = []
+    while offset + ENTRY_HEADER.size <= len(data):
+        length, crc = ENTRY_HEADER.unpack_from(data, offset)
+        blob = data[offset + ENTRY_HEADER.size:offset + ENTRY_HEADER.size + length]
+
+        if len(blob) != length or zlib.crc32(blob) != crc:
+            break
+
+        try:
+            entries.append(marshal.loads(blob))
+        except (EOFError, ValueError, TypeError):
+            break
+
+        offset += ENTRY_HEADER.size + length
+
+    return archivePath, archiveHash, entries
+
+
+def pendingJournals(directory=None):
+    # Journals holding edits that never reached their archive, the most recent first
+    directory = journalDir() if directory is None else directory
+    if not directory:
+        return []
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+
+    journals = []
+    for name in names:
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+
+        path = os.path.join(directory, name)
+        journal = readJournal(path)
+        if journal is None or not hasChanges(journal[2]):
+            continue
+
+        journals.append((os.path.getmtime(path), path, journal[0]))
+
+    return [(path, archivePath) for mtime, path, archivePath in sorted(journals, reverse=True)]
+
+
+def hasChanges(entries):
+    # A journal always starts with a snapshot, which holds nothing until something is edited
+    return any(entry[0] != SNAPSHOT or entry[4][0] for entry in entries)
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def applySnapshot(document, modified, names, members):
+    names = set(names)
+
+    for name in document.names():
+        if name not in names:
+            document.removeMember(name)
+
+    for name, (data, hasFilename) in sorted(members.items()):
+        if name in document:
+            document.setData(name, data)
+        else:
+            document.addMember(name, data, hasFilename)
+
+
+def replay(document, entries):
+    for entryType, name, row, column, payload in entries:
+        if entryType == RouteInfoDocument.CELL_CHANGED:
+            document.setCell(name, row, column, payload)
+        elif entryType == RouteInfoDocument.ROWS_INSERTED:
+            document.insertRecords(name, row, RouteInfoDocument.recordsFromRows(document.kind(name), payload))
+        elif entryType == RouteInfoDocument.ROWS_REMOVED:
+            document.removeRecords(name, row, payload)
+        elif entryType == RouteInfoDocument.MEMBER_RESET:
+            document.setRecords(name, RouteInfoDocument.recordsFromRows(document.kind(name), payload))
+        elif entryType == RouteInfoDocument.DATA_RESET:
+            document.setData(name, payload)
+        elif entryType == RouteInfoDocument.MEMBER_ADDED:
+            document.addMember(name, *payload)
+        elif entryType == RouteInfoDocument.MEMBER_REMOVED:
+            document.removeMember(name)
+        else:
+            applySnapshot(document, *payload)
+
+
+class EditJournal:
+    def __init__(self, path, archivePath, archiveHash, compactBytes=DEFAULT_COMPACT_BYTES):
+        self.path = path
+        self.archivePath = os.path.abspath(archivePath)
+        self.archiveHash = archiveHash
+        self.compactBytes = compactBytes
+        self.document = None
+
+        # Bytes appended since the last compaction, counted on the GUI thread, compaction waits until they outgrow
+        # the snapshot it writes, so its cost spreads over the edits
+        self.size = 0
+        self.compactSize = compactBytes
+
+        # Edits are encoded where they happen and written by a thread of their own, a pool thread would hold up
+        # opening and saving for as long as the archive is open
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.writeJobs, name='EditJournal', daemon=True)
+        self.thread.start()
+
+    def attach(self, document):
+        # The journal starts as a snapshot of the document, so edits recovered before it was attached are kept
+        self.document = document
+        self.compact()
+        document.listeners.append(self.documentChanged)
+
+    def documentChanged(self, change):
+        entry = packEntry(encodeChange(self.document, change))
+        self.jobs.put((APPEND, entry))
+
+        self.size += len(entry)
+        if self.size > self.compactSize:
+            self.compact()
+
+    def compact(self, archiveHash=None):
+        # Also called after saves, with the hash of the archive the snapshot is now relative to
+        if archiveHash is not None:
+            self.archiveHash = archiveHash
+
+        entry = packEntry(snapshotEntry(self.document))
+        self.jobs.put((REWRITE, (self.archiveHash, entry)))
+        self.size = 0
+        self.compactSize = max(self.compactBytes, len(entry))
+
+    def close(self, keep=False):
+        # Kept journals are offered for recovery on the next launch
+        if self.document is not None and self.documentChanged in self.document.listeners:
+            self.document.listeners.remove(self.documentChanged)
+
+        self.jobs.put((CLOSE, keep))
+        self.thread.join()
+        self.document = None
+
+    def header(self, archiveHash):
+        archivePath = self.archivePath.encode('utf-8')
+        return HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, archiveHash, len(archivePath)) + archivePath
+
+    def rewrite(self, archiveHash, entry):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Written next to the journal and renamed, so a crash leaves either the old or the new one
+        fd, tempPath = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.header(archiveHash))
+                f.write(entry)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tempPath, self.path)
+
+        except BaseException:
+            discard(tempPath)
+            raise
+
+        return open(self.path, 'ab')
+
+    def writeJobs(self):
+        f = None
+        failed = False
+
+        while True:
+            jobs = [self.jobs.get()]
+
+            # A burst of edits is written and flushed at once
+            while True:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            for job, value in jobs:
+                if job == CLOSE:
+                    if f is not None:
+                        f.close()
+                    if not value:
+                        discard(self.path)
+                    return
+
+                if failed:
+                    continue
+
+                # The journal only guards against losing edits, a failing disk turns it off without stopping the editor
+                try:
+                    if job == REWRITE:
+                        if f is not None:
+                            f.close()
+                        f = self.rewrite(*value)
+                    elif f is not None:
+                        f.write(value)
+
+                except OSError as e:
+                    print('journal %s disabled: %s' % (self.path, e), file=sys.stderr)
+                    failed = True
+
+            if f is not None and not failed:
+                try:
+                    f.flush()
+                except OSError as e:
+                    print('journal %s disabled: %s' % (self.path, e), file=sys.stderr)
+                    failed = True
@@ -0,0 +1,88 @@
+import RouteInfoDocument
+from PyQt5 import QtCore, QtGui
+
+Qt = QtCore.Qt
+
+invalidBrush = QtGui.QBrush(QtGui.QColor(255, 190, 190))
+
+
+class EntryViewMixin:
+    # Shared by the point and path tables and the boss path lists
+
+    def currentRow(self):
+        return self.currentIndex().row()
+
+    def selectedRows(self):
+        rows = sorted({index.row() for index in self.selectionModel().selectedIndexes()})
+
+        if not rows and self.currentRow() != -1:
+            rows = [self.currentRow()]
+
+        return rows
+
+    def selectedRowRanges(self):
+        # Group the selected rows into (first row, row count) ranges
+        ranges = []
+        for row in self.selectedRows():
+            if ranges and ranges[-1][0] + ranges[-1][1] == row:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([row, 1])
+
+        return ranges
+
+
+class EntryModelMixin:
+    # Models set validator and memberName, and provide record, setRecord, records and populate
+
+    # Problems are shown on the cell of their column, boss paths have one column and show every problem of a row
+    matchColumns = True
+
+    def lastColumn(self):
+        return self.columnCount() - 1
+
+    def validationData(self, index, role):
+        if self.validator is None or self.memberName is None or not self.validator.isReady(self.memberName):
+            return None
+
+        messages = [problem.message for problem in self.validator.rowProblems(self.memberName, index.row())
+                    if not self.matchColumns or problem.column == index.column()]
+
+        if not messages:
+            return None
+        elif role == Qt.BackgroundRole:
+            return invalidBrush
+
+        return '\n'.join(messages)
+
+    def setValidation(self, validator, memberName):
+        self.validator = validator
+        self.memberName = memberName
+
+    def problemsChanged(self, rows=None):
+        rowCount = self.rowCount()
+        if not rowCount:
+            return
+
+        roles = [Qt.BackgroundRole, Qt.ToolTipRole]
+        lastColumn = self.lastColumn()
+
+        if rows is None:
+            self.dataChanged.emit(self.index(0, 0), self.index(rowCount - 1, lastColumn), roles)
+            return
+
+        for row in rows:
+            if row < rowCount:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, lastColumn), roles)
+
+    def syncChange(self, change, records):
+        # Edits made elsewhere, e.g. by a replace or an undo, the model's own edits already match
+        if change.type == RouteInfoDocument.CELL_CHANGED:
+            row = change.row
+            if row < self.rowCount() and self.record(row) != records[row]:
+                self.setRecord(row, records[row])
+                self.dataChanged.emit(self.index(row, 0), self.index(row, self.lastColumn()), [Qt.DisplayRole])
+
+        elif change.type in (RouteInfoDocument.MEMBER_RESET, RouteInfoDocument.DATA_RESET) or self.rowCount() != len(records):
+            if self.records() != records:
+                self.populate(records)
@@ -0,0 +1,18 @@
+import os
+from PyQt5 import QtGui
+
+# Resolved next to this module so the icons also load outside the editor's folder
+ICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RouteEditData', 'icons')
+
+# Icons are shared by every widget, so each image is read and decoded once per process
+_icons = {}
+
+
+def icon(name):
+    cached = _icons.get(name)
+
+    if cached is None:
+        cached = QtGui.QIcon(os.path.join(ICON_PATH, name + '.png'))
+        _icons[name] = cached
+
+    return cached
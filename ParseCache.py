@@ -0,0 +1,191 @@
+import marshal
+import os
+import struct
+import tempfile
+import zlib
+
+# Setting this environment variable moves the cache, an empty value turns it off
+CACHE_DIR_VARIABLE = 'ROUTEEDIT_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'RouteEdit')
+
+# Total size of the entries, the least recently used ones are removed above it
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+ENTRY_SUFFIX = '.parsed'
+MAGIC = b'RIPC'
+FORMAT_VERSION = 1
+
+# magic, format version, marshal version, archive size, archive hash, table length
+HEADER = struct.Struct('<4sHHQ20sI')
+
+# Raised by marshal and zlib for truncated or damaged entries
+DECODE_ERRORS = (EOFError, ValueError, TypeError, zlib.error, struct.error)
+
+
+def cacheDir():
+    return os.environ.get(CACHE_DIR_VARIABLE, DEFAULT_CACHE_DIR)
+
+
+def entryPath(directory, archiveHash):
+    return os.path.join(directory, archiveHash.hex() + ENTRY_SUFFIX)
+
+
+class CacheEntry:
+    def __init__(self, directory, archiveHash, archiveSize, data=b'', table=None):
+        self.directory = directory
+        self.archiveHash = archiveHash
+        self.archiveSize = archiveSize
+
+        # Members are compressed separately, table maps names to (offset, length) in data
+        self.data = data
+        self.table = table if table is not None else {}
+
+        # Members parsed since the entry was loaded, written together with the others by store
+        self.added = {}
+
+    def __contains__(self, name):
+        return name in self.added or name in self.table
+
+    def blob(self, name):
+        blob = self.added.get(name)
+
+        if blob is None:
+            offset, length = self.table[name]
+            blob = self.data[offset:offset + length]
+
+        return blob
+
+    def rows(self, name):
+        try:
+            return marshal.loads(zlib.decompress(self.blob(name)))
+        except DECODE_ERRORS:
+            return None
+
+    def add(self, name, rows):
+        # rows are plain tuples, or lists of strings, as marshal only writes built in types
+        self.added[name] = zlib.compress(marshal.dumps(rows), 1)
+
+    def rebase(self, archiveHash, archiveSize, names):
+        # The entry now describes another archive, e.g. the same one after a save, that shares the members in names
+        self.added = {name: bytes(self.blob(name)) for name in names if name in self}
+        self.data = b''
+        self.table = {}
+
+        self.archiveHash = archiveHash
+        self.archiveSize = archiveSize
+
+
+def load(archiveHash, archiveSize, directory=None):
+    # An empty entry is returned when the archive wasn't cached yet, None when caching is off
+    directory = cacheDir() if directory is None else directory
+    if not directory:
+        return None
+
+    path = entryPath(directory, archiveHash)
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return CacheEntry(directory, archiveHash, archiveSize)
+
+    # Entries are named after the content hash, the header has to match the archive too
+    try:
+        magic, version, marshalVersion, size, entryHash, tableLength = HEADER.unpack_from(data)
+
+        if (magic, version, marshalVersion, size, entryHash) != (MAGIC, FORMAT_VERSION, marshal.version, archiveSize, archiveHash):
+            return CacheEntry(directory, archiveHash, archiveSize)
+
+        tableEnd = HEADER.size + tableLength
+        table = marshal.loads(zlib.decompress(data[HEADER.size:tableEnd]))
+
+    except DECODE_ERRORS:
+        return CacheEntry(directory, archiveHash, archiveSize)
+
+    # The modification time orders entries for eviction, so a hit makes the entry the most recent
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return CacheEntry(directory, archiveHash, archiveSize, memoryview(data)[tableEnd:], table)
+
+
+def store(entry, maxBytes=DEFAULT_CACHE_BYTES):
+    # The cache only saves time, a failed write leaves it as it was
+    if not entry.added:
+        return None
+
+    names = sorted(set(entry.table) | set(entry.added))
+    blobs = [entry.blob(name) for name in names]
+
+    table = {}
+    offset = 0
+    for name, blob in zip(names, blobs):
+        table[name] = (offset, len(blob))
+        offset += len(blob)
+
+    tableData = zlib.compress(marshal.dumps(table), 1)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, entry.archiveSize, entry.archiveHash, len(tableData))
+    path = entryPath(entry.directory, entry.archiveHash)
+
+    try:
+        os.makedirs(entry.directory, exist_ok=True)
+
+        # Written next to the entry and renamed, so readers never see a partial entry
+        fd, tempPath = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=entry.directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(tableData)
+                for blob in blobs:
+                    f.write(blob)
+
+            os.replace(tempPath, path)
+
+        except BaseException:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            raise
+
+        evict(entry.directory, maxBytes, keep=path)
+
+    except OSError:
+        return None
+
+    return path
+
+
+def evict(directory, maxBytes=DEFAULT_CACHE_BYTES, keep=None):
+    entries = []
+
+    for name in os.listdir(directory):
+        if not name.endswith(ENTRY_SUFFIX):
+            continue
+
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for mtime, size, path in entries)
+
+    # Least recently used first, the entry just written always stays
+    for mtime, size, path in sorted(entries):
+        if total <= maxBytes:
+            break
+        if path == keep:
+            continue
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
@@ -1,5 +1,8 @@
-import re
-from PyQt5 import QtCore, QtWidgets, QtGui
+import EditorModels
+import Icons
+import Profiling
+import RouteInfoDocument
+from PyQt5 import QtCore, QtWidgets
 
 Qt = QtCore.Qt
 
@@ -8,7 +11,8 @@ class PointEditorWidget(QtWidgets.QWidget):
     def __init__(self):
         QtWidgets.QWidget.__init__(self)
 
-        self.archiveContents = []
+        self.document = None
+        self.validator = None
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
@@ -22,12 +26,13 @@ class PointEditorWidget(QtWidgets.QWidget):
         self.delRowButton = QtWidgets.QPushButton('Remove Row')
         self.importButton = QtWidgets.QPushButton('Import')
         self.exportButton = QtWidgets.QPushButton('Export')
+        self.graphStatus = QtWidgets.QLabel()
 
         # Add Icons
-        self.addRowButton.setIcon(QtGui.QIcon('RouteEditData/icons/plus.png'))
-        self.delRowButton.setIcon(QtGui.QIcon('RouteEditData/icons/minus.png'))
-        self.importButton.setIcon(QtGui.QIcon('RouteEditData/icons/import.png'))
-        self.exportButton.setIcon(QtGui.QIcon('RouteEditData/icons/export.png'))
+        self.addRowButton.setIcon(Icons.icon('plus'))
+        self.delRowButton.setIcon(Icons.icon('minus'))
+        self.importButton.setIcon(Icons.icon('import'))
+        self.exportButton.setIcon(Icons.icon('export'))
 
         # Default Widgets to disabled
         self.fileSelector.setDisabled(True)
@@ -44,6 +49,18 @@ class PointEditorWidget(QtWidgets.QWidget):
         self.importButton.pressed.connect(self.importData)
         self.exportButton.pressed.connect(self.exportData)
 
+        # Edits go straight to the document
+        entryModel = self.pointEntries.model()
+        entryModel.dataChanged.connect(self.entriesChanged)
+        entryModel.rowsInserted.connect(self.entriesInserted)
+        entryModel.rowsRemoved.connect(self.entriesRemoved)
+
+        # The graph report and highlights wait until edits and world switches pause, so bursts only update them once
+        self.graphTimer = QtCore.QTimer(self)
+        self.graphTimer.setSingleShot(True)
+        self.graphTimer.setInterval(100)
+        self.graphTimer.timeout.connect(self.updateGraphStatus)
+
         # add widgets to layout
         topLayout = QtWidgets.QHBoxLayout()
         topLayout.addWidget(self.fileSelector, 1, Qt.AlignVCenter)
@@ -54,19 +71,23 @@ class PointEditorWidget(QtWidgets.QWidget):
         bottomLayout.addWidget(self.addRowButton, 1, Qt.AlignVCenter)
         bottomLayout.addWidget(self.delRowButton, 1, Qt.AlignVCenter)
         bottomLayout.insertStretch(2, 2)
+        bottomLayout.addWidget(self.graphStatus, 0, Qt.AlignVCenter)
 
         self.layout.addLayout(topLayout)
         self.layout.addWidget(self.scrollArea)
         self.layout.addLayout(bottomLayout)
 
-    def loadData(self, archiveContents):
-        self.archiveContents = archiveContents
+    def loadData(self, document, validator):
+        self.document = document
+        self.validator = validator
+        self.document.listeners.append(self.documentChanged)
+        self.validator.listeners.append(self.validationChanged)
 
         QtCore.QObject.blockSignals(self.fileSelector, True)
 
         # Add elements to file selector drop-down
-        for file in self.archiveContents:
-            self.fileSelector.addItem(str(file.name)[5:-4])
+        for name in self.document.names(RouteInfoDocument.POINT):
+            self.fileSelector.addItem(name[5:-4])
 
         QtCore.QObject.blockSignals(self.fileSelector, False)
 
@@ -78,7 +99,14 @@ class PointEditorWidget(QtWidgets.QWidget):
         self.fileIndexChanged()
 
     def closeData(self):
-        self.archiveContents = []
+        if self.document is not None:
+            self.document.listeners.remove(self.documentChanged)
+            self.validator.listeners.remove(self.validationChanged)
+
+        self.document = None
+        self.validator = None
+        self.graphStatus.clear()
+        self.graphStatus.setToolTip('')
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
@@ -88,16 +116,21 @@ class PointEditorWidget(QtWidgets.QWidget):
         self.fileSelector.setDisabled(True)
         self.scrollArea.setDisabled(True)
 
+        QtCore.QObject.blockSignals(self.fileSelector, True)
         self.fileSelector.clear()
+        QtCore.QObject.blockSignals(self.fileSelector, False)
 
     def fileIndexChanged(self):
+        with Profiling.action('switch world'):
+            self.switchFile()
+
+    def switchFile(self):
         # store the currently selected file's name
         self.selectedFile = 'point' + self.fileSelector.currentText() + '.csv'
 
         # check if a file is already open
         if self.fileLoaded:
-            # if a file is already open, store the changes made and close the file
-            self.storeChanges()
+            # if a file is already open, close it, edits are already in the document
             self.pointEntries.clearTable()
             self.loadSelectedFile()
         else:
@@ -105,39 +138,78 @@ class PointEditorWidget(QtWidgets.QWidget):
 
     def loadSelectedFile(self):
 
-        dataArray = []
+        # load the records for the file the user selected, they are parsed once by the document
+        if self.selectedFile in self.document:
+            dataArray = self.document.records(self.selectedFile)
+
+            # create a point entry container
+            with Profiling.phase('populate', member=self.selectedFile):
+                self.pointEntries.model().setValidation(self.validator, self.selectedFile)
+                self.pointEntries.populate(dataArray)
+
+            self.fileLoaded = True
+            self.currentLoadedFile = self.selectedFile
+            self.graphTimer.start()
+
+    def entriesChanged(self, topLeft, bottomRight, roles=()):
+        # Highlight updates only change the validation roles
+        if roles and Qt.EditRole not in roles:
+            return
 
-        # load the data for the file the user selected
-        for file in self.archiveContents:
-            if file.name == self.selectedFile:
-                data = file.data
-                data = data.decode('shiftjis')
+        rows = self.pointEntries.model().rows
 
-                # split data by row
-                rows = str(data).split()
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            for column in range(topLeft.column(), bottomRight.column() + 1):
+                self.document.setCell(self.currentLoadedFile, row, column, rows[row][column])
 
-                # split rows elements but don't break substrings
-                for row in rows:
-                    row = re.split(''',(?=(?:[^'"]|'[^']*'|"[^"]*")*$)''', row)
-                    dataArray.append(row)
+    def entriesInserted(self, parent, first, last):
+        self.document.insertRecords(self.currentLoadedFile, first, self.pointEntries.model().rows[first:last + 1])
 
-                # create a point entry container
-                self.pointEntries.populate(dataArray)
+    def entriesRemoved(self, parent, first, last):
+        self.document.removeRecords(self.currentLoadedFile, first, last - first + 1)
+
+    def documentChanged(self, change):
+        if self.fileLoaded and change.name == self.currentLoadedFile and change.name in self.document:
+            self.pointEntries.model().syncChange(change, self.document.records(change.name))
+
+        # Route edits of the shown world change its graph as well
+        if self.fileLoaded and RouteInfoDocument.worldName(change.name) == RouteInfoDocument.worldName(self.currentLoadedFile):
+            self.graphTimer.start()
+
+    def validationChanged(self, name, rows):
+        if self.fileLoaded and name == self.currentLoadedFile:
+            self.pointEntries.model().problemsChanged(rows)
 
-                self.fileLoaded = True
-                self.currentLoadedFile = self.selectedFile
+    def updateGraphStatus(self):
+        if not self.fileLoaded:
+            return
+
+        if not self.validator.isReady(self.currentLoadedFile):
+            self.validator.prepare(self.currentLoadedFile)
+            self.pointEntries.model().problemsChanged()
 
-    def storeChanges(self):
-        data = self.pointEntries.saveContents()
-        data = data.encode('shiftjis')
+        graph = self.validator.graphIndex.graph(RouteInfoDocument.worldName(self.currentLoadedFile))
+        report = graph.report()
 
-        for file in self.archiveContents:
-            if str(file.name) == self.currentLoadedFile:
-                file.data = data
+        self.graphStatus.setText('%d unreachable nodes, %d dead paths, %d unresolved references' % (
+            len(report.unreachableNodes), len(report.deadPaths), len(report.unresolved)))
 
-    def getArchiveContents(self):
-        self.storeChanges()
-        return self.archiveContents
+        lines = ['Row %d %s: unreachable' % (row, graph.points[row].nodeName) for row in report.unreachableNodes]
+        lines += ['Path %s: %s' % (graph.routes[row].path, reason) for row, reason in report.deadPaths]
+        lines += ['Row %d %s: unknown %s' % (row, column, token) for row, column, token in report.unresolved]
+        self.graphStatus.setToolTip('\n'.join(lines[:40]))
+
+    def showCell(self, name, row, column):
+        index = self.fileSelector.findText(name[5:-4])
+        if index == -1:
+            return
+
+        self.fileSelector.setCurrentIndex(index)
+
+        modelIndex = self.pointEntries.model().index(row, column)
+        self.pointEntries.setCurrentIndex(modelIndex)
+        self.pointEntries.scrollTo(modelIndex)
+        self.pointEntries.setFocus()
 
     def addRow(self):
         self.pointEntries.addRow()
@@ -154,11 +226,7 @@ class PointEditorWidget(QtWidgets.QWidget):
         with open(fileName, 'rb') as f:
             data = f.read()
 
-        self.pointEntries.saveContents()
-
-        for file in self.archiveContents:
-            if str(file.name) == self.currentLoadedFile:
-                file.data = data
+        self.document.setData(self.currentLoadedFile, data)
 
         self.pointEntries.clearTable()
         self.loadSelectedFile()
@@ -174,89 +242,155 @@ class PointEditorWidget(QtWidgets.QWidget):
             f.write(file.encode('shiftjis'))
 
 
-class PointEntryTable(QtWidgets.QTableWidget):
+class PointEntryTable(EditorModels.EntryViewMixin, QtWidgets.QTableView):
     def __init__(self):
-        QtWidgets.QTableWidget.__init__(self)
+        QtWidgets.QTableView.__init__(self)
+
+        self.entryModel = PointEntryModel(self)
+        self.setModel(self.entryModel)
 
         # Setup Table Properties
-        self.setColumnCount(9)
         self.setAlternatingRowColors(True)
-        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
 
         # Setup Header Bar
         header = self.horizontalHeader()
         header.setStretchLastSection(True)
         header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
-        self.setHorizontalHeaderItem(0, QtWidgets.QTableWidgetItem('ID'))
-        self.setHorizontalHeaderItem(1, QtWidgets.QTableWidgetItem('Node Name'))
-        self.setHorizontalHeaderItem(2, QtWidgets.QTableWidgetItem('Node Flag'))
-        self.setHorizontalHeaderItem(3, QtWidgets.QTableWidgetItem('Node Unlocks'))
-        self.setHorizontalHeaderItem(4, QtWidgets.QTableWidgetItem('Path Unlocks'))
-        self.setHorizontalHeaderItem(5, QtWidgets.QTableWidgetItem('Secret Node Flag'))
-        self.setHorizontalHeaderItem(6, QtWidgets.QTableWidgetItem('Secret Node Unlocks'))
-        self.setHorizontalHeaderItem(7, QtWidgets.QTableWidgetItem('Secret Path Unlocks'))
-        self.setHorizontalHeaderItem(8, QtWidgets.QTableWidgetItem('Revealed Path Connections'))
 
         # Hide Row Numbers
         self.verticalHeader().setVisible(False)
 
     def populate(self, dataArray):
-        i = 0
-        # Iterate through each entry in the data array
-        while i < len(dataArray):
-            pos = self.rowCount()
-            # Create a row for each entry in the array
-            self.insertRow(pos)
-            # Populate the new row with the contents of that entry in the array
-            self.setItem(pos, 0, QtWidgets.QTableWidgetItem(dataArray[i][0]))  # ID
-            self.setItem(pos, 1, QtWidgets.QTableWidgetItem(dataArray[i][1]))  # Node Name
-            self.setItem(pos, 2, QtWidgets.QTableWidgetItem(dataArray[i][2]))  # Node Flag
-            self.setItem(pos, 3, QtWidgets.QTableWidgetItem(dataArray[i][3]))  # Node Unlocks
-            self.setItem(pos, 4, QtWidgets.QTableWidgetItem(dataArray[i][4]))  # Path Unlocks
-            self.setItem(pos, 5, QtWidgets.QTableWidgetItem(dataArray[i][5]))  # Secret Node Flag
-            self.setItem(pos, 6, QtWidgets.QTableWidgetItem(dataArray[i][6]))  # Secret Node Unlocks
-            self.setItem(pos, 7, QtWidgets.QTableWidgetItem(dataArray[i][7]))  # Secret Path Unlocks
-            self.setItem(pos, 8, QtWidgets.QTableWidgetItem(dataArray[i][8]))  # Revealed Path Connections
-            i += 1
+        self.entryModel.populate(dataArray)
 
     def addRow(self):
-        self.insertRow(self.currentRow() + 1)
-
-        # Initialise the row
-        self.setItem(self.currentRow() + 1, 0, QtWidgets.QTableWidgetItem())  # ID
-        self.setItem(self.currentRow() + 1, 1, QtWidgets.QTableWidgetItem())  # Node Name
-        self.setItem(self.currentRow() + 1, 2, QtWidgets.QTableWidgetItem())  # Node Flag
-        self.setItem(self.currentRow() + 1, 3, QtWidgets.QTableWidgetItem())  # Node Unlocks
-        self.setItem(self.currentRow() + 1, 4, QtWidgets.QTableWidgetItem())  # Path Unlocks
-        self.setItem(self.currentRow() + 1, 5, QtWidgets.QTableWidgetItem())  # Secret Node Flag
-        self.setItem(self.currentRow() + 1, 6, QtWidgets.QTableWidgetItem())  # Secret Node Unlocks
-        self.setItem(self.currentRow() + 1, 7, QtWidgets.QTableWidgetItem())  # Secret Path Unlocks
-        self.setItem(self.currentRow() + 1, 8, QtWidgets.QTableWidgetItem())  # Revealed Path Connections
+        ranges = self.selectedRowRanges()
+
+        # Insert as many rows as are selected, below the selection
+        if ranges:
+            self.entryModel.insertRows(ranges[-1][0] + ranges[-1][1], sum(count for first, count in ranges))
+        else:
+            self.entryModel.insertRows(0, 1)
 
     def delRow(self):
-        self.removeRow(self.currentRow())
+        # Remove from the bottom up so the remaining ranges stay valid
+        for first, count in reversed(self.selectedRowRanges()):
+            self.entryModel.removeRows(first, count)
 
     def saveContents(self):
-        outData = []
-
-        row = 0
-        # Iterate through each row of the table
-        while row < self.rowCount():
-            col = 0
-            rowData = []
-            # Iterate through each column for the current row
-            while col < 9:
-                # Store the contents of the column
-                rowData.append(self.item(row, col).text())
-                col += 1
-            # Store the contents of each row
-            rowString = ','.join(rowData)
-            outData.append(rowString)
-            row += 1
-
-        outString = '\r\n'.join(outData)
-        return outString
+        return self.entryModel.saveContents()
+
+    def records(self):
+        return self.entryModel.records()
 
     def clearTable(self):
-        while self.rowCount() > 0:
-            self.removeRow(0)
+        self.entryModel.clear()
+
+
+class PointEntryModel(EditorModels.EntryModelMixin, QtCore.QAbstractTableModel):
+    headers = [
+        'ID',
+        'Node Name',
+        'Node Flag',
+        'Node Unlocks',
+        'Path Unlocks',
+        'Secret Node Flag',
+        'Secret Node Unlocks',
+        'Secret Path Unlocks',
+        'Revealed Path Connections',
+    ]
+
+    emptyRow = RouteInfoDocument.PointRecord._make(('',) * len(headers))
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+
+        # Each row is an immutable PointRecord tuple of its nine column strings
+        self.rows = []
+
+        # Cells with problems are highlighted, results come from the validator's per-row cache
+        self.validator = None
+        self.memberName = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self.rows[index.row()][index.column()]
+
+        elif role == Qt.BackgroundRole or role == Qt.ToolTipRole:
+            return self.validationData(index, role)
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+
+        row = self.rows[index.row()]
+        self.rows[index.row()] = row._replace(**{row._fields[index.column()]: str(value)})
+
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def populate(self, dataArray):
+        self.beginResetModel()
+        self.rows = [RouteInfoDocument.makeRecord(RouteInfoDocument.PointRecord, entry) for entry in dataArray]
+        self.endResetModel()
+
+    def insertRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginInsertRows(parent, row, row + count - 1)
+        self.rows[row:row] = [self.emptyRow] * count
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.rows[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def saveContents(self):
+        outString = '\r\n'.join([','.join(row) for row in self.rows])
+        return outString
+
+    def record(self, row):
+        return self.rows[row]
+
+    def setRecord(self, row, record):
+        self.rows[row] = record
+
+    def records(self):
+        return list(self.rows)
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.memberName = None
+        self.endResetModel()
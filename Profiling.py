@@ -0,0 +1,146 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# Setting this environment variable turns timing on at startup
+ENABLE_VARIABLE = 'ROUTEEDIT_PROFILE'
+PROFILE_DIR_VARIABLE = 'ROUTEEDIT_PROFILE_DIR'
+
+logger = logging.getLogger('RouteEdit.profile')
+
+
+class ActionRecord:
+    def __init__(self, name):
+        self.name = name
+        self.phases = []
+        self.seconds = 0.0
+        self.profilePath = None
+
+    def summary(self):
+        phases = ', '.join('%s %.1f ms' % (name, seconds * 1000) for name, seconds, details in self.phases)
+        text = '%s %.1f ms' % (self.name, self.seconds * 1000)
+
+        if phases:
+            text += ' (' + phases + ')'
+        if self.profilePath:
+            text += ' - profile written to ' + self.profilePath
+
+        return text
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.profileNextAction = False
+        self.profileDir = os.environ.get(PROFILE_DIR_VARIABLE, tempfile.gettempdir())
+
+        # Actions are tracked per thread so background work is timed separately
+        self.local = threading.local()
+        self.lastAction = None
+        self.listeners = []
+
+        self.setEnabled(bool(os.environ.get(ENABLE_VARIABLE)))
+
+    @property
+    def currentAction(self):
+        return getattr(self.local, 'currentAction', None)
+
+    @currentAction.setter
+    def currentAction(self, record):
+        self.local.currentAction = record
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+
+        # Events go to stderr unless the application configured logging itself
+        if enabled and not logger.handlers and not logging.getLogger().handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def logEvent(self, event, **fields):
+        fields['event'] = event
+        logger.info(json.dumps(fields, ensure_ascii=False, sort_keys=True))
+
+    @contextlib.contextmanager
+    def action(self, name):
+        # Nested actions, e.g. a world switch while opening, are timed as phases of the outer one
+        if self.currentAction is not None:
+            with self.phase(name):
+                yield
+            return
+
+        if not self.enabled and not self.profileNextAction:
+            yield
+            return
+
+        record = ActionRecord(name)
+        profiler = None
+
+        if self.profileNextAction:
+            self.profileNextAction = False
+            profiler = cProfile.Profile()
+
+        self.currentAction = record
+        start = time.perf_counter()
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+
+            yield
+
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            record.seconds = time.perf_counter() - start
+            self.currentAction = None
+
+            if profiler is not None:
+                fileName = 'routeedit-%s-%s.prof' % (name.replace(' ', '-'), time.strftime('%Y%m%d-%H%M%S'))
+                record.profilePath = os.path.join(self.profileDir, fileName)
+                profiler.dump_stats(record.profilePath)
+
+            self.lastAction = record
+            self.logEvent('action', name=name, ms=round(record.seconds * 1000, 3), profile=record.profilePath)
+
+            for listener in self.listeners:
+                listener(record)
+
+    @contextlib.contextmanager
+    def phase(self, name, **details):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            seconds = time.perf_counter() - start
+
+            if self.currentAction is not None:
+                self.currentAction.phases.append((name, seconds, details))
+
+            self.logEvent('phase', name=name, ms=round(seconds * 1000, 3),
+                          action=self.currentAction.name if self.currentAction else None, **details)
+
+
+instrumentation = Instrumentation()
+
+
+def action(name):
+    return instrumentation.action(name)
+
+
+def phase(name, **details):
+    return instrumentation.phase(name, **details)
@@ -1,29 +1,62 @@
+import BackgroundTask
+import Icons
 import PointWidget
 import RouteWidget
 import BossPathWidget
-import SarcLib
+import CompareWidget
+import EditJournal
+import os
+import Profiling
+import RouteGraph
+import RouteInfoDocument
+import SearchIndex
+import SearchWidget
 import sys
+import UndoHistory
+import Validation
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 Qt = QtCore.Qt
 
 
 class MainWindow(QtWidgets.QMainWindow):
+    actionTimed = QtCore.pyqtSignal(object)
+
     def __init__(self):
         super(MainWindow, self).__init__()
         self.setWindowTitle('RouteEdit')
         self.setGeometry(500, 500, 1500, 750)
 
-        self.saveFile = QtWidgets.QAction(QtGui.QIcon('RouteEditData/icons/save.png'), '&Save', self)
-        self.saveAsFile = QtWidgets.QAction(QtGui.QIcon('RouteEditData/icons/saveAs.png'), '&Save As', self)
-        self.openFile = QtWidgets.QAction(QtGui.QIcon('RouteEditData/icons/folder.png'), '&Open', self)
-        self.closeFile = QtWidgets.QAction(QtGui.QIcon('RouteEditData/icons/close.png'), '&Close', self)
+        self.saveFile = QtWidgets.QAction(Icons.icon('save'), '&Save', self)
+        self.saveAsFile = QtWidgets.QAction(Icons.icon('saveAs'), '&Save As', self)
+        self.openFile = QtWidgets.QAction(Icons.icon('folder'), '&Open', self)
+        self.closeFile = QtWidgets.QAction(Icons.icon('close'), '&Close', self)
+        self.compareFile = QtWidgets.QAction('C&ompare With...', self)
+        self.enableTiming = QtWidgets.QAction('&Time Actions', self)
+        self.profileNextAction = QtWidgets.QAction('&Profile Next Action', self)
 
         self.editor = EditorTabWidget()
+        self.searchPanel = SearchWidget.SearchPanel()
+        self.searchDock = QtWidgets.QDockWidget('Search', self)
+        self.comparePanel = CompareWidget.ComparePanel()
+        self.compareDock = QtWidgets.QDockWidget('Compare', self)
+
+        # Every open archive has its own history, the group's actions follow the current one
+        self.undoGroup = QtWidgets.QUndoGroup(self)
 
         self.initUi()
 
         self.currentFilePath = ''
+        self.savedHash = None
+        self.document = None
+        self.currentTask = None
+        self.journal = None
+
+        # set while an archive is reopened to recover its journal, so it isn't asked about twice
+        self.recoverPath = None
+
+        # journals left behind by a crash are offered once the window is up
+        QtCore.QTimer.singleShot(0, self.offerRecovery)
 
     def initUi(self):
 
@@ -45,20 +78,25 @@ class MainWindow(QtWidgets.QMainWindow):
         self.saveFile.setStatusTip('Save Changes')
         self.saveAsFile.setStatusTip('Save As')
         self.closeFile.setStatusTip('Close the current file')
+        self.compareFile.setStatusTip('List the differences between the open file and another one')
 
         self.openFile.triggered.connect(self.loadSarc)
         self.saveFile.triggered.connect(self.saveSarc)
         self.saveAsFile.triggered.connect(self.saveSarcAs)
         self.closeFile.triggered.connect(self.closeSarc)
+        self.compareFile.triggered.connect(self.compareSarc)
 
         self.saveFile.setDisabled(True)
         self.saveAsFile.setDisabled(True)
         self.closeFile.setDisabled(True)
+        self.compareFile.setDisabled(True)
 
         fileMenu.addAction(self.openFile)
         fileMenu.addAction(self.saveFile)
         fileMenu.addAction(self.saveAsFile)
         fileMenu.addAction(self.closeFile)
+        fileMenu.addSeparator()
+        fileMenu.addAction(self.compareFile)
 
         toolBar.addAction(self.openFile)
         toolBar.addSeparator()
@@ -67,118 +105,448 @@ class MainWindow(QtWidgets.QMainWindow):
         toolBar.addSeparator()
         toolBar.addAction(self.closeFile)
 
+        # setup edit menu
+        editMenu = mainMenu.addMenu('&Edit')
+
+        undoAction = self.undoGroup.createUndoAction(self, '&Undo')
+        redoAction = self.undoGroup.createRedoAction(self, '&Redo')
+        undoAction.setShortcut(QtGui.QKeySequence.Undo)
+        redoAction.setShortcut(QtGui.QKeySequence.Redo)
+
+        editMenu.addAction(undoAction)
+        editMenu.addAction(redoAction)
+        editMenu.addSeparator()
+
+        # setup search panel, hidden until it is asked for
+
+        self.searchDock.setObjectName('searchDock')
+        self.searchDock.setWidget(self.searchPanel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.searchDock)
+        self.searchDock.hide()
+
+        findAction = self.searchDock.toggleViewAction()
+        findAction.setText('&Find and Replace')
+        findAction.setShortcut('Ctrl+F')
+        findAction.setStatusTip('Search every world for a node, path, action or sound')
+        editMenu.addAction(findAction)
+
+        self.searchDock.visibilityChanged.connect(self.searchVisibilityChanged)
+        self.searchPanel.matchActivated.connect(self.editor.showMatch)
+
+        # setup compare panel, shown once another file is compared
+
+        self.compareDock.setObjectName('compareDock')
+        self.compareDock.setWidget(self.comparePanel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.compareDock)
+        self.compareDock.hide()
+
+        self.comparePanel.entryActivated.connect(self.editor.showMatch)
+        self.comparePanel.mergeRequested.connect(self.mergeSarc)
+
+        # setup debug menu
+        debugMenu = mainMenu.addMenu('&Debug')
+
+        self.enableTiming.setCheckable(True)
+        self.enableTiming.setChecked(Profiling.instrumentation.enabled)
+        self.enableTiming.setStatusTip('Log the time taken by each phase of every action')
+        self.enableTiming.toggled.connect(Profiling.instrumentation.setEnabled)
+
+        self.profileNextAction.setStatusTip('Write a cProfile dump of the next action')
+        self.profileNextAction.triggered.connect(self.requestProfile)
+
+        debugMenu.addAction(self.enableTiming)
+        debugMenu.addAction(self.profileNextAction)
+
+        # show the breakdown of the last timed action in the status bar, actions may finish on worker threads
+        self.actionTimed.connect(self.showActionTiming)
+        Profiling.instrumentation.listeners.append(self.actionTimed.emit)
+
         self.setCentralWidget(self.editor)
 
+    def requestProfile(self):
+        Profiling.instrumentation.profileNextAction = True
+        self.statusBar().showMessage('The next action will be profiled')
+
+    def showActionTiming(self, record):
+        self.statusBar().showMessage(record.summary())
+
+    def searchVisibilityChanged(self, visible):
+        if visible:
+            self.searchPanel.queryEdit.setFocus()
+            self.searchPanel.queryEdit.selectAll()
+
+    def offerRecovery(self):
+        for journalPath, archivePath in EditJournal.pendingJournals():
+            if not os.path.isfile(archivePath):
+                continue
+
+            recoverDialog = QtWidgets.QMessageBox
+            ret = recoverDialog.question(self, '', 'RouteEdit closed with unsaved changes to %s, recover them?' % archivePath,
+                                         recoverDialog.Yes | recoverDialog.No)
+
+            if ret == recoverDialog.Yes:
+                self.recoverPath = archivePath
+                self.openArchive(archivePath)
+                return
+
+            EditJournal.discard(journalPath)
+
     def loadSarc(self):
         fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Open file', '', 'SARC files (*.sarc)')[0]
 
         if fileName == '':
             return
 
-        self.currentFilePath = fileName
+        self.openArchive(fileName)
 
-        with open(fileName, 'rb') as fileObj:
-            data = fileObj.read()
+    def openArchive(self, fileName):
+        # map the archive, hash it and parse the first world on a worker thread
+        task = BackgroundTask.BackgroundTask(RouteInfoDocument.loadDocument, fileName)
+        task.signals.finished.connect(lambda result: self.archiveLoaded(fileName, *result))
+        self.runTask(task, 'Opening ' + os.path.basename(fileName))
 
-        archive = SarcLib.SARC_Archive(data)
-        archive.load(data)
+    def archiveLoaded(self, fileName, document, savedHash):
+        with Profiling.action('populate'):
+            if self.document is not None:
+                self.closeDocument()
 
-        self.editor.loadData(archive.contents)
+            self.currentFilePath = fileName
+            self.document = document
 
-        self.saveFile.setDisabled(False)
-        self.saveAsFile.setDisabled(False)
-        self.closeFile.setDisabled(False)
-        self.editor.setDisabled(False)
+            # remember the content on disk so unchanged saves can be skipped
+            self.savedHash = savedHash
 
-    def saveSarc(self):
-        arcContents = self.editor.getDataFromWidgets()
-        newArchive = SarcLib.SARC_Archive(endianness='<')
+            self.editor.loadData(self.document)
+            self.searchPanel.loadData(self.editor.searchIndex, self.editor.history)
 
-        for file in arcContents:
-            newArchive.addFile(file)
+            self.undoGroup.addStack(self.editor.history.stack)
+            self.undoGroup.setActiveStack(self.editor.history.stack)
 
-        outFile = newArchive.save()[0]
+            with Profiling.phase('journal'):
+                self.startJournal(fileName, savedHash)
 
-        with open(self.currentFilePath, 'wb+') as f:
-            f.write(outFile)
+    def startJournal(self, fileName, savedHash):
+        recoverPath, self.recoverPath = self.recoverPath, None
 
-    def saveSarcAs(self):
-        arcContents = self.editor.getDataFromWidgets()
-        newArchive = SarcLib.SARC_Archive(endianness='<')
+        directory = EditJournal.journalDir()
+        if not directory:
+            return
+
+        path = EditJournal.journalPath(fileName, directory)
+        journal = EditJournal.readJournal(path)
+
+        if journal is not None and EditJournal.hasChanges(journal[2]):
+            recoverDialog = QtWidgets.QMessageBox
+
+            # edits only apply to the content they were made on
+            if journal[1] != savedHash:
+                self.statusBar().showMessage('Unsaved changes to %s were discarded, the file changed since' % fileName)
+
+            elif recoverPath == os.path.abspath(fileName) or recoverDialog.question(
+                    self, '', '%s has unsaved changes from a previous session, recover them?' % fileName,
+                    recoverDialog.Yes | recoverDialog.No) == recoverDialog.Yes:
+
+                # recovered edits undo in one step
+                with self.editor.history.macro('Recover unsaved changes'):
+                    EditJournal.replay(self.document, journal[2])
+
+        # the new journal starts from the recovered state and replaces the old one
+        self.journal = EditJournal.EditJournal(path, fileName, savedHash)
+        self.journal.attach(self.document)
+
+    def compareSarc(self):
+        fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Compare with', '', 'SARC files (*.sarc)')[0]
+
+        if fileName == '':
+            return
+
+        # the other archive is opened like the main one, its parse cache makes repeated comparisons quick
+        task = BackgroundTask.BackgroundTask(RouteInfoDocument.loadDocument, fileName)
+        task.signals.finished.connect(lambda result: self.compareLoaded(fileName, result[0]))
+        self.runTask(task, 'Opening ' + os.path.basename(fileName))
+
+    def compareLoaded(self, fileName, document):
+        with Profiling.action('compare'):
+            self.comparePanel.loadData(self.document, document, fileName, self.editor.history)
+
+        self.compareDock.show()
+
+    def mergeSarc(self):
+        fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Select the file both were edited from', '',
+                                                         'SARC files (*.sarc)')[0]
 
-        for file in arcContents:
-            newArchive.addFile(file)
+        if fileName == '':
+            return
+
+        task = BackgroundTask.BackgroundTask(RouteInfoDocument.loadDocument, fileName)
+        task.signals.finished.connect(lambda result: self.mergeBaseLoaded(result[0]))
+        self.runTask(task, 'Opening ' + os.path.basename(fileName))
 
-        outFile = newArchive.save()[0]
+    def mergeBaseLoaded(self, baseDocument):
+        try:
+            with Profiling.action('merge'):
+                self.comparePanel.merge(baseDocument)
+        finally:
+            baseDocument.storeParseCache()
+            baseDocument.close()
+
+    def saveSarc(self):
+        # nothing was edited since the file was opened or last saved
+        if not self.document.isModified():
+            return
 
+        self.saveArchive(self.currentFilePath)
+
+    def saveSarcAs(self):
         fileName = QtWidgets.QFileDialog.getSaveFileName(self, 'Save file', '', 'SARC files (*.sarc)')[0]
 
         if fileName == '':
             return
 
-        with open(fileName, 'wb+') as f:
-            f.write(outFile)
+        self.saveArchive(fileName)
+
+    def saveArchive(self, fileName):
+        # saving over the open file can skip the write if the content on disk is unchanged
+        sameFile = os.path.abspath(fileName) == os.path.abspath(self.currentFilePath)
+
+        with Profiling.action('save'):
+            with Profiling.phase('snapshot'):
+                files = self.document.snapshot(fileName)
+
+        task = BackgroundTask.BackgroundTask(RouteInfoDocument.saveFiles, files, fileName,
+                                             self.savedHash if sameFile else None)
+        if sameFile:
+            task.signals.finished.connect(lambda savedHash: self.archiveSaved(savedHash, files))
+
+        # saves work on a snapshot, so their progress doesn't block the editor
+        self.runTask(task, 'Saving ' + os.path.basename(fileName), modal=False)
+
+    def archiveSaved(self, savedHash, files):
+        if savedHash != self.savedHash:
+            self.document.rebaseParseCache(savedHash, os.path.getsize(self.currentFilePath), files)
+
+        self.savedHash = savedHash
+        self.document.markSaved(files)
+
+        # the journal only has to hold what the saved archive doesn't
+        if self.journal is not None:
+            self.journal.compact(savedHash)
+
+    def runTask(self, task, label, modal=True):
+        self.currentTask = task
+        self.updateActions()
+
+        progress = [0, 0]
+        progressDialogs = []
+
+        def showProgressDialog():
+            # short tasks finish before the dialog would appear, so it is only built for slow ones
+            if self.currentTask is not task:
+                return
+
+            progressDialog = QtWidgets.QProgressDialog(label, 'Cancel', 0, progress[1], self)
+            progressDialog.setWindowModality(Qt.WindowModal if modal else Qt.NonModal)
+            progressDialog.setAutoClose(False)
+            progressDialog.setAutoReset(False)
+            progressDialog.setValue(progress[0])
+            progressDialog.canceled.connect(task.cancel)
+            progressDialog.show()
+            progressDialogs.append(progressDialog)
+
+        def updateProgress(done, total):
+            progress[:] = done, total
+
+            for progressDialog in progressDialogs:
+                progressDialog.setMaximum(total)
+                progressDialog.setValue(done)
+
+        def taskEnded(*args):
+            self.currentTask = None
+
+            for progressDialog in progressDialogs:
+                progressDialog.close()
+                progressDialog.deleteLater()
+
+            self.updateActions()
+
+        task.signals.progress.connect(updateProgress)
+        task.signals.failed.connect(self.showTaskError)
+        task.signals.cancelled.connect(lambda: self.statusBar().showMessage(label + ' cancelled'))
+
+        # widgets are only updated once the task is done, on the GUI thread
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(taskEnded)
+
+        QtCore.QTimer.singleShot(250, showProgressDialog)
+        task.start()
+
+    def showTaskError(self, error):
+        print(error, file=sys.stderr)
+        QtWidgets.QMessageBox.critical(self, 'RouteEdit', error.strip().splitlines()[-1])
+
+    def updateActions(self):
+        busy = self.currentTask is not None
+        fileOpen = self.document is not None
+
+        self.openFile.setDisabled(busy)
+        self.saveFile.setDisabled(busy or not fileOpen)
+        self.saveAsFile.setDisabled(busy or not fileOpen)
+        self.closeFile.setDisabled(busy or not fileOpen)
+        self.compareFile.setDisabled(busy or not fileOpen)
+        self.comparePanel.mergeButton.setDisabled(busy)
+
+        # the editor stays usable while a save runs, its dialog is not modal and it works on a snapshot
+        if self.editor.isEnabled() != fileOpen:
+            self.editor.setEnabled(fileOpen)
+
+    def closeEvent(self, event):
+        # let a running save finish or clean up its temp file before the process exits
+        if self.currentTask is not None:
+            self.currentTask.cancel()
+            QtCore.QThreadPool.globalInstance().waitForDone()
+
+        # members parsed in this session are decoded from the cache next time
+        if self.document is not None:
+            self.comparePanel.closeData()
+            self.document.storeParseCache()
+
+            # unsaved edits stay in the journal and are offered again on the next launch
+            if self.journal is not None:
+                self.journal.close(keep=self.document.isModified())
+                self.journal = None
+
+        QtWidgets.QMainWindow.closeEvent(self, event)
 
     def closeSarc(self):
         closeDialog = QtWidgets.QMessageBox
         ret = closeDialog.question(self, '', 'Close the current file?', closeDialog.Yes | closeDialog.No)
 
         if ret == closeDialog.Yes:
-            self.editor.closeFile()
-            self.editor.setDisabled(True)
-            self.saveFile.setDisabled(True)
-            self.saveAsFile.setDisabled(True)
-            self.closeFile.setDisabled(True)
+            self.closeDocument()
 
             self.currentFilePath = ''
+            self.savedHash = None
+            self.document = None
+
+            self.updateActions()
+
+    def closeDocument(self):
+        self.undoGroup.removeStack(self.editor.history.stack)
+        self.searchPanel.closeData()
+        self.comparePanel.closeData()
+        self.compareDock.hide()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        self.editor.closeFile()
+        self.document.storeParseCache()
+        self.document.close()
 
 
 class EditorTabWidget(QtWidgets.QTabWidget):
+    # Editors are built when their tab is first shown, only the first one is needed to show the window
+    editorTypes = (
+        (PointWidget.PointEditorWidget, 'Node Unlocks'),
+        (RouteWidget.RouteEditorWidget, 'Path Settings'),
+        (BossPathWidget.BossPathEditorWidget, 'Boss Path'),
+    )
+
     def __init__(self, parent=None):
         QtWidgets.QTabWidget.__init__(self, parent)
 
-        self.pointEditor = PointWidget.PointEditorWidget()
-        self.routeEditor = RouteWidget.RouteEditorWidget()
-        self.bossPathEditor = BossPathWidget.BossPathEditorWidget()
-        self.addTab(self.pointEditor, 'Node Unlocks')
-        self.addTab(self.routeEditor, 'Path Settings')
-        self.addTab(self.bossPathEditor, 'Boss Path')
+        self.editors = [None] * len(self.editorTypes)
 
-    def loadData(self, archiveContents):
-        self.closeFile()
+        for editorType, label in self.editorTypes:
+            page = QtWidgets.QWidget()
+            QtWidgets.QVBoxLayout(page).setContentsMargins(0, 0, 0, 0)
+            self.addTab(page, label)
 
-        pointFiles = []
-        routeFiles = []
-        bossPathFiles = []
-
-        for file in archiveContents:
-            if not str(file.name).find('point'):
-                pointFiles.append(file)
-            elif not str(file.name).find('route'):
-                routeFiles.append(file)
-            elif not str(file.name).find('worldIn') or not str(file.name).find('toCastle'):
-                bossPathFiles.append(file)
-            else:
-                print('Unknown File')
-                print(file.name)
-
-        self.pointEditor.loadData(pointFiles)
-        self.routeEditor.loadData(routeFiles)
-        self.bossPathEditor.loadData(bossPathFiles)
+        self.document = None
+        self.graphIndex = None
+        self.validator = None
+        self.searchIndex = None
+        self.history = None
 
-    def closeFile(self):
-        self.pointEditor.closeData()
-        self.routeEditor.closeData()
-        self.bossPathEditor.closeData()
+        self.currentChanged.connect(self.editorAt)
+        self.editorAt(self.currentIndex())
+
+    @property
+    def pointEditor(self):
+        return self.editorAt(0)
 
-    def getDataFromWidgets(self):
-        pointFiles = self.pointEditor.getArchiveContents()
-        routeFiles = self.routeEditor.getArchiveContents()
-        bossPathFiles = self.bossPathEditor.getArchiveContents()
+    @property
+    def routeEditor(self):
+        return self.editorAt(1)
 
-        archiveContents = pointFiles + routeFiles + bossPathFiles
+    @property
+    def bossPathEditor(self):
+        return self.editorAt(2)
 
-        return archiveContents
+    def editorAt(self, index):
+        editor = self.editors[index]
+
+        if editor is None:
+            editorType = self.editorTypes[index][0]
+
+            with Profiling.phase('build editor', editor=editorType.__name__):
+                editor = editorType()
+                self.widget(index).layout().addWidget(editor)
+
+            self.editors[index] = editor
+
+            # An archive opened before the tab was first shown is loaded into it now
+            if self.document is not None:
+                editor.loadData(self.document, self.validator)
+
+        return editor
+
+    def loadData(self, document):
+        self.closeFile()
+
+        for name in document.unknownNames():
+            print('Unknown File')
+            print(name)
+
+        # shared by the editors, both follow the document's edits
+        self.graphIndex = RouteGraph.GraphIndex(document)
+        self.validator = Validation.Validator(document, self.graphIndex)
+        self.searchIndex = SearchIndex.SearchIndex(document)
+        self.history = UndoHistory.EditHistory(document)
+        self.document = document
+
+        for editor in self.editors:
+            if editor is not None:
+                editor.loadData(document, self.validator)
+
+    def closeFile(self):
+        for editor in self.editors:
+            if editor is not None:
+                editor.closeData()
+
+        if self.validator is not None:
+            self.validator.close()
+            self.graphIndex.close()
+            self.searchIndex.close()
+            self.history.close()
+            self.document = None
+            self.validator = None
+            self.graphIndex = None
+            self.searchIndex = None
+            self.history = None
+
+    def showMatch(self, name, row, column):
+        tabs = {
+            RouteInfoDocument.POINT: 0,
+            RouteInfoDocument.ROUTE: 1,
+            RouteInfoDocument.WORLD_IN: 2,
+            RouteInfoDocument.TO_CASTLE: 2,
+        }
+
+        tab = tabs[RouteInfoDocument.memberKind(name)]
+        self.setCurrentIndex(tab)
+        self.editorAt(tab).showCell(name, row, column)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,366 @@
+import argparse
+import ArchiveDiff
+import ArchiveIO
+import concurrent.futures
+import CsvTokenizer
+import ntpath
+import os
+import RouteGraph
+import RouteInfoDocument
+import SarcLib
+import sys
+import time
+import Translations
+
+# Expected column count for each kind of table
+COLUMN_COUNTS = {
+    RouteInfoDocument.POINT: len(RouteInfoDocument.PointRecord._fields),
+    RouteInfoDocument.ROUTE: len(RouteInfoDocument.RouteRecord._fields),
+}
+
+# Merges reporting a conflict fail, the merged archive is still written with our values
+CONFLICT_PREFIX = 'conflict '
+
+# Extractions skipping a member fail, the other members are still written
+SKIPPED_PREFIX = 'skipped '
+
+
+def archiveStem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def checkMember(document, name):
+    problems = []
+    kind = document.kind(name)
+
+    if kind is None:
+        return problems
+
+    data = document.data(name)
+
+    try:
+        bytes(data).decode('shiftjis')
+    except UnicodeDecodeError as e:
+        return ['%s: not valid Shift-JIS (%s)' % (name, e)]
+
+    if kind in COLUMN_COUNTS:
+        for rowNumber, row in enumerate(CsvTokenizer.iterRows(data), 1):
+            if len(row) != COLUMN_COUNTS[kind]:
+                problems.append('%s:%d: expected %d columns, found %d' % (name, rowNumber, COLUMN_COUNTS[kind], len(row)))
+
+    if kind == RouteInfoDocument.ROUTE:
+        actions = Translations.actions()
+        sounds = Translations.soundEffects()
+
+        for rowNumber, record in enumerate(document.records(name), 1):
+            if actions.indexOfJp(record.action) == -1:
+                problems.append('%s:%d: unknown action %s' % (name, rowNumber, record.action))
+            if sounds.indexOfJp(record.sound) == -1:
+                problems.append('%s:%d: unknown sound %s' % (name, rowNumber, record.sound))
+
+    elif kind == RouteInfoDocument.WORLD_IN or kind == RouteInfoDocument.TO_CASTLE:
+        if '' in document.records(name):
+            problems.append('%s: boss path contains an empty node' % name)
+
+    return problems
+
+
+def memberPath(targetDir, name):
+    # Member names come from the archive, absolute names, drive prefixes and .. segments must not leave the target folder
+    if os.path.isabs(name) or ntpath.isabs(name) or ntpath.splitdrive(name)[0]:
+        return None
+
+    targetDir = os.path.realpath(targetDir)
+    path = os.path.realpath(os.path.join(targetDir, name))
+
+    if path == targetDir or os.path.commonpath([targetDir, path]) != targetDir:
+        return None
+
+    return path
+
+
+def extractArchive(path, outDir):
+    document = RouteInfoDocument.RouteInfoDocument.fromFile(path)
+    targetDir = os.path.join(outDir, archiveStem(path))
+    os.makedirs(targetDir, exist_ok=True)
+
+    messages = []
+    count = 0
+
+    for name in document.names():
+        filePath = memberPath(targetDir, name)
+        if filePath is None:
+            messages.append(SKIPPED_PREFIX + '%s: outside of %s' % (name, targetDir))
+            continue
+
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+
+        with open(filePath, 'wb') as f:
+            f.write(document.data(name))
+
+        count += 1
+
+    document.close()
+    return messages + ['extracted %d files to %s' % (count, targetDir)]
+
+
+def checkGraph(document, world):
+    problems = []
+    pointName = RouteInfoDocument.POINT + world
+    routeName = RouteInfoDocument.ROUTE + world
+
+    graph = RouteGraph.WorldGraph(document.records(pointName), document.records(routeName) if routeName in document else [])
+    report = graph.report()
+
+    for row in report.unreachableNodes:
+        problems.append('%s:%d: node %s is unreachable' % (pointName, row + 1, graph.points[row].nodeName))
+    for row, reason in report.deadPaths:
+        problems.append('%s:%d: dead path %s, %s' % (routeName, row + 1, graph.routes[row].path, reason))
+    for row, column, token in report.unresolved:
+        problems.append('%s:%d: %s references unknown %s' % (pointName, row + 1, column, token))
+
+    return problems
+
+
+def validateArchive(path, parseWorkers=1, graph=False):
+    document = RouteInfoDocument.RouteInfoDocument.fromFile(path, cacheSize=None)
+    problems = []
+
+    # Otherwise members are parsed one at a time as they are checked
+    if parseWorkers != 1:
+        document.parseAll(parseWorkers)
+
+    for name in document.names():
+        problems.extend(checkMember(document, name))
+
+    if graph:
+        for name in document.names(RouteInfoDocument.POINT):
+            problems.extend(checkGraph(document, RouteInfoDocument.worldName(name)))
+
+    document.close()
+    return problems
+
+
+def patchArchive(path, csvDir, outDir=None):
+    document = RouteInfoDocument.RouteInfoDocument.fromFile(path)
+    patched = []
+
+    for name in document.names():
+        csvPath = os.path.join(csvDir, name)
+        if os.path.isfile(csvPath):
+            with open(csvPath, 'rb') as f:
+                data = f.read()
+
+            if data != bytes(document.data(name)):
+                document.setData(name, data)
+                patched.append(name)
+
+    if not patched:
+        document.close()
+        return ['nothing to patch']
+
+    outPath = path if outDir is None else os.path.join(outDir, os.path.basename(path))
+    document.detach()
+    ArchiveIO.saveArchive(outPath, document.files())
+    document.close()
+
+    return ['patched %s into %s' % (', '.join(patched), outPath)]
+
+
+def repackArchive(sourceDir, outPath):
+    files = []
+
+    for root, dirs, names in os.walk(sourceDir):
+        for name in names:
+            filePath = os.path.join(root, name)
+            with open(filePath, 'rb') as f:
+                data = f.read()
+            files.append(SarcLib.File(os.path.relpath(filePath, sourceDir).replace(os.sep, '/'), data))
+
+    ArchiveIO.saveArchive(outPath, files)
+    return ['packed %d files into %s' % (len(files), outPath)]
+
+
+def columnName(name, column):
+    kind = RouteInfoDocument.memberKind(name)
+
+    if kind == RouteInfoDocument.POINT:
+        return RouteInfoDocument.PointRecord._fields[column]
+    elif kind == RouteInfoDocument.ROUTE:
+        return RouteInfoDocument.RouteRecord._fields[column]
+
+    return 'node'
+
+
+def cellValue(record, column):
+    return record[column] if isinstance(record, tuple) else record
+
+
+def recordText(record):
+    return ','.join(record) if isinstance(record, tuple) else record
+
+
+def diffArchives(path, otherPath):
+    document = RouteInfoDocument.RouteInfoDocument.fromFile(path)
+    otherDocument = RouteInfoDocument.RouteInfoDocument.fromFile(otherPath)
+    messages = []
+
+    try:
+        diffs = ArchiveDiff.diffDocuments(document, otherDocument)
+    finally:
+        document.close()
+        otherDocument.close()
+
+    for diff in diffs:
+        if not diff.rows:
+            messages.append('%s: %s' % (diff.name, diff.status))
+
+        # Rows are numbered from 1, removed rows by the first archive and the others by the second
+        for row in diff.rows:
+            if row.type == ArchiveDiff.ROW_CHANGED:
+                for column in row.columns:
+                    messages.append('%s:%d: %s %s -> %s' % (diff.name, row.newRow + 1, columnName(diff.name, column),
+                                                           cellValue(row.old, column), cellValue(row.new, column)))
+            elif row.type == ArchiveDiff.ROW_INSERTED:
+                messages.append('%s:%d: inserted %s' % (diff.name, row.newRow + 1, recordText(row.new)))
+            else:
+                messages.append('%s:%d: removed %s' % (diff.name, row.oldRow + 1, recordText(row.old)))
+
+    return messages or ['no differences with %s' % otherPath]
+
+
+def mergeArchives(path, basePath, otherPath, outPath):
+    # Changes from base to other are merged into path, conflicting cells keep the values of path
+    base = RouteInfoDocument.RouteInfoDocument.fromFile(basePath)
+    document = RouteInfoDocument.RouteInfoDocument.fromFile(path)
+    otherDocument = RouteInfoDocument.RouteInfoDocument.fromFile(otherPath)
+
+    try:
+        merge = ArchiveDiff.mergeDocuments(base, document, otherDocument)
+        ArchiveDiff.applyMerge(document, merge)
+
+        document.detach()
+        ArchiveIO.saveArchive(outPath, document.files())
+    finally:
+        base.close()
+        document.close()
+        otherDocument.close()
+
+    messages = ['merged %d files from %s into %s' % (len(merge.updates), otherPath, outPath)]
+
+    for conflict in merge.conflicts:
+        if conflict.row is None:
+            messages.append(CONFLICT_PREFIX + '%s: added, removed or changed on both sides' % conflict.name)
+        elif conflict.column is None:
+            messages.append(CONFLICT_PREFIX + '%s:%d: rows inserted or removed on both sides' % (conflict.name, conflict.row + 1))
+        else:
+            messages.append(CONFLICT_PREFIX + '%s:%d: %s is %s here and %s there' % (
+                conflict.name, conflict.row + 1, columnName(conflict.name, conflict.column),
+                cellValue(conflict.ours, conflict.column), cellValue(conflict.theirs, conflict.column)))
+
+    return messages
+
+
+def runJob(job):
+    function, path = job[0], job[1]
+    start = time.perf_counter()
+
+    try:
+        messages = function(*job[1:])
+        failed = ((function is validateArchive and bool(messages)) or
+                  (function is mergeArchives and any(message.startswith(CONFLICT_PREFIX) for message in messages)) or
+                  (function is extractArchive and any(message.startswith(SKIPPED_PREFIX) for message in messages)))
+    except Exception as e:
+        messages = ['%s: %s' % (type(e).__name__, e)]
+        failed = True
+
+    return path, time.perf_counter() - start, messages, failed
+
+
+def runJobs(jobs, workers):
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield runJob(job)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runJob, job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def buildJobs(args):
+    if args.command == 'extract':
+        return [(extractArchive, path, args.output) for path in args.archives]
+
+    elif args.command == 'validate':
+        return [(validateArchive, path, args.parse_jobs or None, args.graph) for path in args.archives]
+
+    elif args.command == 'patch':
+        return [(patchArchive, path, args.csv, args.output) for path in args.archives]
+
+    elif args.command == 'diff':
+        return [(diffArchives, args.archive, args.other)]
+
+    elif args.command == 'merge':
+        return [(mergeArchives, args.archive, args.base, args.other, args.output or args.archive)]
+
+    else:
+        return [(repackArchive, args.directory, args.output)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='RouteEditCli', description='Batch process RouteInfo.sarc files without the editor')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    extract = subparsers.add_parser('extract', help='write every archive member to a folder')
+    extract.add_argument('archives', nargs='+')
+    extract.add_argument('-o', '--output', default='.', help='folder to extract into, one subfolder per archive')
+
+    validate = subparsers.add_parser('validate', help='check that every csv file parses')
+    validate.add_argument('archives', nargs='+')
+    validate.add_argument('-p', '--parse-jobs', type=int, default=1,
+                          help='worker processes parsing the members of each archive, 0 uses every cpu')
+    validate.add_argument('--graph', action='store_true', help='also report unreachable nodes, dead paths and unknown references')
+
+    patch = subparsers.add_parser('patch', help='replace archive members with csv files from a folder')
+    patch.add_argument('archives', nargs='+')
+    patch.add_argument('--csv', required=True, help='folder of csv files named like the archive members')
+    patch.add_argument('-o', '--output', help='folder for the patched archives, defaults to patching in place')
+
+    repack = subparsers.add_parser('repack', help='pack a folder of files into an archive')
+    repack.add_argument('directory')
+    repack.add_argument('-o', '--output', required=True, help='archive to write')
+
+    diff = subparsers.add_parser('diff', help='list the changed cells, rows and files between two archives')
+    diff.add_argument('archive')
+    diff.add_argument('other')
+
+    merge = subparsers.add_parser('merge', help='merge the changes another archive made to a common base')
+    merge.add_argument('base', help='archive both were edited from')
+    merge.add_argument('archive', help='archive to merge into, its values win conflicts')
+    merge.add_argument('other', help='archive whose changes are merged')
+    merge.add_argument('-o', '--output', help='archive to write, defaults to merging in place')
+
+    args = parser.parse_args(argv)
+
+    if getattr(args, 'output', None) and args.command == 'patch':
+        os.makedirs(args.output, exist_ok=True)
+
+    jobs = buildJobs(args)
+    failures = 0
+    totalStart = time.perf_counter()
+
+    for path, seconds, messages, failed in runJobs(jobs, max(args.jobs or 1, 1)):
+        print('%s: %s (%.1f ms)' % (path, 'FAILED' if failed else 'ok', seconds * 1000))
+        for message in messages:
+            print('    ' + message)
+        failures += failed
+
+    print('%d archives, %d failed, %.1f ms total' % (len(jobs), failures, (time.perf_counter() - totalStart) * 1000))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
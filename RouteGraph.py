@@ -0,0 +1,371 @@
+import collections
+import Profiling
+import RouteInfoDocument
+
+# Point columns holding references to other nodes or to paths
+NODE_COLUMNS = ('nodeUnlocks', 'secretNodeUnlocks')
+PATH_COLUMNS = ('pathUnlocks', 'secretPathUnlocks', 'revealedPathConnections')
+
+# Number of world graphs kept at the same time
+DEFAULT_CACHE_SIZE = 2
+
+# unreachableNodes and the rows of deadPaths are point and route rows, unresolved holds (row, column, token)
+GraphReport = collections.namedtuple('GraphReport', ['reachable', 'unreachableNodes', 'deadPaths', 'unresolved'])
+
+# Rows whose links changed with an update, tokens are the node ids and names that now resolve differently
+GraphUpdate = collections.namedtuple('GraphUpdate', ['pointRows', 'routeRows', 'tokens'])
+
+
+def parseList(cell):
+    # Unlock cells are quoted comma separated lists, e.g. "1,2"
+    return [token for token in map(str.strip, cell.replace('"', '').split(',')) if token]
+
+
+class WorldGraph:
+    def __init__(self, points=(), routes=()):
+        self.reset(points, routes)
+
+    def reset(self, points, routes):
+        self.points = list(points)
+        self.routes = list(routes)
+
+        # Lookup indexes for resolving tokens
+        self.nodeIds = collections.defaultdict(set)
+        self.nodeNames = collections.defaultdict(set)
+        self.pathNames = collections.defaultdict(set)
+
+        # Forward and reverse adjacency, per point row and per target row
+        self.nodeTargets = [set() for point in self.points]
+        self.pathTargets = [set() for point in self.points]
+        self.nodeSources = collections.defaultdict(set)
+        self.pathSources = collections.defaultdict(set)
+        self.unresolved = [[] for point in self.points]
+
+        # Point rows referencing a token, so renaming a node or path only re-links those rows
+        self.nodeTokenRefs = collections.defaultdict(set)
+        self.pathTokenRefs = collections.defaultdict(set)
+
+        # Path end points are found by splitting the path name into two node ids or names, e.g. 1-2 or W1-1W1-2
+        self.endpoints = [None] * len(self.routes)
+        self.endpointTokens = [None] * len(self.routes)
+        self.nodePaths = collections.defaultdict(set)
+        self.endpointRefs = collections.defaultdict(set)
+
+        for row, point in enumerate(self.points):
+            self.nodeIds[point.id].add(row)
+            self.nodeNames[point.nodeName].add(row)
+
+        for row, route in enumerate(self.routes):
+            self.pathNames[route.path].add(row)
+
+        for row in range(len(self.points)):
+            self.linkPoint(row)
+
+        for row in range(len(self.routes)):
+            self.linkRoute(row)
+
+        self.cachedReport = None
+
+    def resolveNode(self, token):
+        rows = self.nodeIds.get(token) or self.nodeNames.get(token)
+        return min(rows) if rows else None
+
+    def resolvePath(self, token):
+        rows = self.pathNames.get(token)
+        if rows:
+            return min(rows)
+
+        if token.isdigit() and int(token) < len(self.routes):
+            return int(token)
+
+        return None
+
+    def linkPoint(self, row):
+        point = self.points[row]
+        unresolved = self.unresolved[row]
+
+        references = (
+            (NODE_COLUMNS, self.resolveNode, self.nodeTokenRefs, self.nodeTargets[row], self.nodeSources),
+            (PATH_COLUMNS, self.resolvePath, self.pathTokenRefs, self.pathTargets[row], self.pathSources),
+        )
+
+        for columns, resolve, tokenRefs, targets, sources in references:
+            for column in columns:
+                for token in parseList(getattr(point, column)):
+                    tokenRefs[token].add(row)
+                    target = resolve(token)
+
+                    if target is None:
+                        unresolved.append((column, token))
+                    else:
+                        targets.add(target)
+                        sources[target].add(row)
+
+    def unlinkPoint(self, row):
+        point = self.points[row]
+
+        for column in NODE_COLUMNS:
+            for token in parseList(getattr(point, column)):
+                self.nodeTokenRefs[token].discard(row)
+
+        for column in PATH_COLUMNS:
+            for token in parseList(getattr(point, column)):
+                self.pathTokenRefs[token].discard(row)
+
+        for target in self.nodeTargets[row]:
+            self.nodeSources[target].discard(row)
+        for target in self.pathTargets[row]:
+            self.pathSources[target].discard(row)
+
+        self.nodeTargets[row] = set()
+        self.pathTargets[row] = set()
+        self.unresolved[row] = []
+
+    def relinkPoints(self, rows):
+        for row in rows:
+            self.unlinkPoint(row)
+            self.linkPoint(row)
+
+    def splitPath(self, name):
+        splits = [(name[:i], name[i + 1:]) for i in range(1, len(name) - 1) if name[i] == '-']
+        splits += [(name[:i], name[i:]) for i in range(1, len(name))]
+
+        nodeIds = self.nodeIds
+        nodeNames = self.nodeNames
+
+        for startToken, endToken in splits:
+            if startToken not in nodeIds and startToken not in nodeNames:
+                continue
+
+            start = self.resolveNode(startToken)
+            end = self.resolveNode(endToken)
+            if start is not None and end is not None:
+                return (start, end), (startToken, endToken)
+
+        return None, None
+
+    def linkRoute(self, row):
+        endpoints, tokens = self.splitPath(self.routes[row].path)
+        self.endpoints[row] = endpoints
+        self.endpointTokens[row] = tokens
+
+        if endpoints is None:
+            self.endpointRefs[None].add(row)
+            return
+
+        for node, token in zip(endpoints, tokens):
+            self.nodePaths[node].add(row)
+            self.endpointRefs[token].add(row)
+
+    def unlinkRoute(self, row):
+        if self.endpoints[row] is None:
+            self.endpointRefs[None].discard(row)
+
+        else:
+            for node, token in zip(self.endpoints[row], self.endpointTokens[row]):
+                self.nodePaths[node].discard(row)
+                self.endpointRefs[token].discard(row)
+
+        self.endpoints[row] = None
+        self.endpointTokens[row] = None
+
+    def relinkRoutes(self, rows):
+        for row in rows:
+            self.unlinkRoute(row)
+            self.linkRoute(row)
+
+    def updatePoint(self, row, point):
+        old = self.points[row]
+        if old == point:
+            return GraphUpdate(set(), set(), set())
+
+        self.unlinkPoint(row)
+
+        # Renamed nodes change what other rows' tokens and path names resolve to
+        affectedTokens = set()
+
+        if old.id != point.id:
+            affectedTokens.update((old.id, point.id))
+        if old.nodeName != point.nodeName:
+            affectedTokens.update((old.nodeName, point.nodeName))
+
+        # Rows sharing the old or new id are duplicates, or stop being ones
+        duplicates = set(self.nodeIds.get(old.id, ())) | set(self.nodeIds.get(point.id, ())) if old.id != point.id else set()
+
+        affectedRoutes = set()
+        if affectedTokens:
+            affectedRoutes.update(self.endpointRefs[None])
+            for token in affectedTokens:
+                affectedRoutes.update(self.endpointRefs.get(token, ()))
+
+        for route in affectedRoutes:
+            self.unlinkRoute(route)
+
+        if old.id != point.id:
+            self.nodeIds[old.id].discard(row)
+            if not self.nodeIds[old.id]:
+                del self.nodeIds[old.id]
+            self.nodeIds[point.id].add(row)
+
+        if old.nodeName != point.nodeName:
+            self.nodeNames[old.nodeName].discard(row)
+            if not self.nodeNames[old.nodeName]:
+                del self.nodeNames[old.nodeName]
+            self.nodeNames[point.nodeName].add(row)
+
+        self.points[row] = point
+        self.linkPoint(row)
+
+        for route in affectedRoutes:
+            self.linkRoute(route)
+
+        rows = set()
+        for token in affectedTokens:
+            rows.update(self.nodeTokenRefs.get(token, ()))
+        rows.discard(row)
+        self.relinkPoints(rows)
+
+        self.cachedReport = None
+
+        rows.update(duplicates)
+        rows.update(self.nodeIds.get(point.id, ()))
+        rows.add(row)
+        return GraphUpdate(rows, affectedRoutes, affectedTokens)
+
+    def updateRoute(self, row, route):
+        old = self.routes[row]
+        if old == route:
+            return GraphUpdate(set(), set(), set())
+
+        self.unlinkRoute(row)
+
+        if old.path != route.path:
+            self.pathNames[old.path].discard(row)
+            if not self.pathNames[old.path]:
+                del self.pathNames[old.path]
+            self.pathNames[route.path].add(row)
+
+        self.routes[row] = route
+        self.linkRoute(row)
+
+        rows = set()
+        if old.path != route.path:
+            rows = set(self.pathTokenRefs.get(old.path, ())) | set(self.pathTokenRefs.get(route.path, ()))
+            self.relinkPoints(rows)
+
+        self.cachedReport = None
+        return GraphUpdate(rows, {row}, set())
+
+    def reachableNodes(self, start=0):
+        if start >= len(self.points):
+            return set()
+
+        # Completing a node unlocks nodes and paths, walking an unlocked path reaches both of its ends
+        reachable = {start}
+        pending = [start]
+
+        while pending:
+            row = pending.pop()
+            targets = set(self.nodeTargets[row])
+
+            for path in self.pathTargets[row]:
+                if self.endpoints[path] is not None:
+                    targets.update(self.endpoints[path])
+
+            for target in targets:
+                if target not in reachable:
+                    reachable.add(target)
+                    pending.append(target)
+
+        return reachable
+
+    def report(self):
+        if self.cachedReport is not None:
+            return self.cachedReport
+
+        reachable = self.reachableNodes()
+        unreachableNodes = [row for row in range(len(self.points)) if row not in reachable]
+
+        deadPaths = []
+        for row in range(len(self.routes)):
+            if self.endpoints[row] is None:
+                deadPaths.append((row, 'end points are not nodes'))
+            elif not any(source in reachable for source in self.pathSources.get(row, ())):
+                deadPaths.append((row, 'never unlocked by a reachable node'))
+
+        unresolved = [(row, column, token) for row, tokens in enumerate(self.unresolved) for column, token in tokens]
+
+        self.cachedReport = GraphReport(reachable, unreachableNodes, deadPaths, unresolved)
+        return self.cachedReport
+
+
+class GraphIndex:
+    def __init__(self, document, cacheSize=DEFAULT_CACHE_SIZE):
+        self.document = document
+
+        # Called with the world and a GraphUpdate after every point or route change, or None if the world was rebuilt
+        self.listeners = []
+
+        # Graphs of the most recently shown worlds, large worlds take a few MB each
+        self.cacheSize = cacheSize
+        self.graphs = collections.OrderedDict()
+
+        # Cell edits update a world's graph in place, any other change rebuilds it on next use
+        document.listeners.append(self.documentChanged)
+
+    def close(self):
+        if self.documentChanged in self.document.listeners:
+            self.document.listeners.remove(self.documentChanged)
+        self.graphs.clear()
+        self.listeners = []
+
+    def graph(self, world):
+        graph = self.graphs.get(world)
+
+        if graph is None:
+            points = self.memberRecords(RouteInfoDocument.POINT + world)
+            routes = self.memberRecords(RouteInfoDocument.ROUTE + world)
+
+            with Profiling.phase('graph build', world=world):
+                graph = WorldGraph(points, routes)
+
+            self.graphs[world] = graph
+
+            while len(self.graphs) > max(self.cacheSize, 1):
+                self.graphs.popitem(last=False)
+
+        else:
+            self.graphs.move_to_end(world)
+
+        return graph
+
+    def report(self, world):
+        return self.graph(world).report()
+
+    def memberRecords(self, name):
+        if name not in self.document:
+            return []
+
+        return self.document.records(name)
+
+    def documentChanged(self, change):
+        kind = RouteInfoDocument.memberKind(change.name)
+        world = RouteInfoDocument.worldName(change.name)
+        graph = self.graphs.get(world)
+
+        if kind not in (RouteInfoDocument.POINT, RouteInfoDocument.ROUTE):
+            return
+
+        # Worlds without a graph are reported as rebuilt too, so results derived from them are dropped
+        if graph is None or change.type != RouteInfoDocument.CELL_CHANGED:
+            self.graphs.pop(world, None)
+            update = None
+
+        elif kind == RouteInfoDocument.POINT:
+            update = graph.updatePoint(change.row, self.document.records(change.name)[change.row])
+
+        else:
+            update = graph.updateRoute(change.row, self.document.records(change.name)[change.row])
+
+        for listener in list(self.listeners):
+            listener(world, update)
@@ -0,0 +1,565 @@
+import ArchiveIO
+import bisect
+import collections
+import concurrent.futures
+import CsvTokenizer
+import hashlib
+import os
+import ParseCache
+import Profiling
+import SarcLib
+
+POINT = 'point'
+ROUTE = 'route'
+WORLD_IN = 'worldIn'
+TO_CASTLE = 'toCastle'
+
+KINDS = (POINT, ROUTE, WORLD_IN, TO_CASTLE)
+
+# Number of worlds whose members are kept parsed at the same time
+DEFAULT_CACHE_SIZE = 8
+
+PointRecord = collections.namedtuple('PointRecord', [
+    'id',
+    'nodeName',
+    'nodeFlag',
+    'nodeUnlocks',
+    'pathUnlocks',
+    'secretNodeFlag',
+    'secretNodeUnlocks',
+    'secretPathUnlocks',
+    'revealedPathConnections',
+])
+
+RouteRecord = collections.namedtuple('RouteRecord', ['path', 'action', 'sound'])
+
+# Change types passed to document listeners
+CELL_CHANGED = 'cell'
+ROWS_INSERTED = 'insert'
+ROWS_REMOVED = 'remove'
+MEMBER_RESET = 'reset'
+DATA_RESET = 'data'
+MEMBER_ADDED = 'add'
+MEMBER_REMOVED = 'delete'
+
+# old and new are cell values for cell changes, record lists for row changes and resets, raw bytes for data resets
+# and (data, hasFilename) of added and removed members
+Change = collections.namedtuple('Change', ['type', 'name', 'row', 'column', 'old', 'new'])
+
+
+def memberKind(name):
+    for kind in KINDS:
+        if str(name).startswith(kind):
+            return kind
+
+    return None
+
+
+def worldName(name):
+    kind = memberKind(name)
+
+    if kind is None:
+        return str(name)
+
+    return str(name)[len(kind):]
+
+
+def makeRecord(recordType, row):
+    # Short rows are padded with empty columns, extra columns are dropped
+    columns = len(recordType._fields)
+    return recordType._make(tuple(row[:columns]) + ('',) * (columns - len(row)))
+
+
+def parseMember(kind, data):
+    if kind == POINT:
+        return [makeRecord(PointRecord, row) for row in CsvTokenizer.iterRows(data)]
+
+    elif kind == ROUTE:
+        return [makeRecord(RouteRecord, row) for row in CsvTokenizer.iterRows(data)]
+
+    elif kind == WORLD_IN or kind == TO_CASTLE:
+        # Boss paths are a single row of node names
+        return CsvTokenizer.splitRow(bytes(data).decode('shiftjis'))
+
+    return None
+
+
+def recordsFromRows(kind, rows):
+    # Rows come from the parse cache as plain tuples
+    if kind == POINT:
+        return list(map(PointRecord._make, rows))
+    elif kind == ROUTE:
+        return list(map(RouteRecord._make, rows))
+
+    return list(rows)
+
+
+def rowsFromRecords(kind, records):
+    if kind == POINT or kind == ROUTE:
+        return [tuple(record) for record in records]
+
+    return list(records)
+
+
+def parseJob(job):
+    # Runs in a worker process, member data arrive as bytes since views can't be pickled
+    kind, data = job
+    return parseMember(kind, data)
+
+
+def serializeMember(kind, records):
+    if kind == POINT or kind == ROUTE:
+        text = '\r\n'.join([','.join(record) for record in records])
+
+    else:
+        text = ','.join(records)
+
+    return text.encode('shiftjis')
+
+
+class DocumentMember:
+    __slots__ = ('name', 'kind', 'data', 'hasFilename', 'records', 'dirty', 'modified', 'pristine')
+
+    def __init__(self, name, kind, data, hasFilename=True):
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.hasFilename = hasFilename
+        self.records = None
+        # dirty: records are newer than data, modified: member changed since the last save
+        self.dirty = False
+        self.modified = False
+        # pristine: data are still those of the opened archive, so the parse cache applies to them
+        self.pristine = False
+
+
+class RouteInfoDocument:
+    def __init__(self, archiveContents=(), cacheSize=DEFAULT_CACHE_SIZE):
+        self.members = {}
+
+        # Sorted member names per kind, unknown members are listed under None
+        self.kindIndex = {kind: [] for kind in KINDS + (None,)}
+        self.sortedNames = []
+
+        # Set when members were added or removed since the last save
+        self.membersChanged = False
+
+        # Called with a Change after every edit
+        self.listeners = []
+
+        # Members are parsed on first access, the cache maps world names to their parsed members
+        self.cacheSize = cacheSize
+        self.cache = collections.OrderedDict()
+
+        # Set when member data are views into a memory mapped archive file
+        self.archive = None
+
+        # Parsed members of the same archive from an earlier session, see ParseCache
+        self.parsedCache = None
+
+        for file in archiveContents:
+            name = str(file.name)
+            member = DocumentMember(name, memberKind(name), file.data, file.hasFilename)
+            member.pristine = True
+            self.members[name] = member
+
+        # Built once, addMember and removeMember keep it up to date
+        self.sortedNames = sorted(self.members)
+        for name in self.sortedNames:
+            self.kindIndex[self.members[name].kind].append(name)
+
+    @classmethod
+    def fromData(cls, data, cacheSize=DEFAULT_CACHE_SIZE):
+        contents = ArchiveIO.readArchive(memoryview(data))[2]
+        return cls(contents, cacheSize)
+
+    @classmethod
+    def fromFile(cls, path, cacheSize=DEFAULT_CACHE_SIZE):
+        # Members stay zero-copy slices of the mapped file until they are opened
+        archive = ArchiveIO.MappedArchive(path)
+        document = cls(archive.contents, cacheSize)
+        document.archive = archive
+        return document
+
+    def detach(self):
+        # Copy the remaining mapped members so the archive file can be replaced
+        if self.archive is None:
+            return
+
+        for member in self.members.values():
+            if isinstance(member.data, memoryview):
+                member.data = bytes(member.data)
+
+        self.archive.close()
+        self.archive = None
+
+    def close(self):
+        self.listeners = []
+        self.members = {}
+        self.kindIndex = {kind: [] for kind in KINDS + (None,)}
+        self.sortedNames = []
+        self.cache.clear()
+        self.parsedCache = None
+
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def names(self, kind=None):
+        return list(self.sortedNames if kind is None else self.kindIndex[kind])
+
+    def unknownNames(self):
+        return list(self.kindIndex[None])
+
+    def addMember(self, name, data, hasFilename=True):
+        if name in self.members:
+            raise ValueError('%s is already in the archive' % name)
+
+        member = DocumentMember(name, memberKind(name), data, hasFilename)
+        self.members[name] = member
+
+        bisect.insort(self.sortedNames, name)
+        bisect.insort(self.kindIndex[member.kind], name)
+
+        member.modified = True
+        self.membersChanged = True
+
+        self.notify(Change(MEMBER_ADDED, name, None, None, None, (data, hasFilename)))
+        return member
+
+    def removeMember(self, name):
+        # Edits not written back yet are part of what the listeners get to restore
+        old = (bytes(self.data(name)), self.members[name].hasFilename)
+        member = self.members.pop(name)
+
+        names = self.kindIndex[member.kind]
+        del names[bisect.bisect_left(names, name)]
+        del self.sortedNames[bisect.bisect_left(self.sortedNames, name)]
+
+        world = worldName(name)
+        if world in self.cache:
+            self.cache[world].discard(name)
+            if not self.cache[world]:
+                del self.cache[world]
+
+        self.membersChanged = True
+        self.notify(Change(MEMBER_REMOVED, name, None, None, old, None))
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def kind(self, name):
+        return self.members[name].kind
+
+    def records(self, name):
+        member = self.members[name]
+
+        if member.records is None:
+            with Profiling.phase('csv parse', member=name):
+                member.records = self.parse(member)
+
+        self.touch(member)
+        return member.records
+
+    def parse(self, member):
+        records = self.cachedRecords(member)
+
+        if records is None:
+            records = parseMember(member.kind, member.data)
+            self.cacheRecords(member, records)
+
+        return records
+
+    def cachedRecords(self, member):
+        # Decoding the cached rows is several times faster than parsing the csv again
+        if self.parsedCache is None or not member.pristine or member.name not in self.parsedCache:
+            return None
+
+        rows = self.parsedCache.rows(member.name)
+        if rows is None:
+            return None
+
+        return recordsFromRows(member.kind, rows)
+
+    def cacheRecords(self, member, records):
+        # Members parsed from the opened archive are kept for the next session, see storeParseCache
+        if self.parsedCache is not None and member.pristine and member.kind is not None:
+            self.parsedCache.add(member.name, rowsFromRecords(member.kind, records))
+
+    def rebaseParseCache(self, archiveHash, archiveSize, files):
+        # After a save to the opened file, members saved unchanged keep their cached rows under the new archive's hash
+        if self.parsedCache is None:
+            return
+
+        saved = [file.name for file in files if file.name in self.members and
+                 self.members[file.name].data is file.data and not self.members[file.name].dirty]
+
+        self.parsedCache.rebase(archiveHash, archiveSize, [name for name in saved if self.members[name].pristine])
+
+        # Edited members now match the file too, they are cached the next time they are parsed
+        for name in saved:
+            self.members[name].pristine = True
+
+    def storeParseCache(self):
+        if self.parsedCache is not None:
+            with Profiling.phase('store parse cache'):
+                ParseCache.store(self.parsedCache)
+
+    def isParsed(self, name):
+        return self.members[name].records is not None
+
+    def isCached(self, name):
+        member = self.members[name]
+        return self.parsedCache is not None and member.pristine and name in self.parsedCache
+
+    def peekRecords(self, name):
+        # Passes over the whole archive parse members without pushing the open worlds out of the cache
+        member = self.members[name]
+
+        if member.records is not None:
+            return member.records
+
+        return self.parse(member)
+
+    def parseAll(self, workers=None, kinds=KINDS):
+        # Parse every member of the given kinds up front, in parallel unless workers is 1
+        members = [member for member in self.members.values() if member.kind in kinds]
+        pending = [member for member in members if member.records is None]
+
+        for member in pending:
+            member.records = self.cachedRecords(member)
+
+        pending = [member for member in pending if member.records is None]
+
+        with Profiling.phase('parallel parse', members=len(pending), workers=workers):
+            if workers == 1 or len(pending) <= 1:
+                results = [parseMember(member.kind, member.data) for member in pending]
+
+            else:
+                jobs = [(member.kind, bytes(member.data)) for member in pending]
+
+                # A few chunks per worker keeps the pickling overhead low without leaving workers idle
+                chunkSize = max(len(jobs) // ((workers or os.cpu_count() or 1) * 4), 1)
+
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(parseJob, jobs, chunksize=chunkSize))
+
+        for member, records in zip(pending, results):
+            member.records = records
+            self.cacheRecords(member, records)
+
+        # Collect the records before touching, a bounded cache may evict some of them again
+        parsed = {member.name: member.records for member in members}
+
+        for member in members:
+            self.touch(member)
+
+        return parsed
+
+    def setRecords(self, name, records):
+        member = self.members[name]
+        records = list(records)
+
+        # Only a real change marks the member for re-serialization
+        oldRecords = self.records(name)
+        if records != oldRecords:
+            member.records = records
+            member.dirty = True
+            member.modified = True
+            member.pristine = False
+
+            self.notify(Change(MEMBER_RESET, name, None, None, oldRecords, records))
+
+    def setData(self, name, data):
+        member = self.members[name]
+        oldData = bytes(self.data(name))
+
+        member.data = data
+        member.records = None
+        member.dirty = False
+        member.modified = True
+        member.pristine = False
+
+        self.notify(Change(DATA_RESET, name, None, None, oldData, data))
+
+    def setCell(self, name, row, column, value):
+        records = self.records(name)
+        record = records[row]
+
+        # Boss paths are a flat list of node names, the column is ignored for them
+        if isinstance(record, tuple):
+            old = record[column]
+            if old == value:
+                return
+            records[row] = record._replace(**{record._fields[column]: value})
+
+        else:
+            old = record
+            if old == value:
+                return
+            records[row] = value
+
+        self.recordsEdited(name)
+        self.notify(Change(CELL_CHANGED, name, row, column, old, value))
+
+    def insertRecords(self, name, row, records):
+        records = list(records)
+        if not records:
+            return
+
+        self.records(name)[row:row] = records
+
+        self.recordsEdited(name)
+        self.notify(Change(ROWS_INSERTED, name, row, None, None, records))
+
+    def removeRecords(self, name, row, count):
+        memberRecords = self.records(name)
+        removed = memberRecords[row:row + count]
+        if not removed:
+            return
+
+        del memberRecords[row:row + count]
+
+        self.recordsEdited(name)
+        self.notify(Change(ROWS_REMOVED, name, row, None, removed, None))
+
+    def recordsEdited(self, name):
+        member = self.members[name]
+        member.dirty = True
+        member.modified = True
+        member.pristine = False
+
+    def notify(self, change):
+        for listener in list(self.listeners):
+            listener(change)
+
+    def touch(self, member):
+        world = worldName(member.name)
+
+        if world in self.cache:
+            self.cache.move_to_end(world)
+        else:
+            self.cache[world] = set()
+
+        self.cache[world].add(member.name)
+
+        if self.cacheSize is not None:
+            while len(self.cache) > max(self.cacheSize, 1):
+                self.evict(next(iter(self.cache)))
+
+    def evict(self, world):
+        for name in self.cache.pop(world):
+            member = self.members[name]
+
+            # Write unsaved edits back to bytes before the records are dropped
+            if member.dirty:
+                member.data = serializeMember(member.kind, member.records)
+                member.dirty = False
+
+            member.records = None
+
+    def isDirty(self, name=None):
+        if name is not None:
+            return self.members[name].dirty
+
+        return any(member.dirty for member in self.members.values())
+
+    def dirtyNames(self):
+        return [member.name for member in self.members.values() if member.dirty]
+
+    def isModified(self):
+        return self.membersChanged or any(member.modified for member in self.members.values())
+
+    def modifiedNames(self):
+        return [member.name for member in self.members.values() if member.modified]
+
+    def markSaved(self, files=None):
+        if files is None:
+            for member in self.members.values():
+                member.modified = False
+            self.membersChanged = False
+            return
+
+        if len(files) == len(self.members) and all(file.name in self.members for file in files):
+            self.membersChanged = False
+
+        # Members edited after the snapshot was taken stay modified
+        for file in files:
+            member = self.members.get(file.name)
+            if member is not None and member.data is file.data and not member.dirty:
+                member.modified = False
+
+    def data(self, name):
+        member = self.members[name]
+
+        if member.dirty:
+            with Profiling.phase('csv serialize', member=name):
+                member.data = serializeMember(member.kind, member.records)
+            member.dirty = False
+
+        return member.data
+
+    def snapshot(self, path):
+        # The mapped source file can't stay mapped while it is replaced
+        if self.archive is not None and self.archive.path == os.path.abspath(path):
+            self.detach()
+
+        # Members only hold immutable data, so the list can be written while editing continues
+        return self.files()
+
+    def files(self):
+        # Untouched members keep their original bytes
+        return [SarcLib.File(name, self.data(name), member.hasFilename) for name, member in self.members.items()]
+
+
+def loadDocument(path, cacheSize=DEFAULT_CACHE_SIZE, progress=None):
+    # Everything the editors need before they can show the first world
+    with Profiling.action('open'):
+        document = RouteInfoDocument.fromFile(path, cacheSize)
+
+        try:
+            initialNames = [names[0] for names in map(document.names, KINDS) if names]
+            total = len(initialNames) + 1
+
+            if progress is not None:
+                progress(0, total)
+
+            with Profiling.phase('hash'):
+                archiveHash = hashlib.sha1(document.archive.view).digest()
+
+            with Profiling.phase('parse cache'):
+                document.parsedCache = ParseCache.load(archiveHash, len(document.archive.view))
+
+            for done, name in enumerate(initialNames, 1):
+                if progress is not None:
+                    progress(done, total)
+
+                document.records(name)
+
+        except BaseException:
+            document.close()
+            raise
+
+    return document, archiveHash
+
+
+def saveFiles(files, path, savedHash=None, progress=None):
+    # Returns the hash of the archive content, the file is only written when it differs from savedHash
+    hashProgress = writeProgress = None
+
+    # The hash pass is the first half of the progress and can be cancelled like the write
+    if progress is not None:
+        hashProgress = lambda done, total: progress(done, total * 2)
+        writeProgress = lambda done, total: progress(total + done, total * 2)
+
+    with Profiling.action('write'):
+        with Profiling.phase('hash'):
+            outHash = ArchiveIO.archiveHash(files, progress=hashProgress)
+
+        if outHash == savedHash:
+            return outHash
+
+        with Profiling.phase('archive save'):
+            ArchiveIO.saveArchive(path, files, progress=writeProgress)
+
+    return outHash
@@ -1,5 +1,11 @@
-import re
-from PyQt5 import QtCore, QtWidgets, QtGui
+import array
+import EditorModels
+import Icons
+import Profiling
+import RouteInfoDocument
+import sys
+import Translations
+from PyQt5 import QtCore, QtWidgets
 
 Qt = QtCore.Qt
 
@@ -8,7 +14,8 @@ class RouteEditorWidget(QtWidgets.QWidget):
     def __init__(self, parent=None):
         QtWidgets.QWidget.__init__(self, parent=parent)
 
-        self.archiveContents = []
+        self.document = None
+        self.validator = None
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
@@ -24,10 +31,10 @@ class RouteEditorWidget(QtWidgets.QWidget):
         self.exportButton = QtWidgets.QPushButton('Export')
 
         # Add Icons
-        self.addRowButton.setIcon(QtGui.QIcon('RouteEditData/icons/plus.png'))
-        self.delRowButton.setIcon(QtGui.QIcon('RouteEditData/icons/minus.png'))
-        self.importButton.setIcon(QtGui.QIcon('RouteEditData/icons/import.png'))
-        self.exportButton.setIcon(QtGui.QIcon('RouteEditData/icons/export.png'))
+        self.addRowButton.setIcon(Icons.icon('plus'))
+        self.delRowButton.setIcon(Icons.icon('minus'))
+        self.importButton.setIcon(Icons.icon('import'))
+        self.exportButton.setIcon(Icons.icon('export'))
 
         # Default Widgets to disabled
         self.fileSelector.setDisabled(True)
@@ -44,6 +51,18 @@ class RouteEditorWidget(QtWidgets.QWidget):
         self.importButton.pressed.connect(self.importData)
         self.exportButton.pressed.connect(self.exportData)
 
+        # Edits go straight to the document
+        entryModel = self.routeEntries.model()
+        entryModel.dataChanged.connect(self.entriesChanged)
+        entryModel.rowsInserted.connect(self.entriesInserted)
+        entryModel.rowsRemoved.connect(self.entriesRemoved)
+
+        # Highlights appear once world switches pause
+        self.validationTimer = QtCore.QTimer(self)
+        self.validationTimer.setSingleShot(True)
+        self.validationTimer.setInterval(100)
+        self.validationTimer.timeout.connect(self.prepareValidation)
+
         # add widgets to layout
         topLayout = QtWidgets.QHBoxLayout()
         topLayout.addWidget(self.fileSelector, 1, Qt.AlignVCenter)
@@ -59,14 +78,17 @@ class RouteEditorWidget(QtWidgets.QWidget):
         self.layout.addWidget(self.scrollArea)
         self.layout.addLayout(bottomLayout)
 
-    def loadData(self, archiveContents):
-        self.archiveContents = archiveContents
+    def loadData(self, document, validator):
+        self.document = document
+        self.validator = validator
+        self.document.listeners.append(self.documentChanged)
+        self.validator.listeners.append(self.validationChanged)
 
         QtCore.QObject.blockSignals(self.fileSelector, True)
 
         # Add elements to file selector drop-down
-        for file in self.archiveContents:
-            self.fileSelector.addItem(str(file.name)[5:-4])
+        for name in self.document.names(RouteInfoDocument.ROUTE):
+            self.fileSelector.addItem(name[5:-4])
 
         QtCore.QObject.blockSignals(self.fileSelector, False)
 
@@ -78,7 +100,12 @@ class RouteEditorWidget(QtWidgets.QWidget):
         self.fileIndexChanged()
 
     def closeData(self):
-        self.archiveContents = []
+        if self.document is not None:
+            self.document.listeners.remove(self.documentChanged)
+            self.validator.listeners.remove(self.validationChanged)
+
+        self.document = None
+        self.validator = None
         self.fileLoaded = False
         self.currentLoadedFile = ''
         self.selectedFile = ''
@@ -88,16 +115,21 @@ class RouteEditorWidget(QtWidgets.QWidget):
         self.fileSelector.setDisabled(True)
         self.scrollArea.setDisabled(True)
 
+        QtCore.QObject.blockSignals(self.fileSelector, True)
         self.fileSelector.clear()
+        QtCore.QObject.blockSignals(self.fileSelector, False)
 
     def fileIndexChanged(self):
+        with Profiling.action('switch world'):
+            self.switchFile()
+
+    def switchFile(self):
         # store the currently selected file's name
         self.selectedFile = 'route' + self.fileSelector.currentText() + '.csv'
 
         # check if a file is already open
         if self.fileLoaded:
-            # if a file is already open, store the changes made and close the file
-            self.storeChanges()
+            # if a file is already open, close it, edits are already in the document
             self.routeEntries.clearTable()
             self.loadSelectedFile()
         else:
@@ -105,39 +137,67 @@ class RouteEditorWidget(QtWidgets.QWidget):
 
     def loadSelectedFile(self):
 
-        dataArray = []
+        # load the records for the file the user selected, they are parsed once by the document
+        if self.selectedFile in self.document:
+            dataArray = self.document.records(self.selectedFile)
 
-        # load the data for the file the user selected
-        for file in self.archiveContents:
-            if file.name == self.selectedFile:
-                data = file.data
-                data = data.decode('shiftjis')
+            # create a route entry container
+            with Profiling.phase('populate', member=self.selectedFile):
+                self.routeEntries.model().setValidation(self.validator, self.selectedFile)
+                self.routeEntries.populate(dataArray)
 
-                # split data by row
-                rows = str(data).split()
+            self.fileLoaded = True
+            self.currentLoadedFile = self.selectedFile
+            self.validationTimer.start()
 
-                # split rows elements but don't break substrings
-                for row in rows:
-                    row = re.split(''',(?=(?:[^'"]|'[^']*'|"[^"]*")*$)''', row)
-                    dataArray.append(row)
+    def entriesChanged(self, topLeft, bottomRight, roles=()):
+        # Highlight updates only change the validation roles
+        if roles and Qt.EditRole not in roles:
+            return
 
-                # create a route entry container
-                self.routeEntries.populate(dataArray)
+        model = self.routeEntries.model()
 
-                self.fileLoaded = True
-                self.currentLoadedFile = self.selectedFile
+        for row in range(topLeft.row(), bottomRight.row() + 1):
+            record = model.record(row)
 
-    def storeChanges(self):
-        data = self.routeEntries.saveContents()
-        data = data.encode('shiftjis')
+            # Only the edited cells are written, so untranslated names elsewhere in the row are kept
+            for column in range(topLeft.column(), bottomRight.column() + 1):
+                self.document.setCell(self.currentLoadedFile, row, column, record[column])
+
+    def entriesInserted(self, parent, first, last):
+        self.document.insertRecords(self.currentLoadedFile, first, self.routeEntries.records()[first:last + 1])
+
+    def documentChanged(self, change):
+        if self.fileLoaded and change.name == self.currentLoadedFile and change.name in self.document:
+            self.routeEntries.model().syncChange(change, self.document.records(change.name))
+
+    def entriesRemoved(self, parent, first, last):
+        self.document.removeRecords(self.currentLoadedFile, first, last - first + 1)
+
+    def validationChanged(self, name, rows):
+        if self.fileLoaded and name == self.currentLoadedFile:
+            self.routeEntries.model().problemsChanged(rows)
+
+            # Edits of a world whose graph was dropped bring it back
+            if rows is None:
+                self.validationTimer.start()
+
+    def prepareValidation(self):
+        if self.fileLoaded and not self.validator.isReady(self.currentLoadedFile):
+            self.validator.prepare(self.currentLoadedFile)
+            self.routeEntries.model().problemsChanged()
+
+    def showCell(self, name, row, column):
+        index = self.fileSelector.findText(name[5:-4])
+        if index == -1:
+            return
 
-        for file in self.archiveContents:
-            if str(file.name) == self.currentLoadedFile:
-                file.data = data
+        self.fileSelector.setCurrentIndex(index)
 
-    def getArchiveContents(self):
-        self.storeChanges()
-        return self.archiveContents
+        modelIndex = self.routeEntries.model().index(row, column)
+        self.routeEntries.setCurrentIndex(modelIndex)
+        self.routeEntries.scrollTo(modelIndex)
+        self.routeEntries.setFocus()
 
     def addRow(self):
         self.routeEntries.addRow()
@@ -154,11 +214,7 @@ class RouteEditorWidget(QtWidgets.QWidget):
         with open(fileName, 'rb') as f:
             data = f.read()
 
-        self.routeEntries.saveContents()
-
-        for file in self.archiveContents:
-            if str(file.name) == self.currentLoadedFile:
-                file.data = data
+        self.document.setData(self.currentLoadedFile, data)
 
         self.routeEntries.clearTable()
         self.loadSelectedFile()
@@ -174,134 +230,267 @@ class RouteEditorWidget(QtWidgets.QWidget):
             f.write(file.encode('shiftjis'))
 
 
-class RouteEntryTable(QtWidgets.QTableWidget):
+class RouteEntryTable(EditorModels.EntryViewMixin, QtWidgets.QTableView):
     def __init__(self):
-        QtWidgets.QTableWidget.__init__(self)
+        QtWidgets.QTableView.__init__(self)
+
+        self.entryModel = RouteEntryModel(self)
+        self.setModel(self.entryModel)
+        self.setItemDelegate(RouteEntryDelegate(self))
 
         # Setup Table Properties
-        self.setColumnCount(3)
         self.setAlternatingRowColors(True)
-        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.AllEditTriggers)
 
         # Setup Header Bar
         header = self.horizontalHeader()
         header.setStretchLastSection(True)
         header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
-        self.setHorizontalHeaderItem(0, QtWidgets.QTableWidgetItem('Path'))
-        self.setHorizontalHeaderItem(1, QtWidgets.QTableWidgetItem('Action'))
-        self.setHorizontalHeaderItem(2, QtWidgets.QTableWidgetItem('Sound'))
 
         # Hide Row Numbers
         self.verticalHeader().setVisible(False)
 
     def populate(self, dataArray):
-        i = 0
-        # Iterate through each entry in the data array
-        while i < len(dataArray):
-            pos = self.rowCount()
-            # Create a row for each entry in the array
-            self.insertRow(pos)
-            # Populate the new row with the contents of that entry in the array
-            self.setItem(pos, 0, QtWidgets.QTableWidgetItem(dataArray[i][0]))  # Path
-            self.setCellWidget(pos, 1, ActionEditor(dataArray[i][1]))          # Action
-            self.setCellWidget(pos, 2, SoundEffectsEditor(dataArray[i][2]))    # Sound
-            i += 1
+        self.entryModel.populate(dataArray)
 
     def addRow(self):
-        self.insertRow(self.currentRow()+1)
+        ranges = self.selectedRowRanges()
 
-        # Initialise the row
-        self.setItem(self.currentRow()+1, 0, QtWidgets.QTableWidgetItem())  # Path
-        self.setCellWidget(self.currentRow()+1, 1, ActionEditor())          # Action
-        self.setCellWidget(self.currentRow()+1, 2, SoundEffectsEditor())    # Sound
+        # Insert as many rows as are selected, below the selection
+        if ranges:
+            self.entryModel.insertRows(ranges[-1][0] + ranges[-1][1], sum(count for first, count in ranges))
+        else:
+            self.entryModel.insertRows(0, 1)
 
     def delRow(self):
-        self.removeRow(self.currentRow())
+        # Remove from the bottom up so the remaining ranges stay valid
+        for first, count in reversed(self.selectedRowRanges()):
+            self.entryModel.removeRows(first, count)
 
     def saveContents(self):
-        outData = []
+        return self.entryModel.saveContents()
+
+    def records(self):
+        return self.entryModel.records()
+
+    def clearTable(self):
+        self.entryModel.clear()
+
+
+class RouteEntryModel(EditorModels.EntryModelMixin, QtCore.QAbstractTableModel):
+    headers = ['Path', 'Action', 'Sound']
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+
+        self.actionTable = Translations.actions()
+        self.soundTable = Translations.soundEffects()
+
+        # Rows are stored column by column, actions and sounds as translation table indices
+        self.paths = []
+        self.actions = array.array('h')
+        self.sounds = array.array('h')
+
+        # Cells with problems are highlighted, results come from the validator's per-row cache
+        self.validator = None
+        self.memberName = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.paths)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 3
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        row = index.row()
+        col = index.column()
+
+        if role == Qt.DisplayRole:
+            if col == 0:
+                return self.paths[row]
+            elif col == 1:
+                return self.actionTable.engAt(self.actions[row])
+            else:
+                return self.soundTable.engAt(self.sounds[row])
+
+        elif role == Qt.EditRole:
+            if col == 0:
+                return self.paths[row]
+            elif col == 1:
+                return self.actions[row]
+            else:
+                return self.sounds[row]
+
+        elif role == Qt.BackgroundRole or role == Qt.ToolTipRole:
+            return self.validationData(index, role)
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+
+        row = index.row()
+        col = index.column()
+
+        if col == 0:
+            self.paths[row] = sys.intern(str(value))
+        elif col == 1:
+            self.actions[row] = value
+        else:
+            self.sounds[row] = value
+
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def populate(self, dataArray):
+        self.beginResetModel()
+
+        self.paths = [sys.intern(entry[0]) for entry in dataArray]
+        # Unknown names fall back to the first entry, matching a freshly created combobox
+        self.actions = array.array('h', (max(self.actionTable.indexOfJp(entry[1]), 0) for entry in dataArray))
+        self.sounds = array.array('h', (max(self.soundTable.indexOfJp(entry[2]), 0) for entry in dataArray))
+
+        self.endResetModel()
 
-        row = 0
-        # Iterate through each row of the table
-        while row < self.rowCount():
-            col = 0
-            rowData = []
-            # Iterate through each column for the current row
-            while col < 3:
-                # Store the contents of the column
-                if col == 0:
-                    rowData.append(self.item(row, col).text())
-                else:
-                    rowData.append(self.cellWidget(row, col).getValue())
-                col += 1
-            # Store the contents of each row
-            rowString = ','.join(rowData)
-            outData.append(rowString)
-            row += 1
+    def insertRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginInsertRows(parent, row, row + count - 1)
+
+        # Initialise the rows
+        self.paths[row:row] = [''] * count
+        self.actions[row:row] = array.array('h', bytes(2 * count))
+        self.sounds[row:row] = array.array('h', bytes(2 * count))
+
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1:
+            return False
+
+        self.beginRemoveRows(parent, row, row + count - 1)
+
+        del self.paths[row:row + count]
+        del self.actions[row:row + count]
+        del self.sounds[row:row + count]
+
+        self.endRemoveRows()
+        return True
+
+    def saveContents(self):
+        actionNames = self.actionTable.jpNames
+        soundNames = self.soundTable.jpNames
+
+        outData = []
+        for path, action, sound in zip(self.paths, self.actions, self.sounds):
+            outData.append(','.join((path, actionNames[action], soundNames[sound])))
 
         outString = '\r\n'.join(outData)
         return outString
 
-    def clearTable(self):
-        while self.rowCount() > 0:
-            self.removeRow(0)
+    def record(self, row):
+        return RouteInfoDocument.RouteRecord(self.paths[row], self.actionTable.jpNames[self.actions[row]],
+                                             self.soundTable.jpNames[self.sounds[row]])
 
+    def setRecord(self, row, record):
+        path, action, sound = record
+        self.paths[row] = sys.intern(path)
+        self.actions[row] = max(self.actionTable.indexOfJp(action), 0)
+        self.sounds[row] = max(self.soundTable.indexOfJp(sound), 0)
 
-class SoundEffectsEditor(QtWidgets.QComboBox):
-    def __init__(self, data=None, parent=None):
-        QtWidgets.QWidget.__init__(self, parent=parent)
+    def records(self):
+        actionNames = self.actionTable.jpNames
+        soundNames = self.soundTable.jpNames
 
-        # Create a dictionary to translate the sfx names from jp to english
-        self.sfx = {}
-        with open('RouteEditData/SoundEffects.txt', 'rt', encoding='utf-8-sig') as f:
-            for line in f:
-                (jp, eng) = line.split(':')
-                eng = str(eng).strip('\n')
-                self.sfx[jp] = eng
+        return [RouteInfoDocument.RouteRecord(path, actionNames[action], soundNames[sound])
+                for path, action, sound in zip(self.paths, self.actions, self.sounds)]
 
-        # Add translated sound effect names to the combobox
-        for jp, eng in self.sfx.items():
-            self.addItem(eng)
+    def clear(self):
+        self.beginResetModel()
 
-        if data is not None:
-            self.getIndexByName(data)
+        self.paths = []
+        self.actions = array.array('h')
+        self.sounds = array.array('h')
 
-    def getIndexByName(self, data):
-        for jp, eng in self.sfx.items():
-            if not str(data).find(jp):
-                self.setCurrentIndex(self.findText(eng))
+        self.memberName = None
+        self.endResetModel()
 
-    def getValue(self):
-        for jp, eng in self.sfx.items():
-            if not self.currentText().find(eng):
-                return jp
 
+class RouteEntryDelegate(QtWidgets.QStyledItemDelegate):
+    def createEditor(self, parent, option, index):
+        # Combo editors only exist for the cell currently being edited
+        if index.column() == 1:
+            editor = ActionEditor(parent=parent)
+        elif index.column() == 2:
+            editor = SoundEffectsEditor(parent=parent)
+        else:
+            return QtWidgets.QStyledItemDelegate.createEditor(self, parent, option, index)
 
-class ActionEditor(QtWidgets.QComboBox):
-    def __init__(self, data=None, parent=None):
-        QtWidgets.QWidget.__init__(self, parent=parent)
+        editor.activated.connect(self.commitEditor)
+        return editor
+
+    def setEditorData(self, editor, index):
+        if index.column() == 0:
+            QtWidgets.QStyledItemDelegate.setEditorData(self, editor, index)
+        else:
+            editor.setCurrentIndex(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        if index.column() == 0:
+            QtWidgets.QStyledItemDelegate.setModelData(self, editor, model, index)
+        else:
+            model.setData(index, editor.currentIndex())
+
+    def commitEditor(self):
+        self.commitData.emit(self.sender())
 
-        # Create a dictionary to translate the action names from jp to english
-        self.actions = {}
-        with open('RouteEditData/Actions.txt', 'rt', encoding='utf-8-sig') as f:
-            for line in f:
-                (jp, eng) = line.split(':')
-                eng = str(eng).strip('\n')
-                self.actions[jp] = eng
 
-        # Add translated action names to the combobox
-        for jp, eng in self.actions.items():
-            self.addItem(eng)
+class TranslationEditor(QtWidgets.QComboBox):
+    def __init__(self, table, data=None, parent=None):
+        QtWidgets.QComboBox.__init__(self, parent=parent)
+
+        # Translation tables are shared by every editor instance
+        self.table = table
+
+        # Add translated names to the combobox
+        self.addItems(self.table.engNames)
 
         if data is not None:
             self.getIndexByName(data)
 
     def getIndexByName(self, data):
-        for jp, eng in self.actions.items():
-            if not str(data).find(jp):
-                self.setCurrentIndex(self.findText(eng))
+        index = self.table.indexOfJp(data)
+        if index != -1:
+            self.setCurrentIndex(index)
 
     def getValue(self):
-        for jp, eng in self.actions.items():
-            if not self.currentText().find(eng):
-                return jp
+        return self.table.jpAt(self.currentIndex())
+
+
+class SoundEffectsEditor(TranslationEditor):
+    def __init__(self, data=None, parent=None):
+        TranslationEditor.__init__(self, Translations.soundEffects(), data, parent)
+
+
+class ActionEditor(TranslationEditor):
+    def __init__(self, data=None, parent=None):
+        TranslationEditor.__init__(self, Translations.actions(), data, parent)
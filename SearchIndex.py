@@ -0,0 +1,327 @@
+import array
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import Profiling
+import re
+import RouteGraph
+import RouteInfoDocument
+import Translations
+
+# Point columns holding comma separated lists, each entry is indexed and replaced on its own
+LIST_COLUMNS = frozenset(RouteInfoDocument.PointRecord._fields.index(column)
+                         for column in RouteGraph.NODE_COLUMNS + RouteGraph.PATH_COLUMNS)
+
+# Route actions and sounds are stored as Japanese names but shown translated, both can be searched for
+TRANSLATED_COLUMNS = {1: Translations.actions, 2: Translations.soundEffects}
+
+# Positions are stored as row << COLUMN_BITS | column in compact arrays
+COLUMN_BITS = 4
+COLUMN_MASK = (1 << COLUMN_BITS) - 1
+
+LIST_ENTRY = re.compile('[^",]+')
+
+# value is the matched entry, the whole cell for anything but list columns
+Match = collections.namedtuple('Match', ['name', 'row', 'column', 'value'])
+
+
+def cellTokens(kind, column, value):
+    if kind == RouteInfoDocument.POINT and column in LIST_COLUMNS:
+        return RouteGraph.parseList(value)
+
+    return (value,) if value else ()
+
+
+def replaceValue(value, text, replacement, wholeValues=True):
+    if wholeValues:
+        return replacement if value == text else value
+
+    return value.replace(text, replacement)
+
+
+def replaceInCell(kind, column, value, text, replacement, wholeValues=True):
+    if kind != RouteInfoDocument.POINT or column not in LIST_COLUMNS:
+        return replaceValue(value, text, replacement, wholeValues)
+
+    # Only the list entries change, quotes, separators and spacing are kept
+    def replaceEntry(match):
+        entry = match.group()
+        token = entry.strip()
+        if not token:
+            return entry
+
+        start = entry.index(token)
+        return entry[:start] + replaceValue(token, text, replacement, wholeValues) + entry[start + len(token):]
+
+    return LIST_ENTRY.sub(replaceEntry, value)
+
+
+def replaceTranslated(table, value, text, replacement, wholeValues=True):
+    newValue = replaceValue(value, text, replacement, wholeValues)
+
+    # Searches for the English name replace it with another English name, unknown results leave the cell alone
+    if newValue == value and value in table.jpToEng:
+        newValue = table.engToJp.get(replaceValue(table.jpToEng[value], text, replacement, wholeValues), value)
+
+    return table.engToJp.get(newValue, newValue)
+
+
+def cellPositions(positions):
+    return (positions,) if positions.__class__ is int else positions
+
+
+def indexRecords(kind, records):
+    # Maps every token of a member to the positions of the cells containing it, most tokens occur once and keep a plain int
+    index = {}
+
+    if kind == RouteInfoDocument.POINT or kind == RouteInfoDocument.ROUTE:
+        listColumns = LIST_COLUMNS if kind == RouteInfoDocument.POINT else ()
+        cells = ((row << COLUMN_BITS | column, column, value)
+                 for row, record in enumerate(records) for column, value in enumerate(record) if value)
+    else:
+        listColumns = ()
+        cells = ((row << COLUMN_BITS, 0, value) for row, value in enumerate(records) if value)
+
+    parseList = RouteGraph.parseList
+
+    for position, column, value in cells:
+        for token in parseList(value) if column in listColumns else (value,):
+            positions = index.get(token)
+            if positions is None:
+                index[token] = position
+            elif positions.__class__ is int:
+                index[token] = array.array('I', (positions, position))
+            else:
+                positions.append(position)
+
+    return index
+
+
+def indexJob(job):
+    # Runs in a worker process, member data arrive as bytes since views can't be pickled
+    kind, data = job
+    return indexRecords(kind, RouteInfoDocument.parseMember(kind, data))
+
+
+def indexJobs(jobs, workers=None, progress=None):
+    # Runs on a worker thread, with several cpus the members are parsed and indexed in worker processes, which are
+    # spawned since forking would copy the running Qt threads
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(jobs) <= 1:
+        results = map(indexJob, jobs)
+        pool = None
+    else:
+        chunkSize = max(len(jobs) // (workers * 4), 1)
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        results = pool.map(indexJob, jobs, chunksize=chunkSize)
+
+    indexes = []
+    try:
+        for index in results:
+            indexes.append(index)
+            if progress is not None:
+                progress(len(indexes), len(jobs))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    return indexes
+
+
+class SearchIndex:
+    def __init__(self, document, kinds=RouteInfoDocument.KINDS):
+        self.document = document
+        self.kinds = kinds
+
+        # Cell positions of each token, per member
+        self.members = {}
+
+        # Built on the first search, members whose rows moved are indexed again on the next one
+        self.built = False
+        self.stale = set()
+
+        # Members edited while the first build runs on a worker thread, see buildJobs, None when no build runs
+        self.building = None
+
+        # Called with a member name whenever its entries change
+        self.listeners = []
+
+        document.listeners.append(self.documentChanged)
+
+    def close(self):
+        if self.documentChanged in self.document.listeners:
+            self.document.listeners.remove(self.documentChanged)
+
+        self.members = {}
+        self.stale.clear()
+        self.building = None
+        self.listeners = []
+
+    def refresh(self):
+        # Builds the index on the calling thread unless finishBuild already did
+        if not self.built:
+            names = self.indexedNames()
+
+            with Profiling.phase('search index', members=len(names)):
+                self.indexMembers(names)
+
+            self.built = True
+            self.building = None
+
+        elif self.stale:
+            self.indexMembers([name for name in self.stale if name in self.document])
+
+        self.stale.clear()
+
+    def indexedNames(self):
+        return [name for kind in self.kinds for name in self.document.names(kind)]
+
+    def indexMembers(self, names):
+        for name in names:
+            self.members[name] = indexRecords(self.document.kind(name), self.document.peekRecords(name))
+
+    def buildJobs(self):
+        # The member data for indexJobs, copied on the GUI thread so the document can be edited while they are indexed
+        names = self.indexedNames()
+        self.building = set()
+        return names, [(self.document.kind(name), bytes(self.document.data(name))) for name in names]
+
+    def finishBuild(self, names, indexes):
+        # A search that couldn't wait may have built the index already
+        if self.built or self.building is None:
+            return
+
+        self.members = {name: index for name, index in zip(names, indexes) if name in self.document}
+        self.stale = self.building
+        self.building = None
+        self.built = True
+
+    def dropMember(self, name):
+        self.members.pop(name, None)
+
+    def addTokens(self, name, position, tokens):
+        index = self.members[name]
+
+        for token in tokens:
+            positions = index.get(token)
+            if positions is None:
+                index[token] = position
+            elif positions.__class__ is int:
+                index[token] = array.array('I', (positions, position))
+            else:
+                positions.append(position)
+
+    def removeTokens(self, name, position, tokens):
+        index = self.members[name]
+
+        for token in tokens:
+            positions = index.get(token)
+
+            if positions is None or position not in cellPositions(positions):
+                continue
+            elif positions.__class__ is int:
+                del index[token]
+            else:
+                positions.remove(position)
+                if len(positions) == 1:
+                    index[token] = positions[0]
+
+    def documentChanged(self, change):
+        if RouteInfoDocument.memberKind(change.name) not in self.kinds:
+            return
+
+        if not self.built:
+            if self.building is not None:
+                self.building.add(change.name)
+            return
+
+        if change.type == RouteInfoDocument.MEMBER_REMOVED:
+            self.dropMember(change.name)
+            self.stale.discard(change.name)
+
+        elif change.type == RouteInfoDocument.CELL_CHANGED and change.name in self.members and change.name not in self.stale:
+            kind = RouteInfoDocument.memberKind(change.name)
+            column = change.column if kind == RouteInfoDocument.POINT or kind == RouteInfoDocument.ROUTE else 0
+            position = change.row << COLUMN_BITS | column
+
+            self.removeTokens(change.name, position, cellTokens(kind, column, change.old))
+            self.addTokens(change.name, position, cellTokens(kind, column, change.new))
+
+        else:
+            # Inserted and removed rows move every position after them, the member is indexed again when searched
+            self.stale.add(change.name)
+
+        for listener in list(self.listeners):
+            listener(change.name)
+
+    def find(self, text, wholeValues=True, kinds=None):
+        if not text:
+            return []
+
+        self.refresh()
+        kinds = self.kinds if kinds is None else kinds
+
+        # Japanese names of the actions and sounds whose English name matches, per route column
+        translated = {}
+        for column, table in TRANSLATED_COLUMNS.items():
+            table = table()
+
+            if wholeValues:
+                translated[column] = [table.engToJp[text]] if text in table.engToJp else []
+            else:
+                translated[column] = [jp for jp, eng in zip(table.jpNames, table.engNames) if text in eng]
+
+        found = set()
+
+        for name, index in self.members.items():
+            kind = self.document.kind(name)
+            if kind not in kinds:
+                continue
+
+            # (token, column) pairs, column None matches the token in every column
+            if wholeValues:
+                queries = [(text, None)] if text in index else []
+            else:
+                queries = [(token, None) for token in index if text in token]
+
+            if kind == RouteInfoDocument.ROUTE:
+                queries += [(token, column) for column, tokens in translated.items() for token in tokens if token in index]
+
+            for token, column in queries:
+                for position in cellPositions(index[token]):
+                    if column is None or position & COLUMN_MASK == column:
+                        found.add((name, position, token))
+
+        return [Match(name, position >> COLUMN_BITS, position & COLUMN_MASK, token)
+                for name, position, token in sorted(found)]
+
+    def replace(self, matches, text, replacement, wholeValues=True):
+        # Every matched cell is rewritten once through the document, the index follows its change notifications
+        cells = sorted({(match.name, match.row, match.column) for match in matches})
+        changed = 0
+
+        with Profiling.action('replace'):
+            for name, row, column in cells:
+                kind = self.document.kind(name)
+                records = self.document.records(name)
+                if row >= len(records):
+                    continue
+
+                if kind == RouteInfoDocument.POINT or kind == RouteInfoDocument.ROUTE:
+                    value = records[row][column]
+                else:
+                    value = records[row]
+
+                if kind == RouteInfoDocument.ROUTE and column in TRANSLATED_COLUMNS:
+                    newValue = replaceTranslated(TRANSLATED_COLUMNS[column](), value, text, replacement, wholeValues)
+                else:
+                    newValue = replaceInCell(kind, column, value, text, replacement, wholeValues)
+
+                if newValue != value:
+                    self.document.setCell(name, row, column, newValue)
+                    changed += 1
+
+        return changed
@@ -0,0 +1,258 @@
+import BackgroundTask
+import PointWidget
+import RouteInfoDocument
+import RouteWidget
+import SearchIndex
+import time
+from PyQt5 import QtCore, QtWidgets
+
+Qt = QtCore.Qt
+
+COLUMN_HEADERS = {
+    RouteInfoDocument.POINT: PointWidget.PointEntryModel.headers,
+    RouteInfoDocument.ROUTE: RouteWidget.RouteEntryModel.headers,
+    RouteInfoDocument.WORLD_IN: ['Node'],
+    RouteInfoDocument.TO_CASTLE: ['Node'],
+}
+
+
+class SearchPanel(QtWidgets.QWidget):
+    matchActivated = QtCore.pyqtSignal(str, int, int)
+
+    def __init__(self, parent=None):
+        QtWidgets.QWidget.__init__(self, parent=parent)
+
+        self.searchIndex = None
+        self.history = None
+        self.lastSearch = None
+        self.buildTask = None
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        # Create Widgets
+        self.queryEdit = QtWidgets.QLineEdit()
+        self.replaceEdit = QtWidgets.QLineEdit()
+        self.wholeValues = QtWidgets.QCheckBox('Whole Values')
+        self.findButton = QtWidgets.QPushButton('Find All')
+        self.replaceButton = QtWidgets.QPushButton('Replace')
+        self.resultView = QtWidgets.QTableView()
+        self.resultModel = SearchResultModel(self)
+        self.statusLabel = QtWidgets.QLabel()
+
+        self.queryEdit.setPlaceholderText('Node ID or name, path, action or sound')
+        self.replaceEdit.setPlaceholderText('Replace with')
+        self.wholeValues.setChecked(True)
+        self.replaceButton.setToolTip('Replace the selected matches, or every match if none are selected')
+
+        # Setup Result Table
+        self.resultView.setModel(self.resultModel)
+        self.resultView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.resultView.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.resultView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.resultView.horizontalHeader().setStretchLastSection(True)
+        self.resultView.verticalHeader().setVisible(False)
+
+        # Default Widgets to disabled
+        self.setDisabled(True)
+
+        # Setup Signals
+        self.queryEdit.returnPressed.connect(self.search)
+        self.findButton.pressed.connect(self.search)
+        self.replaceButton.pressed.connect(self.replaceMatches)
+        self.resultView.activated.connect(self.resultActivated)
+
+        # Results follow edits once they pause
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(100)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+        # add widgets to layout
+        topLayout = QtWidgets.QHBoxLayout()
+        topLayout.addWidget(self.queryEdit, 1, Qt.AlignVCenter)
+        topLayout.addWidget(self.wholeValues, 0, Qt.AlignVCenter)
+        topLayout.addWidget(self.findButton, 0, Qt.AlignVCenter)
+
+        replaceLayout = QtWidgets.QHBoxLayout()
+        replaceLayout.addWidget(self.replaceEdit, 1, Qt.AlignVCenter)
+        replaceLayout.addWidget(self.replaceButton, 0, Qt.AlignVCenter)
+
+        self.layout.addLayout(topLayout)
+        self.layout.addLayout(replaceLayout)
+        self.layout.addWidget(self.resultView)
+        self.layout.addWidget(self.statusLabel)
+
+    def loadData(self, searchIndex, history):
+        self.searchIndex = searchIndex
+        self.history = history
+        self.searchIndex.listeners.append(self.indexChanged)
+        self.setDisabled(False)
+
+        if self.isVisible():
+            self.startBuild()
+
+    def closeData(self):
+        if self.searchIndex is not None:
+            self.searchIndex.listeners.remove(self.indexChanged)
+
+        if self.buildTask is not None:
+            self.buildTask.cancel()
+
+        self.buildTask = None
+        self.searchIndex = None
+        self.history = None
+        self.lastSearch = None
+        self.refreshTimer.stop()
+        self.resultModel.setMatches([])
+        self.statusLabel.clear()
+        self.setDisabled(True)
+
+    def showEvent(self, event):
+        QtWidgets.QWidget.showEvent(self, event)
+
+        if self.searchIndex is not None:
+            self.startBuild()
+
+    def startBuild(self):
+        # The first build parses every member, so it runs on a worker thread once the panel is shown
+        if self.searchIndex.built or self.buildTask is not None:
+            return
+
+        names, jobs = self.searchIndex.buildJobs()
+        task = BackgroundTask.BackgroundTask(SearchIndex.indexJobs, jobs, None)
+        task.signals.progress.connect(self.buildProgress)
+        task.signals.finished.connect(lambda indexes: self.buildFinished(task, names, indexes))
+        task.signals.failed.connect(lambda error: self.buildFinished(task, names, None))
+
+        self.buildTask = task
+        task.start()
+
+    def buildProgress(self, done, total):
+        self.statusLabel.setText('Indexing %d of %d files' % (done, total))
+
+    def buildFinished(self, task, names, indexes):
+        if task is not self.buildTask:
+            return
+
+        self.buildTask = None
+        self.statusLabel.clear()
+
+        # A failed build is done again on the next search
+        if indexes is not None:
+            self.searchIndex.finishBuild(names, indexes)
+
+        self.refresh()
+
+    def search(self):
+        self.lastSearch = (self.queryEdit.text(), self.wholeValues.isChecked())
+        self.refresh()
+
+    def refresh(self):
+        self.refreshTimer.stop()
+
+        if self.searchIndex is None or self.lastSearch is None:
+            return
+
+        # The search runs once the index is built
+        if self.buildTask is not None:
+            self.statusLabel.setText('Indexing...')
+            return
+
+        start = time.perf_counter()
+        matches = self.searchIndex.find(*self.lastSearch)
+        seconds = time.perf_counter() - start
+
+        self.resultModel.setMatches(matches)
+        self.statusLabel.setText('%d matches in %d files (%.1f ms)' % (
+            len(matches), len({match.name for match in matches}), seconds * 1000))
+
+    def indexChanged(self, name):
+        if self.lastSearch is not None:
+            self.refreshTimer.start()
+
+    def selectedMatches(self):
+        rows = sorted({index.row() for index in self.resultView.selectionModel().selectedRows()})
+
+        if not rows:
+            return list(self.resultModel.matches)
+
+        return [self.resultModel.matches[row] for row in rows]
+
+    def replaceMatches(self):
+        if self.lastSearch is None:
+            return
+
+        matches = self.selectedMatches()
+        if not matches:
+            return
+
+        text, wholeValues = self.lastSearch
+        replacement = self.replaceEdit.text()
+
+        replaceDialog = QtWidgets.QMessageBox
+        ret = replaceDialog.question(self, '', 'Replace %s with %s in %d cells?' % (text, replacement, len(matches)),
+                                     replaceDialog.Yes | replaceDialog.No)
+
+        if ret == replaceDialog.Yes:
+            changed = self.replace(matches, text, replacement, wholeValues)
+            self.statusLabel.setText('Replaced %d cells, ' % changed + self.statusLabel.text())
+
+    def replace(self, matches, text, replacement, wholeValues=True):
+        # A replace across worlds undoes in one step
+        with self.history.macro('Replace %s with %s' % (text, replacement)):
+            changed = self.searchIndex.replace(matches, text, replacement, wholeValues)
+        self.refresh()
+        return changed
+
+    def resultActivated(self, index):
+        match = self.resultModel.matches[index.row()]
+        self.matchActivated.emit(match.name, match.row, match.column)
+
+
+class SearchResultModel(QtCore.QAbstractTableModel):
+    headers = ['File', 'Row', 'Column', 'Value']
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+
+        self.matches = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.matches)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        match = self.matches[index.row()]
+        kind = RouteInfoDocument.memberKind(match.name)
+        col = index.column()
+
+        if col == 0:
+            return match.name
+        elif col == 1:
+            return match.row
+        elif col == 2:
+            return COLUMN_HEADERS[kind][match.column]
+
+        # Actions and sounds are shown the same way as in the path table
+        if kind == RouteInfoDocument.ROUTE and match.column in SearchIndex.TRANSLATED_COLUMNS:
+            return SearchIndex.TRANSLATED_COLUMNS[match.column]().jpToEng.get(match.value, match.value)
+
+        return match.value
+
+    def setMatches(self, matches):
+        self.beginResetModel()
+        self.matches = matches
+        self.endResetModel()
@@ -0,0 +1,78 @@
+import os
+
+# Resolved next to this module so the tables also load outside the editor's folder
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RouteEditData')
+
+SOUND_EFFECTS_PATH = os.path.join(DATA_PATH, 'SoundEffects.txt')
+ACTIONS_PATH = os.path.join(DATA_PATH, 'Actions.txt')
+
+
+class TranslationTable:
+    def __init__(self, path):
+        self.path = path
+
+        self.jpNames = []
+        self.engNames = []
+
+        with open(self.path, 'rt', encoding='utf-8-sig') as f:
+            for line in f:
+                (jp, eng) = line.split(':')
+                eng = str(eng).strip('\n')
+                self.jpNames.append(jp)
+                self.engNames.append(eng)
+
+        self.jpToEng = dict(zip(self.jpNames, self.engNames))
+        self.engToJp = dict(zip(self.engNames, self.jpNames))
+        self.jpToIndex = {jp: i for i, jp in reversed(list(enumerate(self.jpNames)))}
+        self.engToIndex = {eng: i for i, eng in reversed(list(enumerate(self.engNames)))}
+
+    def indexOfJp(self, data):
+        data = str(data)
+
+        index = self.jpToIndex.get(data)
+        if index is not None:
+            return index
+
+        # Fall back to a prefix match for values with trailing characters
+        for i, jp in enumerate(self.jpNames):
+            if data.startswith(jp):
+                return i
+
+        return -1
+
+    def jpAt(self, index):
+        if 0 <= index < len(self.jpNames):
+            return self.jpNames[index]
+
+        return None
+
+    def engAt(self, index):
+        if 0 <= index < len(self.engNames):
+            return self.engNames[index]
+
+        return None
+
+    def __len__(self):
+        return len(self.jpNames)
+
+
+# Tables are loaded once per process and shared by every editor, they never change since route models keep indices into them
+_tables = {}
+
+
+def getTable(path):
+    table = _tables.get(path)
+
+    if table is None:
+        table = TranslationTable(path)
+        _tables[path] = table
+
+    return table
+
+
+def soundEffects():
+    return getTable(SOUND_EFFECTS_PATH)
+
+
+def actions():
+    return getTable(ACTIONS_PATH)
@@ -0,0 +1,328 @@
+import contextlib
+import RouteInfoDocument
+import time
+import zlib
+from PyQt5 import QtWidgets
+
+# Memory the history of one archive may take, the oldest commands are dropped beyond it
+DEFAULT_BUDGET = 16 * 1024 * 1024
+
+# Measured size of a cell command with short values, added to the values each command holds
+COMMAND_SIZE = 1024
+
+# Dropping commands rebuilds the stack, so it makes room for more than the next command
+TRIM_RATIO = 0.75
+
+# Edits of the same cell closer together than this undo in one step, e.g. typing a node name
+MERGE_INTERVAL = 1.0
+
+CELL_COMMAND_ID = 1
+
+# Rows are stored as compressed text with control characters between fields and rows, this round trips any value
+FIELD_SEPARATOR = '\x1f'
+ROW_SEPARATOR = '\x1e'
+
+
+def packRecords(records):
+    records = list(records)
+    text = ROW_SEPARATOR.join(FIELD_SEPARATOR.join(record) if isinstance(record, tuple) else record for record in records)
+    return len(records), zlib.compress(text.encode('utf-8'))
+
+
+def unpackRecords(kind, packed):
+    count, data = packed
+    if not count:
+        return []
+
+    rows = zlib.decompress(data).decode('utf-8').split(ROW_SEPARATOR)
+
+    if kind == RouteInfoDocument.POINT:
+        return [RouteInfoDocument.makeRecord(RouteInfoDocument.PointRecord, row.split(FIELD_SEPARATOR)) for row in rows]
+    elif kind == RouteInfoDocument.ROUTE:
+        return [RouteInfoDocument.makeRecord(RouteInfoDocument.RouteRecord, row.split(FIELD_SEPARATOR)) for row in rows]
+
+    return rows
+
+
+def commandSize(command):
+    # Macros are plain commands holding the commands of their edits
+    size = command.size() if isinstance(command, DocumentCommand) else COMMAND_SIZE
+    return size + sum(commandSize(command.child(index)) for index in range(command.childCount()))
+
+
+def copyCommand(command, parent=None):
+    # Commands only hold python values, a copy is pushed in place of one the stack deleted
+    copy = command.__class__.__new__(command.__class__)
+    QtWidgets.QUndoCommand.__init__(copy, command.text(), parent)
+    copy.__dict__.update(command.__dict__)
+
+    for index in range(command.childCount()):
+        copyCommand(command.child(index), copy)
+
+    return copy
+
+
+class DocumentCommand(QtWidgets.QUndoCommand):
+    def __init__(self, history, name, text):
+        QtWidgets.QUndoCommand.__init__(self, text)
+
+        self.history = history
+        self.name = name
+
+        # Commands are pushed after their edit happened, the first redo has nothing to do
+        self.pending = True
+
+    def redo(self):
+        if self.pending or self.history.rebuilding:
+            self.pending = False
+            return
+
+        with self.history.replaying():
+            self.apply(False)
+
+    def undo(self):
+        if self.history.rebuilding:
+            return
+
+        with self.history.replaying():
+            self.apply(True)
+
+    def apply(self, undo):
+        raise NotImplementedError
+
+    def size(self):
+        return COMMAND_SIZE
+
+
+class CellCommand(DocumentCommand):
+    def __init__(self, history, change):
+        DocumentCommand.__init__(self, history, change.name, 'Edit %s' % change.name)
+
+        self.row = change.row
+        self.column = change.column
+        self.old = change.old
+        self.new = change.new
+        self.time = time.monotonic()
+
+    def id(self):
+        return CELL_COMMAND_ID
+
+    def mergeWith(self, other):
+        if self.history.rebuilding:
+            return False
+        if (other.name, other.row, other.column) != (self.name, self.row, self.column):
+            return False
+        if other.time - self.time > MERGE_INTERVAL:
+            return False
+
+        self.new = other.new
+        self.time = other.time
+
+        # Typing a value and deleting it again leaves nothing to undo
+        if self.new == self.old:
+            self.setObsolete(True)
+
+        return True
+
+    def apply(self, undo):
+        self.history.document.setCell(self.name, self.row, self.column, self.old if undo else self.new)
+
+    def size(self):
+        return COMMAND_SIZE + len(self.old) + len(self.new)
+
+
+class RowsCommand(DocumentCommand):
+    def __init__(self, history, change):
+        inserted = change.type == RouteInfoDocument.ROWS_INSERTED
+        records = change.new if inserted else change.old
+
+        DocumentCommand.__init__(self, history, change.name, '%s %d rows in %s' % (
+            'Insert' if inserted else 'Remove', len(records), change.name))
+
+        self.inserted = inserted
+        self.row = change.row
+        self.records = packRecords(records)
+
+    def apply(self, undo):
+        if self.inserted != undo:
+            kind = RouteInfoDocument.memberKind(self.name)
+            self.history.document.insertRecords(self.name, self.row, unpackRecords(kind, self.records))
+        else:
+            self.history.document.removeRecords(self.name, self.row, self.records[0])
+
+    def size(self):
+        return COMMAND_SIZE + len(self.records[1])
+
+
+class ResetCommand(DocumentCommand):
+    def __init__(self, history, change):
+        DocumentCommand.__init__(self, history, change.name, 'Replace %s' % change.name)
+
+        self.old = packRecords(change.old)
+        self.new = packRecords(change.new)
+
+    def apply(self, undo):
+        kind = RouteInfoDocument.memberKind(self.name)
+        self.history.document.setRecords(self.name, unpackRecords(kind, self.old if undo else self.new))
+
+    def size(self):
+        return COMMAND_SIZE + len(self.old[1]) + len(self.new[1])
+
+
+class DataCommand(DocumentCommand):
+    def __init__(self, history, change):
+        DocumentCommand.__init__(self, history, change.name, 'Import %s' % change.name)
+
+        # Imported data stay unparsed until the member is shown, so the bytes are kept instead of records
+        self.old = zlib.compress(change.old)
+        self.new = zlib.compress(change.new)
+
+    def apply(self, undo):
+        self.history.document.setData(self.name, zlib.decompress(self.old if undo else self.new))
+
+    def size(self):
+        return COMMAND_SIZE + len(self.old) + len(self.new)
+
+
+class MemberCommand(DocumentCommand):
+    def __init__(self, history, change):
+        added = change.type == RouteInfoDocument.MEMBER_ADDED
+        data, hasFilename = change.new if added else change.old
+
+        DocumentCommand.__init__(self, history, change.name, '%s %s' % ('Add' if added else 'Remove', change.name))
+
+        self.added = added
+        self.data = zlib.compress(data)
+        self.hasFilename = hasFilename
+
+    def apply(self, undo):
+        if self.added != undo:
+            self.history.document.addMember(self.name, zlib.decompress(self.data), self.hasFilename)
+        else:
+            self.history.document.removeMember(self.name)
+
+    def size(self):
+        return COMMAND_SIZE + len(self.data)
+
+
+class EditHistory:
+    def __init__(self, document, budget=DEFAULT_BUDGET):
+        self.document = document
+        self.budget = budget
+
+        # Commands only hold the changed values, so the budget covers a long session
+        self.stack = QtWidgets.QUndoStack()
+
+        # Sizes of the commands on the stack and their sum, kept up to date as commands are pushed
+        self.sizes = []
+        self.size = 0
+
+        # Set while a command applies its edit, so the edit isn't recorded again
+        self.replayDepth = 0
+
+        # Commands pushed inside macros are measured once the outermost one ends
+        self.macroDepth = 0
+
+        # Set while the stack is pushed again without the oldest commands, nothing is applied then
+        self.rebuilding = False
+
+        document.listeners.append(self.documentChanged)
+
+    def close(self):
+        if self.documentChanged in self.document.listeners:
+            self.document.listeners.remove(self.documentChanged)
+
+        self.stack.clear()
+        self.sizes = []
+        self.size = 0
+
+    @contextlib.contextmanager
+    def replaying(self):
+        self.replayDepth += 1
+        try:
+            yield
+        finally:
+            self.replayDepth -= 1
+
+    @contextlib.contextmanager
+    def macro(self, text):
+        # Edits made inside undo in one step
+        self.stack.beginMacro(text)
+        self.macroDepth += 1
+        try:
+            yield
+        finally:
+            self.macroDepth -= 1
+            self.stack.endMacro()
+
+            if not self.macroDepth:
+                self.commandPushed()
+
+    def commandPushed(self):
+        # Pushing after an undo deleted the undone commands, and a merged or emptied top command is measured again
+        count = self.stack.count()
+        kept = max(count - 1, 0)
+
+        self.size -= sum(self.sizes[kept:])
+        del self.sizes[kept:]
+
+        if count:
+            self.sizes.append(commandSize(self.stack.command(count - 1)))
+            self.size += self.sizes[-1]
+
+        if self.size > self.budget:
+            self.trim()
+
+    def trim(self):
+        # Only commands that weren't undone can go, the others still lead back to the document's state, and the latest
+        # one always stays, so an edit bigger than the budget still undoes
+        dropped = 0
+        size = self.size
+        while dropped < self.stack.index() - 1 and size > self.budget * TRIM_RATIO:
+            size -= self.sizes[dropped]
+            dropped += 1
+
+        if not dropped:
+            return
+
+        # The stack only deletes its oldest commands for an undo limit, which can't change once it holds commands,
+        # so it is pushed again with copies of the rest
+        index = self.stack.index() - dropped
+        commands = [copyCommand(self.stack.command(position)) for position in range(dropped, self.stack.count())]
+
+        self.rebuilding = True
+        try:
+            self.stack.clear()
+            for command in commands:
+                self.stack.push(command)
+            self.stack.setIndex(index)
+        finally:
+            self.rebuilding = False
+
+        del self.sizes[:dropped]
+        self.size = size
+
+    def documentChanged(self, change):
+        if self.replayDepth:
+            return
+
+        if change.type == RouteInfoDocument.CELL_CHANGED:
+            command = CellCommand(self, change)
+
+        elif change.type == RouteInfoDocument.ROWS_INSERTED or change.type == RouteInfoDocument.ROWS_REMOVED:
+            command = RowsCommand(self, change)
+
+        elif change.type == RouteInfoDocument.MEMBER_RESET:
+            command = ResetCommand(self, change)
+
+        elif change.type == RouteInfoDocument.DATA_RESET:
+            command = DataCommand(self, change)
+
+        else:
+            # Added and removed members
+            command = MemberCommand(self, change)
+
+        self.stack.push(command)
+
+        if not self.macroDepth:
+            self.commandPushed()
@@ -0,0 +1,147 @@
+import collections
+import RouteGraph
+import RouteInfoDocument
+import Translations
+
+# column is the index of the offending cell in its row
+Problem = collections.namedtuple('Problem', ['column', 'message'])
+
+POINT_COLUMNS = RouteInfoDocument.PointRecord._fields
+
+
+def checkPoint(graph, row):
+    point = graph.points[row]
+    problems = []
+
+    if not point.id:
+        problems.append(Problem(0, 'Missing ID'))
+    elif len(graph.nodeIds.get(point.id, ())) > 1:
+        problems.append(Problem(0, 'ID %s is used by more than one node' % point.id))
+
+    for column, token in graph.unresolved[row]:
+        kind = 'node' if column in RouteGraph.NODE_COLUMNS else 'path'
+        problems.append(Problem(POINT_COLUMNS.index(column), 'Unknown %s %s' % (kind, token)))
+
+    return tuple(problems)
+
+
+def checkRoute(graph, row):
+    route = graph.routes[row]
+    problems = []
+
+    if graph.endpoints[row] is None:
+        problems.append(Problem(0, 'Path %s does not connect two nodes of this world' % route.path))
+
+    if Translations.actions().indexOfJp(route.action) == -1:
+        problems.append(Problem(1, 'Unknown action %s' % route.action))
+    if Translations.soundEffects().indexOfJp(route.sound) == -1:
+        problems.append(Problem(2, 'Unknown sound %s' % route.sound))
+
+    return tuple(problems)
+
+
+def checkBossPathNode(graph, node):
+    if graph.resolveNode(node) is None:
+        return (Problem(0, 'Unknown node %s' % node),)
+
+    return ()
+
+
+class Validator:
+    def __init__(self, document, graphIndex):
+        self.document = document
+        self.graphIndex = graphIndex
+
+        # Results are computed per row on first request and kept until an edit affects the row
+        self.results = collections.defaultdict(dict)
+
+        # Called with a member name and the rows whose results changed, or None for every row
+        self.listeners = []
+
+        graphIndex.listeners.append(self.graphChanged)
+        document.listeners.append(self.documentChanged)
+
+    def close(self):
+        if self.graphChanged in self.graphIndex.listeners:
+            self.graphIndex.listeners.remove(self.graphChanged)
+        if self.documentChanged in self.document.listeners:
+            self.document.listeners.remove(self.documentChanged)
+
+        self.results.clear()
+        self.listeners = []
+
+    def isReady(self, name):
+        # Building a world's graph takes a while, views only ask for results once it exists
+        return RouteInfoDocument.worldName(name) in self.graphIndex.graphs
+
+    def prepare(self, name):
+        self.graphIndex.graph(RouteInfoDocument.worldName(name))
+
+    def rowProblems(self, name, row):
+        results = self.results[name]
+        problems = results.get(row)
+
+        if problems is None:
+            problems = self.check(name, row)
+            results[row] = problems
+
+        return problems
+
+    def problems(self, name):
+        # Every problem of a member as (row, Problem) pairs
+        return [(row, problem) for row in range(len(self.document.records(name)))
+                for problem in self.rowProblems(name, row)]
+
+    def check(self, name, row):
+        kind = self.document.kind(name)
+        graph = self.graphIndex.graph(RouteInfoDocument.worldName(name))
+
+        if kind == RouteInfoDocument.POINT:
+            return checkPoint(graph, row)
+        elif kind == RouteInfoDocument.ROUTE:
+            return checkRoute(graph, row)
+        elif kind == RouteInfoDocument.WORLD_IN or kind == RouteInfoDocument.TO_CASTLE:
+            return checkBossPathNode(graph, self.document.records(name)[row])
+
+        return ()
+
+    def invalidate(self, name, rows=None):
+        if name not in self.results:
+            return
+
+        if rows is None:
+            del self.results[name]
+        else:
+            results = self.results[name]
+            for row in rows:
+                results.pop(row, None)
+
+        for listener in list(self.listeners):
+            listener(name, rows)
+
+    def graphChanged(self, world, update):
+        pointName = RouteInfoDocument.POINT + world
+        routeName = RouteInfoDocument.ROUTE + world
+
+        if update is None:
+            self.invalidate(pointName)
+            self.invalidate(routeName)
+        else:
+            self.invalidate(pointName, update.pointRows)
+            self.invalidate(routeName, update.routeRows)
+
+        # Boss paths refer to nodes by id or name, they are short enough to re-check completely
+        if update is None or update.tokens:
+            for kind in (RouteInfoDocument.WORLD_IN, RouteInfoDocument.TO_CASTLE):
+                self.invalidate(kind + world)
+
+    def documentChanged(self, change):
+        kind = RouteInfoDocument.memberKind(change.name)
+
+        if kind != RouteInfoDocument.WORLD_IN and kind != RouteInfoDocument.TO_CASTLE:
+            return
+
+        if change.type == RouteInfoDocument.CELL_CHANGED:
+            self.invalidate(change.name, (change.row,))
+        else:
+            self.invalidate(change.name)
@@ -0,0 +1,130 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Benchmarks'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import ArchiveDiff
+import RouteInfoDocument
+import SyntheticArchive
+import UndoHistory
+
+ROUTE = 'route01.csv'
+BOSS_PATH = 'worldIn01.csv'
+
+
+def route(path, action='0', sound='0'):
+    return RouteInfoDocument.RouteRecord(path, action, sound)
+
+
+class HunkOverlapsTest(unittest.TestCase):
+    def test_insertions_at_the_same_row(self):
+        self.assertTrue(ArchiveDiff.hunkOverlaps(2, 2, 2, 2))
+        self.assertFalse(ArchiveDiff.hunkOverlaps(2, 2, 3, 3))
+
+    def test_insertion_next_to_a_change(self):
+        self.assertFalse(ArchiveDiff.hunkOverlaps(1, 1, 1, 2))
+        self.assertFalse(ArchiveDiff.hunkOverlaps(1, 2, 2, 2))
+
+    def test_insertion_inside_a_change(self):
+        self.assertTrue(ArchiveDiff.hunkOverlaps(1, 3, 2, 2))
+        self.assertTrue(ArchiveDiff.hunkOverlaps(2, 2, 1, 3))
+
+    def test_changes(self):
+        self.assertTrue(ArchiveDiff.hunkOverlaps(1, 3, 2, 4))
+        self.assertFalse(ArchiveDiff.hunkOverlaps(1, 2, 2, 3))
+
+
+class MergeRecordsTest(unittest.TestCase):
+    def test_insert_against_insert(self):
+        base = ['a', 'b']
+
+        merged, conflicts = ArchiveDiff.mergeRecords(BOSS_PATH, base, ['a', 'x', 'b'], ['a', 'x', 'b'])
+        self.assertEqual(merged, ['a', 'x', 'b'])
+        self.assertEqual(conflicts, [])
+
+        merged, conflicts = ArchiveDiff.mergeRecords(BOSS_PATH, base, ['a', 'x', 'b'], ['a', 'y', 'b'])
+        self.assertEqual(merged, ['a', 'x', 'b'])
+        self.assertEqual(conflicts, [ArchiveDiff.Conflict(BOSS_PATH, 1, None, ['x'], ['y'])])
+
+        merged, conflicts = ArchiveDiff.mergeRecords(BOSS_PATH, base, ['x', 'a', 'b'], ['a', 'b', 'y'])
+        self.assertEqual(merged, ['x', 'a', 'b', 'y'])
+        self.assertEqual(conflicts, [])
+
+    def test_insert_next_to_replace(self):
+        base = ['a', 'b', 'c']
+
+        merged, conflicts = ArchiveDiff.mergeRecords(BOSS_PATH, base, ['a', 'x', 'b', 'c'], ['a', 'B', 'c'])
+        self.assertEqual(merged, ['a', 'x', 'B', 'c'])
+        self.assertEqual(conflicts, [])
+
+        merged, conflicts = ArchiveDiff.mergeRecords(BOSS_PATH, base, ['a', 'b', 'x', 'c'], ['a', 'B', 'c'])
+        self.assertEqual(merged, ['a', 'B', 'x', 'c'])
+        self.assertEqual(conflicts, [])
+
+    def test_different_columns_of_a_row(self):
+        base = [route('A'), route('B')]
+        ours = [route('A'), route('B', action='1')]
+        theirs = [route('A'), route('B', sound='2')]
+
+        merged, conflicts = ArchiveDiff.mergeRecords(ROUTE, base, ours, theirs)
+        self.assertEqual(merged, [route('A'), route('B', '1', '2')])
+        self.assertEqual(conflicts, [])
+
+    def test_same_column_of_a_row(self):
+        base = [route('A')]
+
+        merged, conflicts = ArchiveDiff.mergeRecords(ROUTE, base, [route('A', action='1')], [route('A', action='2')])
+        self.assertEqual(merged, [route('A', action='1')])
+        self.assertEqual(conflicts, [ArchiveDiff.Conflict(ROUTE, 0, 1, '1', '2')])
+
+
+class ApplyMergeTest(unittest.TestCase):
+    def setUp(self):
+        files = SyntheticArchive.makeFiles(worlds=2, nodes=10, paths=10, bossPathLength=5)
+        self.base = RouteInfoDocument.RouteInfoDocument(files)
+        self.ours = RouteInfoDocument.RouteInfoDocument(files)
+        self.theirs = RouteInfoDocument.RouteInfoDocument(files)
+        self.history = UndoHistory.EditHistory(self.ours)
+
+    def tearDown(self):
+        self.history.close()
+
+    def snapshot(self):
+        return {name: bytes(self.ours.data(name)) for name in self.ours.names()}
+
+    def test_merge_undoes_in_one_step(self):
+        self.ours.setCell('point01.csv', 0, 1, 'Ours')
+        beforeMerge = self.snapshot()
+
+        self.theirs.setCell('point01.csv', 1, 1, 'Theirs')
+        self.theirs.setData('route02.csv', b'W2-0W2-1,0,0')
+        self.theirs.removeMember('toCastle02.csv')
+        self.theirs.addMember('extra.bin', b'extra', False)
+
+        with self.history.macro('Merge'):
+            ArchiveDiff.applyMerge(self.ours, ArchiveDiff.mergeDocuments(self.base, self.ours, self.theirs))
+
+        merged = self.snapshot()
+        self.assertEqual(merged['route02.csv'], b'W2-0W2-1,0,0')
+        self.assertEqual(self.ours.records('point01.csv')[1].nodeName, 'Theirs')
+        self.assertNotIn('toCastle02.csv', merged)
+        self.assertIn('extra.bin', merged)
+        self.assertEqual(self.history.stack.count(), 2)
+
+        self.history.stack.undo()
+        self.assertEqual(self.snapshot(), beforeMerge)
+
+        self.history.stack.undo()
+        self.assertEqual(self.ours.records('point01.csv')[0].nodeName, self.base.records('point01.csv')[0].nodeName)
+
+        self.history.stack.redo()
+        self.history.stack.redo()
+        self.assertEqual(self.snapshot(), merged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Benchmarks'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import EditJournal
+import RouteInfoDocument
+import SyntheticArchive
+import UndoHistory
+
+ARCHIVE_HASH = bytes(range(20))
+
+
+def contents(document):
+    # Parsed members are compared by their records, so formatting doesn't matter
+    return {name: (document.records(name) if document.kind(name) is not None else bytes(document.data(name)),
+                   document.members[name].hasFilename) for name in document.names()}
+
+
+class JournalRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = SyntheticArchive.makeFiles(worlds=2, nodes=10, paths=10, bossPathLength=5)
+        self.document = RouteInfoDocument.RouteInfoDocument(self.files)
+
+        self.archivePath = os.path.join(self.directory.name, 'RouteInfo.sarc')
+        self.path = EditJournal.journalPath(self.archivePath, self.directory.name)
+        self.journal = EditJournal.EditJournal(self.path, self.archivePath, ARCHIVE_HASH)
+        self.journal.attach(self.document)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_after_compaction(self):
+        document = self.document
+        document.setCell('point01.csv', 0, 1, 'BeforeCompaction')
+        document.insertRecords('route01.csv', 1, [RouteInfoDocument.RouteRecord('W1-0W1-9', '0', '0')])
+        document.setData('route02.csv', b'W2-0W2-1,0,0')
+        self.journal.compact()
+
+        document.setCell('point01.csv', 1, 1, 'AfterCompaction')
+        document.removeRecords('point02.csv', 2, 3)
+        document.setRecords('worldIn01.csv', ['1', '2', '3'])
+        document.setData('route01.csv', b'W1-1W1-2,0,0')
+        document.addMember('extra.bin', b'extra', False)
+        document.removeMember('toCastle02.csv')
+        expected = contents(document)
+        self.journal.close(keep=True)
+
+        archivePath, archiveHash, entries = EditJournal.readJournal(self.path)
+        self.assertEqual(archivePath, self.archivePath)
+        self.assertEqual(archiveHash, ARCHIVE_HASH)
+        self.assertTrue(EditJournal.hasChanges(entries))
+
+        # Recovery replays into the saved archive and undoes in one step
+        recovered = RouteInfoDocument.RouteInfoDocument(self.files)
+        saved = contents(recovered)
+        history = UndoHistory.EditHistory(recovered)
+
+        with history.macro('Recover unsaved changes'):
+            EditJournal.replay(recovered, entries)
+
+        self.assertEqual(contents(recovered), expected)
+        self.assertEqual(history.stack.count(), 1)
+
+        history.stack.undo()
+        self.assertEqual(contents(recovered), saved)
+
+        history.stack.redo()
+        self.assertEqual(contents(recovered), expected)
+        history.close()
+
+    def test_close_discards_the_journal(self):
+        self.document.setCell('point01.csv', 0, 1, 'Edit')
+        self.journal.close()
+
+        self.assertIsNone(EditJournal.readJournal(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ArchiveIO
+import RouteEditCli
+import SarcLib
+
+
+class ExtractArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.outDir = os.path.join(self.directory.name, 'out')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_names_leaving_the_target_folder_are_skipped(self):
+        archivePath = os.path.join(self.directory.name, 'crafted.sarc')
+        ArchiveIO.saveArchive(archivePath, [
+            SarcLib.File('point01.csv', b'0,W1-0,0,,,0,,,'),
+            SarcLib.File('sub/extra.bin', b'extra'),
+            SarcLib.File('../../escaped.txt', b'escaped'),
+            SarcLib.File('sub/../../escaped.txt', b'escaped'),
+            SarcLib.File('/tmp/absolute.txt', b'escaped'),
+            SarcLib.File('C:escaped.txt', b'escaped'),
+        ])
+
+        path, seconds, messages, failed = RouteEditCli.runJob((RouteEditCli.extractArchive, archivePath, self.outDir))
+        targetDir = os.path.join(self.outDir, 'crafted')
+
+        self.assertTrue(failed)
+        self.assertEqual(sum(message.startswith(RouteEditCli.SKIPPED_PREFIX) for message in messages), 4)
+        self.assertTrue(os.path.isfile(os.path.join(targetDir, 'point01.csv')))
+        self.assertTrue(os.path.isfile(os.path.join(targetDir, 'sub', 'extra.bin')))
+
+        written = [os.path.join(folder, name) for folder, folders, names in os.walk(self.directory.name) for name in names]
+        self.assertEqual(sorted(written), sorted([archivePath, os.path.join(targetDir, 'point01.csv'),
+                                                  os.path.join(targetDir, 'sub', 'extra.bin')]))
+        self.assertFalse(os.path.exists('/tmp/absolute.txt'))
+
+    def test_member_path(self):
+        self.assertIsNone(RouteEditCli.memberPath(self.outDir, '..'))
+        self.assertIsNone(RouteEditCli.memberPath(self.outDir, '../out2/file'))
+        self.assertEqual(RouteEditCli.memberPath(self.outDir, 'a/../b.csv'), os.path.join(os.path.realpath(self.outDir), 'b.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Benchmarks'))
+
+import RouteInfoDocument
+import SearchIndex
+import SyntheticArchive
+
+POINT = 'point01.csv'
+
+
+class BuildTest(unittest.TestCase):
+    def setUp(self):
+        self.files = SyntheticArchive.makeFiles(worlds=2, nodes=10, paths=10, bossPathLength=5)
+        self.document = RouteInfoDocument.RouteInfoDocument(self.files)
+        self.searchIndex = SearchIndex.SearchIndex(self.document)
+
+    def tearDown(self):
+        self.searchIndex.close()
+
+    def expected(self):
+        # The index a build on the calling thread makes of the same document
+        searchIndex = SearchIndex.SearchIndex(self.document)
+        searchIndex.refresh()
+        members = searchIndex.members
+        searchIndex.close()
+        return members
+
+    def test_edits_during_the_build_are_indexed(self):
+        names, jobs = self.searchIndex.buildJobs()
+
+        self.document.setCell(POINT, 0, 1, 'EditedWhileBuilding')
+        self.document.removeMember('route02.csv')
+        self.document.addMember('point03.csv', bytes(self.document.data(POINT)))
+
+        self.searchIndex.finishBuild(names, SearchIndex.indexJobs(jobs, 1))
+        self.assertEqual([match[:3] for match in self.searchIndex.find('EditedWhileBuilding')], [(POINT, 0, 1), ('point03.csv', 0, 1)])
+        self.assertEqual(self.searchIndex.members, self.expected())
+
+    def test_worker_processes(self):
+        names, jobs = self.searchIndex.buildJobs()
+        progress = []
+
+        self.searchIndex.finishBuild(names, SearchIndex.indexJobs(jobs, 2, lambda done, total: progress.append(done)))
+        self.searchIndex.refresh()
+
+        self.assertEqual(progress, list(range(1, len(jobs) + 1)))
+        self.assertEqual(self.searchIndex.members, self.expected())
+
+    def test_search_before_the_build_finished(self):
+        names, jobs = self.searchIndex.buildJobs()
+        self.searchIndex.refresh()
+        self.document.setCell(POINT, 0, 1, 'EditedAfterSearch')
+
+        # The finished build is older than the index the search built
+        self.searchIndex.finishBuild(names, SearchIndex.indexJobs(jobs, 1))
+        self.assertEqual(len(self.searchIndex.find('EditedAfterSearch')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Benchmarks'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import RouteInfoDocument
+import SyntheticArchive
+import UndoHistory
+
+POINT = 'point01.csv'
+
+
+class BudgetTest(unittest.TestCase):
+    def setUp(self):
+        files = SyntheticArchive.makeFiles(worlds=1, nodes=20, paths=10, bossPathLength=5)
+        self.document = RouteInfoDocument.RouteInfoDocument(files)
+        self.history = UndoHistory.EditHistory(self.document, budget=5 * 1024)
+
+    def tearDown(self):
+        self.history.close()
+
+    def nodeNames(self):
+        return [record.nodeName for record in self.document.records(POINT)]
+
+    def test_oversized_macro_still_undoes(self):
+        saved = self.nodeNames()
+
+        with self.history.macro('Replace'):
+            for row in range(10):
+                self.document.setCell(POINT, row, 1, 'Replaced%d' % row)
+
+        self.assertGreater(self.history.size, self.history.budget)
+        self.assertEqual(self.history.stack.count(), 1)
+
+        self.history.stack.undo()
+        self.assertEqual(self.nodeNames(), saved)
+
+    def test_oldest_commands_are_dropped(self):
+        saved = self.nodeNames()
+        for row in range(10):
+            self.document.setCell(POINT, row, 1, 'Edited%d' % row)
+
+        edited = self.nodeNames()
+        kept = self.history.stack.count()
+        self.assertLess(kept, 10)
+        self.assertLessEqual(self.history.size, self.history.budget)
+        self.assertEqual(self.history.size, sum(UndoHistory.commandSize(self.history.stack.command(index))
+                                                for index in range(kept)))
+
+        # The dropped edits stay, the kept ones undo
+        while self.history.stack.canUndo():
+            self.history.stack.undo()
+        self.assertEqual(self.nodeNames(), edited[:10 - kept] + saved[10 - kept:])
+
+        while self.history.stack.canRedo():
+            self.history.stack.redo()
+        self.assertEqual(self.nodeNames(), edited)
+
+
+if __name__ == '__main__':
+    unittest.main()